@@ -0,0 +1,106 @@
+"""
+Compares the work of the editor's syntax colorer after a keystroke with the former approach,
+where each keystroke affecting triple-quotes caused a regex scan over the whole text.
+
+Simulates opening and closing a triple-quoted string in the middle of large real-world modules
+and typing inside it. Measures the time from the edit until the tag ranges of the visible
+lines are known. Tk's tagging is not included.
+Run from the repository root: python misc/benchmarks/coloring.py
+"""
+import _pydecimal
+import argparse
+import inspect
+import os.path
+import statistics
+import sys
+import time
+import tkinter
+import types
+import typing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from thonny.plugins.coloring import (
+    CodeViewSyntaxColorer,
+    LineStates,
+    SyntaxColorer,
+    _get_code_segments,
+    lex_line,
+)
+
+MODULES = [_pydecimal, argparse, inspect, tkinter, typing]
+VIEWPORT_HEIGHT = 40
+
+# chars typed at the start of the middle line
+KEYSTROKES = ['"', '"', '"', "x", "y", '"', '"', '"']
+
+
+def create_regexes():
+    regexes = types.SimpleNamespace(_raise_tags=lambda: None)
+    SyntaxColorer._compile_regexes(regexes)
+    SyntaxColorer._config_tags(regexes)
+    return regexes
+
+
+def update_old(regexes, lines, lineno):
+    source = "\n".join(lines)
+    first = max(lineno - VIEWPORT_HEIGHT // 2, 1)
+    visible = "\n".join(lines[first - 1 : first - 1 + VIEWPORT_HEIGHT])
+    result = [match.span() for match in regexes.uniline_regex.finditer(visible)]
+    result += [match.span() for match in regexes.multiline_regex.finditer(source)]
+    return result
+
+
+def update_new(regexes, line_states, lines, lineno):
+    line_states.adjust_line_count(lineno, len(lines))
+    line_states.relex(lines)
+    first = max(lineno - VIEWPORT_HEIGHT // 2, 1)
+    ranges_by_tag = {tag: [] for tag in regexes.uniline_tags}
+    for i in range(first, min(first + VIEWPORT_HEIGHT, len(lines) + 1)):
+        line = lines[i - 1]
+        spans, _ = lex_line(line, line_states.get_state(i))
+        for start, end in _get_code_segments(line, spans):
+            CodeViewSyntaxColorer._find_uniline_tokens(regexes, line, i, start, end, ranges_by_tag)
+    return ranges_by_tag
+
+
+def measure(module, regexes):
+    with open(module.__file__, encoding="utf-8") as fp:
+        lines = fp.read().split("\n")
+
+    line_states = LineStates()
+    line_states.reset(len(lines))
+    line_states.relex(lines)
+
+    lineno = len(lines) // 2
+    old_times = []
+    new_times = []
+    for chars in KEYSTROKES:
+        lines[lineno - 1] = chars + lines[lineno - 1]
+
+        start = time.perf_counter()
+        update_old(regexes, lines, lineno)
+        old_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        update_new(regexes, line_states, lines, lineno)
+        new_times.append(time.perf_counter() - start)
+
+    print(
+        "%-14s %7d %9.2f %9.2f %9.2f %9.2f"
+        % (
+            module.__spec__.name,
+            len(lines),
+            statistics.median(old_times) * 1000,
+            max(old_times) * 1000,
+            statistics.median(new_times) * 1000,
+            max(new_times) * 1000,
+        )
+    )
+
+
+if __name__ == "__main__":
+    regexes = create_regexes()
+    print("%-14s %7s %9s %9s %9s %9s" % ("", "lines", "old med", "old max", "new med", "new max"))
+    for module in MODULES:
+        measure(module, regexes)
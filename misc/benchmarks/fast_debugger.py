@@ -0,0 +1,124 @@
+"""
+Measures the slowdown of CPU-bound programs under the fast debugger (command "resume" with a
+breakpoint, which is never reached), for the settrace and sys.monitoring engines of FastTracer.
+
+The breakpoint is placed into the hot function, so that the engines need to watch its lines.
+The frontend is not involved, the tracer talks to a stub backend.
+Run from the repository root: python misc/benchmarks/fast_debugger.py
+"""
+import os.path
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from thonny.common import ToplevelCommand
+from thonny.plugins.cpython_backend.cp_tracers import FastTracer, MonitoringFastTracer
+
+FIB_SOURCE = """
+def fib(n):
+    if n < 0:
+        raise ValueError("breakpoint goes here")
+    if n < 2:
+        return n
+    return fib(n - 1) + fib(n - 2)
+
+fib(25)
+"""
+
+LOOP_SOURCE = """
+def loop(n):
+    total = 0
+    for i in range(n):
+        if i < 0:
+            print("breakpoint goes here")
+        total += i * i % 7
+    return total
+
+loop(1000000)
+"""
+
+SORT_SOURCE = """
+import random
+
+def key(x):
+    if x is None:
+        print("breakpoint goes here")
+    return -x
+
+def work():
+    rnd = random.Random(0)
+    for _ in range(10):
+        data = [rnd.random() for _ in range(20000)]
+        data.sort(key=key)
+
+work()
+"""
+
+WORKLOADS = {"fib(25)": FIB_SOURCE, "loop(10**6)": LOOP_SOURCE, "sort with key": SORT_SOURCE}
+
+
+class StubBackend:
+    def is_doing_io(self):
+        return False
+
+    def send_message(self, msg):
+        raise AssertionError("Breakpoint shouldn't be reached")
+
+    def _install_custom_import(self):
+        pass
+
+    def _prepare_user_exception(self):
+        raise
+
+    def _fetch_next_incoming_message(self):
+        raise AssertionError("Breakpoint shouldn't be reached")
+
+
+def run_plain(code, filename):
+    exec(code, {"__name__": "__main__", "__file__": filename})
+
+
+def run_traced(tracer_class, code, filename, breakpoint_lines):
+    cmd = ToplevelCommand("FastDebug", breakpoints={filename: breakpoint_lines})
+    tracer = tracer_class(StubBackend(), cmd)
+    tracer._main_module_path = filename
+    tracer._execute_prepared_user_code(code, {"__name__": "__main__", "__file__": filename})
+
+
+def measure(fun, *args):
+    best = None
+    for _ in range(3):
+        start_time = time.perf_counter()
+        fun(*args)
+        duration = time.perf_counter() - start_time
+        best = duration if best is None else min(best, duration)
+    return best
+
+
+if __name__ == "__main__":
+    engines = [("settrace", FastTracer)]
+    if hasattr(sys, "monitoring"):
+        engines.append(("sys.monitoring", MonitoringFastTracer))
+    else:
+        print("sys.monitoring is not available in Python %d.%d" % sys.version_info[:2])
+
+    print("%-16s %10s" % ("", "plain (s)") + "".join("%16s" % name for name, _ in engines))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name, source in WORKLOADS.items():
+            filename = os.path.join(temp_dir, "workload.py")
+            with open(filename, "w", encoding="utf-8") as fp:
+                fp.write(source)
+
+            code = compile(source, filename, "exec")
+            breakpoint_lines = {
+                i for i, line in enumerate(source.splitlines(), 1) if "breakpoint" in line
+            }
+
+            plain_time = measure(run_plain, code, filename)
+            row = "%-16s %10.3f" % (name, plain_time)
+            for _, tracer_class in engines:
+                traced_time = measure(run_traced, tracer_class, code, filename, breakpoint_lines)
+                row += "%15.1fx" % (traced_time / plain_time)
+            print(row)
@@ -0,0 +1,100 @@
+"""
+Compares text (ascii + eval) and binary frontend/backend message formats.
+
+Measures bytes on the wire and encode/decode time for a few typical messages.
+Run from the repository root: python misc/benchmarks/message_codec.py
+"""
+import io
+import os.path
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from thonny.common import (
+    BackendEvent,
+    FrameInfo,
+    InlineCommand,
+    TextRange,
+    ToplevelResponse,
+    ValueInfo,
+    parse_message,
+    read_one_incoming_message_bytes,
+    serialize_message,
+    serialize_message_binary,
+)
+
+
+def create_globals(count):
+    return {
+        "variable_%d" % i: ValueInfo(10**9 + i, repr(list(range(i % 30))) + " – ümlaut")
+        for i in range(count)
+    }
+
+
+def create_stack(depth, globals_count):
+    source = "\n".join("x_%d = %d  # õäöü" % (i, i) for i in range(2000))
+    return [
+        FrameInfo(
+            id=10**9 + i,
+            filename="/home/user/project/module_%d.py" % i,
+            module_name="module_%d" % i,
+            code_name="function_%d" % i,
+            source=source,
+            lineno=i + 10,
+            firstlineno=1,
+            in_library=False,
+            locals=create_globals(20),
+            globals=create_globals(globals_count),
+            freevars=(),
+            event="line",
+            focus=TextRange(i + 10, 0, i + 11, 0),
+            node_tags=None,
+            current_statement=None,
+            current_evaluations=None,
+            current_root_expression=None,
+        )
+        for i in range(depth)
+    ]
+
+
+SAMPLES = {
+    "small output": BackendEvent("ProgramOutput", stream_name="stdout", data="Hello!\n"),
+    "big output": BackendEvent("ProgramOutput", stream_name="stdout", data="Tere, õun!\n" * 10000),
+    "globals (5000)": ToplevelResponse(command_name="Run", globals=create_globals(5000)),
+    "stack (10 frames)": ToplevelResponse(
+        command_name="FastDebug", stack=create_stack(10, 500), cwd="/home/user"
+    ),
+    "command": InlineCommand("editor_autocomplete", source="import os\n" * 1000, row=3, column=4),
+}
+
+
+def decode_binary(data):
+    return read_one_incoming_message_bytes(io.BufferedReader(io.BytesIO(data)))[1]
+
+
+def measure(name, msg, repeat):
+    text = serialize_message(msg)
+    binary = serialize_message_binary(msg)
+    assert parse_message(text) == decode_binary(binary) == msg
+
+    results = [
+        name,
+        len(text.encode("utf-8")),
+        len(binary),
+        timeit.timeit(lambda: serialize_message(msg), number=repeat) / repeat * 1000,
+        timeit.timeit(lambda: serialize_message_binary(msg), number=repeat) / repeat * 1000,
+        timeit.timeit(lambda: parse_message(text), number=repeat) / repeat * 1000,
+        timeit.timeit(lambda: decode_binary(binary), number=repeat) / repeat * 1000,
+    ]
+    print("%-18s %10d %10d %9.3f %9.3f %9.3f %9.3f" % tuple(results))
+
+
+if __name__ == "__main__":
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    print(
+        "%-18s %10s %10s %9s %9s %9s %9s"
+        % ("", "text B", "binary B", "enc t ms", "enc b ms", "dec t ms", "dec b ms")
+    )
+    for name, msg in SAMPLES.items():
+        measure(name, msg, repeat)
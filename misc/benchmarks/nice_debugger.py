@@ -0,0 +1,116 @@
+"""
+Measures the slowdown of a program with a hot loop under the nicer debugger (command "resume"
+with a breakpoint, which is never reached), with expressions instrumented everywhere and lazily.
+
+The frontend is not involved, the tracer talks to a stub backend.
+Run from the repository root: python misc/benchmarks/nice_debugger.py
+"""
+import io
+import os.path
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from thonny.common import ToplevelCommand, ValueInfo
+from thonny.plugins.cpython_backend.cp_back import FrameSourceInfo
+from thonny.plugins.cpython_backend.cp_tracers import NiceTracer
+
+LOOP_SOURCE = """
+def loop(n):
+    total = 0
+    for i in range(n):
+        total += i * i % 7
+    return total
+
+if loop(0) < 0:
+    print("breakpoint goes here")
+loop(5000)
+"""
+
+
+class StubStream(io.StringIO):
+    _processed_symbol_count = 0
+
+
+class StubBackend:
+    def __init__(self, source):
+        self._source = source
+
+    def is_doing_io(self):
+        return False
+
+    def send_message(self, msg):
+        raise AssertionError("Breakpoint shouldn't be reached")
+
+    def export_value(self, value, max_repr_length=5000):
+        return ValueInfo(id(value), repr(value)[:max_repr_length])
+
+    def export_variables(self, variables):
+        return {
+            name: self.export_value(value, 100)
+            for name, value in variables.items()
+            if not name.startswith("__")
+        }
+
+    def _get_frame_source_info(self, frame):
+        return FrameSourceInfo(self._source, 1, False, None, None)
+
+    def _install_custom_import(self):
+        pass
+
+    def _prepare_user_exception(self):
+        raise
+
+    def _fetch_next_incoming_message(self):
+        raise AssertionError("Breakpoint shouldn't be reached")
+
+
+def run_plain(source, filename, fine_grained_stepping):
+    exec(compile(source, filename, "exec"), {"__name__": "__main__", "__file__": filename})
+
+
+def run_traced(source, filename, fine_grained_stepping):
+    breakpoint_lines = {i for i, line in enumerate(source.splitlines(), 1) if "breakpoint" in line}
+    cmd = ToplevelCommand(
+        "Debug",
+        breakpoints={filename: breakpoint_lines},
+        fine_grained_stepping=fine_grained_stepping,
+    )
+    tracer = NiceTracer(StubBackend(source), cmd)
+    tracer._main_module_path = filename
+    code = tracer._compile_user_code(source, filename, [])
+
+    real_streams = sys.stdin, sys.stdout, sys.stderr
+    sys.stdin, sys.stdout, sys.stderr = StubStream(), StubStream(), StubStream()
+    try:
+        tracer._execute_prepared_user_code(code, {"__name__": "__main__", "__file__": filename})
+    finally:
+        sys.stdin, sys.stdout, sys.stderr = real_streams
+
+
+def measure(fun, *args):
+    best = None
+    for _ in range(3):
+        start_time = time.perf_counter()
+        fun(*args)
+        duration = time.perf_counter() - start_time
+        best = duration if best is None else min(best, duration)
+    return best
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as temp_dir:
+        filename = os.path.join(temp_dir, "workload.py")
+        with open(filename, "w", encoding="utf-8") as fp:
+            fp.write(LOOP_SOURCE)
+
+        plain_time = measure(run_plain, LOOP_SOURCE, filename, None)
+        print("%-12s %10.4f s" % ("plain", plain_time))
+        for fine_grained_stepping in ["everywhere", "lazy"]:
+            traced_time = measure(run_traced, LOOP_SOURCE, filename, fine_grained_stepping)
+            print(
+                "%-12s %10.4f s %10.1fx"
+                % (fine_grained_stepping, traced_time, traced_time / plain_time)
+            )
@@ -0,0 +1,81 @@
+"""
+Compares sending every write of the fake output streams as a separate message
+with sending them via OutputBuffer.
+
+Counts messages and measures writes per second for a few typical output patterns.
+Serialized messages are written to a null sink, the frontend is not involved.
+Run from the repository root: python misc/benchmarks/output_batching.py
+"""
+import os.path
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from thonny.common import BackendEvent, serialize_message
+from thonny.plugins.cpython_backend.cp_back import OutputBuffer
+
+
+class MessageCounter:
+    def __init__(self):
+        self.message_count = 0
+        self._sink = open(os.devnull, "w", encoding="utf-8")
+
+    def _send_output(self, data, stream_name):
+        msg = BackendEvent(event_type="ProgramOutput", stream_name=stream_name, data=data)
+        self._sink.write(serialize_message(msg) + "\n")
+        self.message_count += 1
+
+
+def write_chars(write, count):
+    for i in range(count):
+        write(str(i % 10), "stdout")
+
+
+def write_lines(write, count):
+    for i in range(count):
+        write("line %d" % i, "stdout")
+        write("\n", "stdout")
+
+
+def write_mixed(write, count):
+    for i in range(count):
+        write(".", "stdout")
+        if i % 100 == 0:
+            write("warning\n", "stderr")
+
+
+PATTERNS = {
+    'print(x, end="")': write_chars,
+    "print(x)": write_lines,
+    "stdout + stderr": write_mixed,
+}
+
+
+def measure(name, pattern, count):
+    results = [name]
+    for buffered in [False, True]:
+        counter = MessageCounter()
+        if buffered:
+            buffer = OutputBuffer(counter)
+            write = buffer.write
+        else:
+            buffer = None
+            write = counter._send_output
+
+        start_time = time.perf_counter()
+        pattern(write, count)
+        if buffer is not None:
+            buffer.flush()
+        duration = time.perf_counter() - start_time
+
+        results.extend([counter.message_count, count / duration])
+
+    print("%-18s %10d %12.0f %10d %12.0f" % tuple(results))
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print("%-18s %10s %12s %10s %12s" % ("", "msgs", "writes/s", "msgs buf", "writes/s buf"))
+    for name, pattern in PATTERNS.items():
+        measure(name, pattern, count)
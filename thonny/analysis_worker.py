@@ -0,0 +1,145 @@
+"""
+Answers editor's analysis commands (completions, calltips, occurrences, definitions) in a
+process separate from the back-end, so that the answers don't need to wait until the user
+program completes.
+
+The front-end (see AnalysisWorkerPool in running.py) runs this module as a script with its own
+interpreter and gives the back-end's sys.path as the command line argument. The code gets
+analyzed with this sys.path, ie. the libraries of the back-end's interpreter are used.
+
+If the path of a completion index is also given, then the worker keeps it up to date
+(see completion_index.py) when it has nothing else to do.
+"""
+import ast
+import os.path
+import sys
+import time
+from logging import getLogger
+from typing import Dict, Iterator, List, Optional
+
+if __name__ == "__main__":
+    # make sure thonny folder is in sys.path
+    _thonny_container = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if _thonny_container not in sys.path:
+        sys.path.insert(0, _thonny_container)
+
+from thonny.backend import MainBackend  # noqa: E402
+from thonny.common import (  # noqa: E402
+    TEXT_MESSAGE_FORMAT,
+    CommandToBackend,
+    EOFCommand,
+    ImmediateCommand,
+    InputSubmission,
+    format_process_ack,
+)
+
+logger = getLogger(__name__)
+
+# seconds between checking whether the packages have changed
+COMPLETION_INDEX_REFRESH_INTERVAL = 60
+# seconds of index updating between checking for commands
+COMPLETION_INDEX_UPDATE_SLICE = 0.05
+
+
+class AnalysisWorker(MainBackend):
+    def __init__(self, sys_path: List[str], completion_index_path: Optional[str]):
+        self._sys_path = sys_path
+        self._stdin_closed = False
+        self._completion_index_path = completion_index_path
+        self._completion_index_updates = None  # type: Optional[Iterator[None]]
+        self._completion_index_update_time = None  # type: Optional[float]
+        MainBackend.__init__(self)
+
+    def _read_incoming_messages(self):
+        super()._read_incoming_messages()
+        # front-end has closed the pipe (or exited)
+        self._stdin_closed = True
+
+    def _check_for_connection_error(self) -> None:
+        if self._stdin_closed and self._incoming_message_queue.empty():
+            raise ConnectionError("Front-end has closed the connection")
+
+    def handle_connection_error(self, error=None):
+        logger.info("Stopping analysis worker: %s", error)
+        sys.exit(0)
+
+    def _handle_normal_command(self, cmd: CommandToBackend) -> None:
+        # Local modules are resolved relative to the current directory, like in the back-end
+        local_cwd = cmd.get("local_cwd")
+        if local_cwd and local_cwd != os.getcwd() and os.path.isdir(local_cwd):
+            os.chdir(local_cwd)
+
+        super()._handle_normal_command(cmd)
+
+    def _perform_idle_tasks(self):
+        self._check_load_jedi()
+        self._check_update_completion_index()
+
+    def _check_load_jedi(self) -> None:
+        if self._jedi_is_loaded:
+            return
+
+        # First completion request in a fresh process takes seconds. Take this time before
+        # the user needs the completions.
+        from thonny import jedi_utils
+
+        jedi_utils.get_script_completions("import os\nos.pa", 2, 5, None, self._sys_path)
+        self._jedi_is_loaded = True
+
+    def _check_update_completion_index(self) -> None:
+        if self._completion_index_path is None:
+            return
+
+        if self._completion_index_updates is None:
+            if (
+                self._completion_index_update_time is not None
+                and time.time() - self._completion_index_update_time
+                < COMPLETION_INDEX_REFRESH_INTERVAL
+            ):
+                return
+
+            from thonny import completion_index
+
+            self._completion_index_updates = completion_index.iter_update(
+                self._completion_index_path, self._sys_path
+            )
+
+        # Do a slice of the work, so that the commands don't need to wait for long
+        deadline = time.perf_counter() + COMPLETION_INDEX_UPDATE_SLICE
+        try:
+            for _ in self._completion_index_updates:
+                if time.perf_counter() > deadline:
+                    return
+        except Exception:
+            logger.exception("Could not update completion index")
+
+        self._completion_index_updates = None
+        self._completion_index_update_time = time.time()
+
+    def _get_sys_path_for_analysis(self) -> Optional[List[str]]:
+        return self._sys_path
+
+    def _handle_user_input(self, msg: InputSubmission) -> None:
+        pass
+
+    def _handle_eof_command(self, msg: EOFCommand) -> None:
+        pass
+
+    def _handle_immediate_command(self, cmd: ImmediateCommand) -> None:
+        pass
+
+    def _get_path_info(self, path: str) -> Optional[Dict]:
+        raise NotImplementedError()
+
+    def _get_dir_children_info(
+        self, path: str, include_hidden: bool = False
+    ) -> Optional[Dict[str, Dict]]:
+        raise NotImplementedError()
+
+    def _get_sep(self) -> str:
+        return os.path.sep
+
+
+if __name__ == "__main__":
+    print(format_process_ack(TEXT_MESSAGE_FORMAT))
+    AnalysisWorker(ast.literal_eval(sys.argv[1]), ast.literal_eval(sys.argv[2])).mainloop()
@@ -1,10 +1,11 @@
-import _thread,io,os.path,pathlib,queue,stat,sys,threading,time,traceback,warnings
+import _thread,collections,io,os.path,pathlib,queue,stat,sys,threading,time,traceback,warnings
 from abc import ABC, abstractmethod
 from logging import getLogger
 from typing import Any, BinaryIO, Callable, Dict, Iterable, List, Optional, Tuple, Union
 import thonny
 from thonny.common import IGNORED_FILES_AND_DIRS,PROCESS_ACK,BackendEvent,CommandToBackend,EOFCommand,ImmediateCommand,InlineCommand,InlineResponse,InputSubmission,MessageFromBackend,ToplevelCommand,ToplevelResponse,UserError,execute_with_frontend_sys_path,is_local_path,parse_message,read_one_incoming_message_str,serialize_message,try_load_modules_with_frontend_sys_path,universal_dirname
 NEW_DIR_MODE=0o755
+MAX_EDITOR_SESSIONS=20
 logger=getLogger(__name__)
 class BaseBackend(ABC):
     def __init__(self):
@@ -96,11 +97,10 @@ class BaseBackend(ABC):
                 break
 
     def _read_one_incoming_message(self):
-        msg_str=read_one_incoming_message_str(self._read_incoming_msg_line)
-        if not msg_str:
+        msg=self._read_incoming_message()
+        if msg is None:
             return False
 
-        msg=parse_message(msg_str)
         if isinstance(msg, ImmediateCommand):
             # This will be handled right away
             self._handle_immediate_command(msg)
@@ -108,6 +108,14 @@ class BaseBackend(ABC):
             self._incoming_message_queue.put(msg)
         return True
 
+    def _read_incoming_message(self) -> Optional[CommandToBackend]:
+        """Returns None on EOF"""
+        msg_str=read_one_incoming_message_str(self._read_incoming_msg_line)
+        if not msg_str:
+            return None
+
+        return parse_message(msg_str)
+
     def _prepare_command_response(
         self, response: Union[MessageFromBackend, Dict, None], command: CommandToBackend
     ) -> MessageFromBackend:
@@ -199,6 +207,8 @@ class MainBackend(BaseBackend, ABC):
     def __init__(self):
         self._command_handlers={}
         self._jedi_is_loaded=False
+        # copies of editor documents (by session id), kept up to date by the changes in commands
+        self._editor_sessions=collections.OrderedDict()
         BaseBackend.__init__(self)
 
     def add_command(self, command_name, handler):
@@ -302,6 +312,7 @@ class MainBackend(BaseBackend, ABC):
     def _cmd_editor_autocomplete(self, cmd):
         logger.debug("Starting _cmd_editor_autocomplete")
         error=None
+        source=self._get_editor_source(cmd)
         try:
             from thonny import jedi_utils
 
@@ -314,25 +325,28 @@ class MainBackend(BaseBackend, ABC):
                 logger.debug("editor autocomplete with %r", sys_path)
             """
 
-            with warnings.catch_warnings():
-                completions=jedi_utils.get_script_completions(
-                    cmd.source,
-                    cmd.row,
-                    cmd.column,
-                    cmd.filename,
-                    sys_path=sys_path,
-                )
+            if source is None:
+                completions=[]
+            else:
+                with warnings.catch_warnings():
+                    completions=jedi_utils.get_script_completions(
+                        source,
+                        cmd.row,
+                        cmd.column,
+                        cmd.filename,
+                        sys_path=sys_path,
+                    )
         except ImportError:
             completions=[]
             error="Could not import jedi"
 
         return dict(
-            source=cmd.source,
             row=cmd.row,
             column=cmd.column,
             filename=cmd.filename,
             completions=completions,
             error=error,
+            **self._get_source_response_args(cmd),
         )
 
     def _cmd_get_completion_details(self, cmd):
@@ -348,20 +362,24 @@ class MainBackend(BaseBackend, ABC):
     def _cmd_get_editor_calltip(self, cmd):
         from thonny import jedi_utils
 
-        signatures=jedi_utils.get_script_signatures(
-            cmd.source,
-            cmd.row,
-            cmd.column,
-            cmd.filename,
-            sys_path=self._get_sys_path_for_analysis(),
-        )
+        source=self._get_editor_source(cmd)
+        if source is None:
+            signatures=[]
+        else:
+            signatures=jedi_utils.get_script_signatures(
+                source,
+                cmd.row,
+                cmd.column,
+                cmd.filename,
+                sys_path=self._get_sys_path_for_analysis(),
+            )
         return InlineResponse(
             "get_editor_calltip",
-            source=cmd.source,
             row=cmd.row,
             column=cmd.column,
             filename=cmd.filename,
             signatures=signatures,
+            **self._get_source_response_args(cmd),
         )
 
     def _cmd_get_shell_calltip(self, cmd):
@@ -383,28 +401,80 @@ class MainBackend(BaseBackend, ABC):
     def _cmd_highlight_occurrences(self, cmd):
         from thonny import jedi_utils
 
-        refs=jedi_utils.get_references(
-            cmd.source,
-            cmd.row,
-            cmd.column,
-            cmd.filename,
-            scope="file",
-            sys_path=self._get_sys_path_for_analysis(),
-        )
+        source=self._get_editor_source(cmd)
+        if source is None:
+            refs=[]
+        else:
+            refs=jedi_utils.get_references(
+                source,
+                cmd.row,
+                cmd.column,
+                cmd.filename,
+                scope="file",
+                sys_path=self._get_sys_path_for_analysis(),
+            )
 
-        return {"references": refs, "text_last_operation_time": cmd.text_last_operation_time}
+        return {
+            "references": refs,
+            "text_last_operation_time": cmd.text_last_operation_time,
+            **self._get_source_response_args(cmd),
+        }
 
     def _cmd_get_definitions(self, cmd):
         from thonny import jedi_utils
 
-        defs=jedi_utils.get_definitions(
-            cmd.source,
-            cmd.row,
-            cmd.column,
-            filename=cmd.filename,
-            sys_path=self._get_sys_path_for_analysis(),
-        )
-        return {"definitions": defs}
+        source=self._get_editor_source(cmd)
+        if source is None:
+            defs=[]
+        else:
+            defs=jedi_utils.get_definitions(
+                source,
+                cmd.row,
+                cmd.column,
+                filename=cmd.filename,
+                sys_path=self._get_sys_path_for_analysis(),
+            )
+        return {"definitions": defs, **self._get_source_response_args(cmd)}
+
+    def _get_editor_source(self, cmd) -> Optional[str]:
+        """Returns the source of the editor analysis command or None if it is not known.
+
+        The commands of an editor session (see editor_helpers.get_analysis_args) carry the
+        whole source only when the back-end doesn't have the previous version of the document.
+        Otherwise they carry the changes since the version confirmed in an earlier response.
+        """
+        session_id=cmd.get("session_id")
+        if session_id is None:
+            return cmd.source
+
+        from thonny.document import Document
+
+        if "source" in cmd:
+            document=Document(cmd.source, cmd.document_version)
+            self._editor_sessions[session_id]=document
+        else:
+            document=self._editor_sessions.get(session_id)
+            if document is None or not document.apply_changes(cmd.changes):
+                logger.info("Unknown version of editor session %r", session_id)
+                self._editor_sessions.pop(session_id, None)
+                return None
+
+        self._editor_sessions.move_to_end(session_id)
+        while len(self._editor_sessions) > MAX_EDITOR_SESSIONS:
+            self._editor_sessions.popitem(last=False)
+
+        return document.get_source()
+
+    def _get_source_response_args(self, cmd) -> Dict[str, Any]:
+        if "session_id" not in cmd:
+            return {"source": cmd.source}
+
+        # Tells the front-end which version it can use as the base of the next changes
+        document=self._editor_sessions.get(cmd.session_id)
+        return {
+            "session_id": cmd.session_id,
+            "document_version": None if document is None else document.get_version(),
+        }
 
     def _cmd_get_active_distributions(self, cmd):
         raise NotImplementedError()
@@ -7,13 +7,16 @@ import sys
 import time
 import tkinter as tk
 from logging import getLogger
-from tkinter import messagebox
-from typing import Dict, Union  # @UnusedImport
+from tkinter import messagebox, ttk
+from typing import Any, Dict, Optional, Union  # @UnusedImport
 
 from thonny import get_workbench, roughparse, tktextext, ui_utils
 from thonny.common import TextRange
+from thonny.document import Document
+from thonny.languages import tr
+from thonny.misc_utils import running_on_mac_os
 from thonny.tktextext import EnhancedText
-from thonny.ui_utils import EnhancedTextWithLogging, ask_string
+from thonny.ui_utils import CommonDialogEx, EnhancedTextWithLogging, ask_string, show_dialog
 
 _syntax_options = {}  # type: Dict[str, Union[str, int]]
 # BREAKPOINT_SYMBOL = "•" # Bullet
@@ -115,9 +118,16 @@ class SyntaxText(EnhancedText):
 
 
 class CodeViewText(EnhancedTextWithLogging, SyntaxText):
-    """Provides opportunities for monkey-patching by plugins"""
+    """Provides opportunities for monkey-patching by plugins.
+
+    Keeps a Document in sync with the text, so that the analyzers don't need to read and parse
+    the text by themselves. <<DocumentUpdated>> gets generated when the text has been idle after
+    changes.
+    """
 
     def __init__(self, master=None, cnf={}, **kw):
+        self._document = Document()
+        self._document_update_scheduled = False
         super().__init__(
             master=master,
             tag_current_line=get_workbench().get_option("view.highlight_current_line"),
@@ -128,6 +138,46 @@ class CodeViewText(EnhancedTextWithLogging, SyntaxText):
         self.bindtags(self.bindtags() + ("CodeViewText",))
         tktextext.fixwordbreaks(tk._default_root)
 
+    def get_document(self) -> Document:
+        self._check_document()
+        return self._document
+
+    def direct_insert(self, index, chars, tags=None, **kw):
+        lineno, col = map(int, self.index(index).split("."))
+        self._document.insert(lineno, col, chars)
+        self._schedule_document_update()
+        return super().direct_insert(index, chars, tags=tags, **kw)
+
+    def direct_delete(self, index1, index2=None, **kw):
+        lineno1, col1 = map(int, self.index(index1).split("."))
+        if index2 is None:
+            index2 = index1 + " +1c"
+        lineno2, col2 = map(int, self.index(index2).split("."))
+        self._document.delete(lineno1, col1, lineno2, col2)
+        self._schedule_document_update()
+        return super().direct_delete(index1, index2, **kw)
+
+    def _check_document(self):
+        end_lineno, end_col = map(int, self.index("end-1c").split("."))
+        if self._document.get_end_position() != (end_lineno, end_col):
+            logger.warning("Document got out of sync with the text, reloading")
+            self._document.set_source(self.get("1.0", "end-1c"))
+
+    def _schedule_document_update(self):
+        if not self._document_update_scheduled:
+            self._document_update_scheduled = True
+            self.after_idle(self._publish_document_update)
+
+    def _publish_document_update(self):
+        self._document_update_scheduled = False
+        if self.winfo_exists():
+            self._check_document()
+            self.event_generate("<<DocumentUpdated>>")
+
+    def destroy(self):
+        self._document.close()
+        super().destroy()
+
     def on_secondary_click(self, event=None):
         super().on_secondary_click(event)
         self.mark_set("insert", "@%d,%d" % (event.x, event.y))
@@ -170,8 +220,18 @@ class CodeView(tktextext.EnhancedTextFrame):
         self._last_toggle_breakpoint_time = 0
         self._gutter.bind("<Button-1>", self._start_toggle_breakpoint, True)
         self._gutter.bind("<ButtonRelease-1>", self._consider_toggle_breakpoint, True)
+        if running_on_mac_os():
+            self._gutter.bind("<Button-2>", self._on_gutter_secondary_click, True)
+        else:
+            self._gutter.bind("<Button-3>", self._on_gutter_secondary_click, True)
         # self.text.tag_configure("breakpoint_line", background="pink")
         self._gutter.tag_configure("breakpoint", foreground="crimson")
+        self._gutter.tag_configure("conditional_breakpoint", foreground="darkorange")
+        # Conditions etc. are attached to the lines by unique text tags, so that they move
+        # together with the text
+        self._breakpoint_options = {}  # type: Dict[str, Dict[str, Any]]
+        self._breakpoint_options_tag_counter = 0
+        self._gutter_menu = None
 
         editor_font = tk.font.nametofont("EditorFont")
         spacer_font = editor_font.copy()
@@ -292,6 +352,7 @@ class CodeView(tktextext.EnhancedTextFrame):
 
         if self.text.tag_nextrange("breakpoint_line", start_index, end_index):
             self.text.tag_remove("breakpoint_line", start_index, end_index)
+            self._set_breakpoint_options(index, None)
         else:
             line_content = self.text.get(start_index, end_index).strip()
             if line_content and line_content[0] != "#":
@@ -300,11 +361,78 @@ class CodeView(tktextext.EnhancedTextFrame):
         self.update_gutter(clean=True)
         self._last_toggle_breakpoint_time = time.time()
 
+    def _on_gutter_secondary_click(self, event):
+        index = "@%d,%d" % (event.x, event.y)
+        line_content = self.text.get(index + " linestart", index + " lineend").strip()
+        if not line_content or line_content[0] == "#":
+            return
+
+        if self._gutter_menu is None:
+            self._gutter_menu = tk.Menu(
+                self._gutter, tearoff=False, **ui_utils.get_style_configuration("Menu")
+            )
+
+        self._gutter_menu.delete(0, "end")
+        self._gutter_menu.add_command(
+            label=tr("Edit breakpoint") + "...", command=lambda: self._edit_breakpoint(index)
+        )
+        if self.text.tag_nextrange("breakpoint_line", index + " linestart", index + " lineend"):
+            self._gutter_menu.add_command(
+                label=tr("Remove breakpoint"), command=lambda: self._remove_breakpoint(index)
+            )
+        self._gutter_menu.tk_popup(event.x_root, event.y_root)
+
+    def _edit_breakpoint(self, index):
+        dlg = BreakpointDialog(self, self._get_breakpoint_options(index) or {})
+        show_dialog(dlg, self)
+        if dlg.result is None:
+            return
+
+        self.text.tag_add("breakpoint_line", index + " linestart", index + " lineend")
+        self._set_breakpoint_options(index, dlg.result or None)
+        self.update_gutter(clean=True)
+
+    def _remove_breakpoint(self, index):
+        self.text.tag_remove("breakpoint_line", index + " linestart", index + " lineend")
+        self._set_breakpoint_options(index, None)
+        self.update_gutter(clean=True)
+
+    def _get_breakpoint_options_tag(self, index) -> Optional[str]:
+        # The first char of the line may have been typed after setting the options
+        # (eg. when indenting), so any tagged char on the line counts.
+        start = index + " linestart"
+        end = index + " lineend"
+        for tag in self._breakpoint_options:
+            if self.text.tag_nextrange(tag, start, end):
+                return tag
+        return None
+
+    def _get_breakpoint_options(self, index) -> Optional[Dict[str, Any]]:
+        tag = self._get_breakpoint_options_tag(index)
+        if tag is None:
+            return None
+        return self._breakpoint_options[tag]
+
+    def _set_breakpoint_options(self, index, options: Optional[Dict[str, Any]]) -> None:
+        old_tag = self._get_breakpoint_options_tag(index)
+        if old_tag is not None:
+            self.text.tag_delete(old_tag)
+            del self._breakpoint_options[old_tag]
+
+        if options:
+            self._breakpoint_options_tag_counter += 1
+            tag = "breakpoint_options_%d" % self._breakpoint_options_tag_counter
+            self.text.tag_add(tag, index + " linestart", index + " lineend")
+            self._breakpoint_options[tag] = options
+
     def _clean_selection(self):
         self.text.tag_remove("sel", "1.0", "end")
         self._gutter.tag_remove("sel", "1.0", "end")
 
     def _text_changed(self, event):
+        if self._clear_gutter_shadings():
+            return
+
         self.update_gutter(
             clean=self.text._last_event_changed_line_count
             and self.text.tag_ranges("breakpoint_line")
@@ -317,10 +445,13 @@ class CodeView(tktextext.EnhancedTextFrame):
             visual_line_number = self._first_line_number + lineno - 1
             linestart = str(visual_line_number) + ".0"
 
-            yield str(lineno), ()
+            yield str(lineno), self._get_gutter_shading_tags(lineno)
 
             if self.text.tag_nextrange("breakpoint_line", linestart, linestart + " lineend"):
-                yield BREAKPOINT_SYMBOL, ("breakpoint",)
+                if self._get_breakpoint_options(linestart):
+                    yield BREAKPOINT_SYMBOL, ("breakpoint", "conditional_breakpoint")
+                else:
+                    yield BREAKPOINT_SYMBOL, ("breakpoint",)
             else:
                 yield " ", ()
 
@@ -357,6 +488,20 @@ class CodeView(tktextext.EnhancedTextFrame):
                 result.add(int(num_line.replace(BREAKPOINT_SYMBOL, "")))
         return result
 
+    def get_breakpoint_options(self) -> Dict[int, Dict[str, Any]]:
+        """Returns conditions, hit counts and log messages of the breakpoints by line numbers"""
+        result = {}
+        for tag, options in self._breakpoint_options.items():
+            ranges = self.text.tag_ranges(tag)
+            if not ranges:
+                # the line has been deleted
+                continue
+            start_index = str(ranges[0])
+            if self.text.tag_nextrange("breakpoint_line", start_index, start_index + " lineend"):
+                visual_line_number = int(start_index.split(".")[0])
+                result[visual_line_number - self._first_line_number + 1] = options
+        return result
+
     def get_selected_range(self):
         if self.text.has_selection():
             lineno, col_offset = map(int, self.text.index(tk.SEL_FIRST).split("."))
@@ -392,6 +537,63 @@ class CodeView(tktextext.EnhancedTextFrame):
             self._gutter.tag_configure("breakpoint", _syntax_options["breakpoint"])
 
 
+class BreakpointDialog(CommonDialogEx):
+    """Asks for the condition, hit count and log message of a breakpoint"""
+
+    def __init__(self, master, options: Dict[str, Any]):
+        super().__init__(master)
+        self.result = None  # type: Optional[Dict[str, Any]]
+
+        margin = self.get_large_padding()
+        spacing = margin // 2
+
+        self.title(tr("Edit breakpoint"))
+
+        self._vars = {}
+        fields = [
+            ("condition", tr("Stop only when this expression is true")),
+            ("hit_count", tr("Stop only from this hit on")),
+            ("log_message", tr("Instead of stopping, print this message (use {expression})")),
+        ]
+        for i, (name, caption) in enumerate(fields):
+            value = options.get(name)
+            self._vars[name] = tk.StringVar(value="" if value is None else str(value))
+            label = ttk.Label(self.main_frame, text=caption)
+            label.grid(row=2 * i, column=0, columnspan=2, sticky="w", padx=margin, pady=(margin, 0))
+            entry = ttk.Entry(self.main_frame, textvariable=self._vars[name], width=50)
+            entry.grid(row=2 * i + 1, column=0, columnspan=2, sticky="we", padx=margin)
+            entry.bind("<Return>", self.on_ok, True)
+            entry.bind("<KP_Enter>", self.on_ok, True)
+            if i == 0:
+                entry.focus_set()
+
+        ok_button = ttk.Button(self.main_frame, text=tr("OK"), command=self.on_ok, default="active")
+        ok_button.grid(row=6, column=0, padx=(margin, spacing), pady=margin, sticky="e")
+        cancel_button = ttk.Button(self.main_frame, text=tr("Cancel"), command=self.on_close)
+        cancel_button.grid(row=6, column=1, padx=(0, margin), pady=margin, sticky="e")
+
+    def on_ok(self, event=None):
+        result = {}
+        for name, var in self._vars.items():
+            value = var.get().strip()
+            if value:
+                result[name] = value
+
+        if "hit_count" in result:
+            try:
+                result["hit_count"] = int(result["hit_count"])
+                if result["hit_count"] < 1:
+                    raise ValueError()
+            except ValueError:
+                messagebox.showerror(
+                    tr("Error"), tr("Hit count must be a positive integer"), master=self
+                )
+                return
+
+        self.result = result
+        self.destroy()
+
+
 def set_syntax_options(syntax_options):
     global _syntax_options
     _syntax_options = syntax_options
@@ -3,13 +3,16 @@
 """
 Classes used both by front-end and back-end
 """
+import copy
 import os.path
+import pickle
 import site
 import sys
+import threading
 from collections import namedtuple
-from dataclasses import dataclass
+from dataclasses import dataclass, is_dataclass
 from logging import getLogger
-from typing import Any, Callable, Dict, List, Optional, Tuple  # @UnusedImport
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Tuple  # @UnusedImport
 
 logger = getLogger(__name__)
 
@@ -21,6 +24,17 @@ OBJECT_LINK_END = "[/object_link_for_thonny]"
 REMOTE_PATH_MARKER = " :: "
 PROCESS_ACK = "OK"
 
+# Formats for messages between frontend and backend.
+# Frontend proposes a format in launcher options and backend confirms it in the ack line.
+TEXT_MESSAGE_FORMAT = "text"
+BINARY_MESSAGE_FORMAT = "binary-1"
+SUPPORTED_MESSAGE_FORMATS = [TEXT_MESSAGE_FORMAT, BINARY_MESSAGE_FORMAT]
+BINARY_MESSAGE_MARKER = MESSAGE_MARKER + "B"
+_BINARY_MESSAGE_MARKER_BYTES = BINARY_MESSAGE_MARKER.encode("ASCII")
+_BINARY_CODEC_VERSION = 1
+# Protocol 4 is understood by all Python versions supported by the backend
+_PICKLE_PROTOCOL = 4
+
 IGNORED_FILES_AND_DIRS = [
     "System Volume Information",
     "._.Trashes",
@@ -29,7 +43,13 @@ IGNORED_FILES_AND_DIRS = [
     ".DS_Store",
 ]
 
-ValueInfo = namedtuple("ValueInfo", ["id", "repr"])
+# generation (if given) tells apart different objects, which have had the same id
+ValueInfo = namedtuple("ValueInfo", ["id", "repr", "generation"], defaults=[None])
+# Describes a namespace (dict of name -> ValueInfo) relative to its previously sent version.
+# base_version None means that changed contains all variables of the namespace.
+VariablesDelta = namedtuple(
+    "VariablesDelta", ["namespace", "base_version", "version", "changed", "removed"]
+)
 FrameInfo = namedtuple(
     "FrameInfo",
     [
@@ -38,6 +58,8 @@ FrameInfo = namedtuple(
         "module_name",
         "code_name",
         "source",
+        "source_id",
+        "source_hash",
         "lineno",
         "firstlineno",
         "in_library",
@@ -149,6 +171,25 @@ def range_contains_smaller_or_equal(one: TextRange, other: TextRange) -> bool:
     return range_contains_smaller(one, other) or one == other
 
 
+def encode_line_set(line_numbers) -> List[int]:
+    """Run-length encodes line numbers as a flat list of (first line, line count) pairs"""
+    result = []
+    for lineno in sorted(line_numbers):
+        if result and result[-2] + result[-1] == lineno:
+            result[-1] += 1
+        else:
+            result += [lineno, 1]
+    return result
+
+
+def decode_line_set(encoded: List[int]) -> List[int]:
+    """Returns sorted line numbers encoded by encode_line_set"""
+    result = []
+    for i in range(0, len(encoded), 2):
+        result.extend(range(encoded[i], encoded[i] + encoded[i + 1]))
+    return result
+
+
 class InputSubmission(Record):
     """For sending data to backend's stdin"""
 
@@ -259,6 +300,428 @@ def parse_message(msg_string: str) -> Record:
     return eval(msg_string[msg_start:].replace("\n", ""))
 
 
+class _MessageUnpickler(pickle.Unpickler):
+    """Allows constructing only the classes meant for messages.
+
+    Other globals (functions, arbitrary classes) are rejected, so that decoding a message
+    can't run code the same way eval() could.
+    """
+
+    def find_class(self, module, name):
+        if module == __name__ and name in _get_message_classes():
+            return _get_message_classes()[name]
+        elif module == "builtins" and name in _SAFE_BUILTIN_CLASSES:
+            return _SAFE_BUILTIN_CLASSES[name]
+
+        raise pickle.UnpicklingError(f"Unexpected class in message: {module}.{name}")
+
+
+_SAFE_BUILTIN_CLASSES = {
+    cls.__name__: cls for cls in [bytearray, complex, frozenset, range, set, slice]
+}
+_message_classes = None
+
+
+def _get_message_classes() -> Dict[str, type]:
+    global _message_classes
+    if _message_classes is None:
+        # Record subclasses, namedtuples and dataclasses defined in this module
+        # (helper classes, eg. VariablesDiffer, don't travel in messages)
+        _message_classes = {
+            name: value
+            for name, value in globals().items()
+            if isinstance(value, type)
+            and value.__module__ == __name__
+            and not name.startswith("_")
+            and (
+                issubclass(value, Record)
+                or issubclass(value, tuple)
+                and hasattr(value, "_fields")
+                or is_dataclass(value)
+            )
+        }
+    return _message_classes
+
+
+def serialize_message_binary(msg: Record) -> bytes:
+    """Produces a length-prefixed binary frame.
+
+    Header is ASCII and ends with a newline, so that the reader can find the frame
+    with readline even if it is preceded by raw output of a subprocess.
+    Raises pickle.PicklingError or TypeError if the message contains a value, which can't be
+    represented (caller may fall back to serialize_message).
+    """
+    payload = pickle.dumps(msg, protocol=_PICKLE_PROTOCOL)
+    header = "%s%d %d\n" % (BINARY_MESSAGE_MARKER, _BINARY_CODEC_VERSION, len(payload))
+    return header.encode("ASCII") + payload + b"\n"
+
+
+def parse_message_binary(codec_version: int, payload: bytes) -> Record:
+    if codec_version != _BINARY_CODEC_VERSION:
+        raise ValueError(f"Unsupported binary message version {codec_version}")
+
+    import io
+
+    return _MessageUnpickler(io.BytesIO(payload)).load()
+
+
+class MessageDecodingError(Exception):
+    """Raised when a binary message frame can't be decoded.
+
+    The frame has been consumed from the stream, so the next read starts from the following
+    line. `prefix` holds the text which preceded the frame on the same line.
+    """
+
+    def __init__(self, description: str, prefix: str = ""):
+        super().__init__(description)
+        self.prefix = prefix
+
+
+def read_one_incoming_message_bytes(stream: BinaryIO) -> Tuple[str, Optional[Record]]:
+    """Reads from a binary stream until the end of a line or a message.
+
+    Returns the text preceding the message (or the whole line, if it didn't contain
+    a message) and the message (or None). Returns ("", None) on EOF.
+    Text format messages are also recognized.
+
+    Raises MessageDecodingError if a binary message is malformed. Errors of the stream itself
+    (OSError, ValueError for a closed stream) are propagated as is.
+    """
+    line = stream.readline()
+    if not line:
+        return "", None
+
+    pos = line.find(_BINARY_MESSAGE_MARKER_BYTES)
+    if pos == -1:
+        text = _decode_pipe_bytes(line)
+        if not text.startswith(MESSAGE_MARKER):
+            return text, None
+
+        first_line_reader = iter([text]).__next__
+
+        def line_reader():
+            try:
+                return first_line_reader()
+            except StopIteration:
+                return _decode_pipe_bytes(stream.readline())
+
+        msg_str = read_one_incoming_message_str(line_reader)
+        try:
+            return "", parse_message(msg_str)
+        except Exception:
+            logger.warning("Could not parse text message", exc_info=True)
+            return msg_str, None
+
+    prefix = _decode_pipe_bytes(line[:pos])
+    header = line[pos + len(_BINARY_MESSAGE_MARKER_BYTES) :]
+    try:
+        codec_version, payload_length = map(int, header.split())
+        if payload_length < 0:
+            raise ValueError("Negative length")
+    except ValueError:
+        # only the header line has been consumed
+        raise MessageDecodingError("Malformed message header %r" % header.strip(), prefix)
+
+    payload = stream.read(payload_length)
+    if len(payload) < payload_length:
+        # EOF in the middle of the message
+        return prefix, None
+
+    terminator = stream.read(1)
+    if terminator not in (b"\n", b""):
+        # The length was wrong, skip to the end of current line so that the next read can
+        # find the next header
+        stream.readline()
+        raise MessageDecodingError("Unexpected message terminator %r" % terminator, prefix)
+
+    try:
+        return prefix, parse_message_binary(codec_version, payload)
+    except Exception as e:
+        raise MessageDecodingError("Could not unpickle message: %s" % e, prefix) from e
+
+
+def _decode_pipe_bytes(data: bytes) -> str:
+    # The pipe is read in binary mode, so newlines are not translated
+    return data.decode("utf-8", errors="replace").replace("\r\n", "\n")
+
+
+def negotiate_message_format(requested_format: Optional[str]) -> str:
+    if requested_format in SUPPORTED_MESSAGE_FORMATS:
+        return requested_format
+    else:
+        return TEXT_MESSAGE_FORMAT
+
+
+def format_process_ack(message_format: str) -> str:
+    # plain ack keeps older frontends and SSH mediator happy
+    if message_format == TEXT_MESSAGE_FORMAT:
+        return PROCESS_ACK
+    else:
+        return PROCESS_ACK + " " + message_format
+
+
+def parse_process_ack(ack: str) -> Optional[str]:
+    """Returns the message format confirmed by the ack or None if ack is not valid"""
+    parts = ack.split()
+    if not parts or parts[0] != PROCESS_ACK:
+        return None
+    elif len(parts) == 1:
+        return TEXT_MESSAGE_FORMAT
+    else:
+        return negotiate_message_format(parts[1])
+
+
+class _NamespaceCodec:
+    """Common part of VariablesDiffer and VariablesPatcher"""
+
+    def __init__(self):
+        # namespace -> (version, variables or snapshot)
+        self._states = {}  # type: Dict[str, Tuple[int, Dict[str, Any]]]
+
+    def reset(self) -> None:
+        self._states.clear()
+
+    def forget(self, namespaces: List[str]) -> None:
+        """Next message will contain these namespaces in full"""
+        for namespace in namespaces:
+            self._states.pop(namespace, None)
+
+    def _convert(self, namespace: str, value: Any) -> Any:
+        raise NotImplementedError()
+
+    def _map_message(self, msg: Record, copy_msg: bool) -> Record:
+        """Replaces namespaces in the message with the results of self._convert.
+
+        Namespaces are processed in a fixed order, so that both sides agree on versions.
+        States of the local namespaces of the frames, which are not present in
+        the stack anymore, get forgotten.
+        """
+        if type(msg).__name__ not in ["ToplevelResponse", "DebuggerResponse"]:
+            return msg
+
+        has_globals = isinstance(msg.get("globals"), (dict, VariablesDelta))
+        stack = msg.get("stack")
+        if not has_globals and not isinstance(stack, list):
+            return msg
+
+        if copy_msg:
+            msg = copy.copy(msg)
+
+        if has_globals:
+            msg["globals"] = self._convert("globals:__main__", msg["globals"])
+
+        if isinstance(stack, list):
+            new_stack = []
+            for frame in stack:
+                updates = {}
+                if frame.locals is not None:
+                    updates["locals"] = self._convert("locals:%d" % frame.id, frame.locals)
+                if frame.globals is not None:
+                    updates["globals"] = self._convert(
+                        "globals:%s" % frame.module_name, frame.globals
+                    )
+                new_stack.append(frame._replace(**updates))
+            msg["stack"] = new_stack
+
+            live_namespaces = {"locals:%d" % frame.id for frame in stack}
+            for namespace in list(self._states):
+                if namespace.startswith("locals:") and namespace not in live_namespaces:
+                    del self._states[namespace]
+
+        return msg
+
+
+class VariablesDiffer(_NamespaceCodec):
+    """Backend side of the namespace delta protocol.
+
+    Replaces variables in outgoing ToplevelResponse-s and DebuggerResponse-s with
+    VariablesDelta-s computed against the namespace snapshots of previously sent messages.
+    Snapshots keep only ids and hashes of the reprs.
+    Deltas are computed at sending time (not at exporting time), because some messages
+    (eg. NiceTracer's past states) get sent more than once.
+    """
+
+    def encode_message(self, msg: Record) -> Record:
+        """Returns the message itself or its shallow copy with deltas in place of variables"""
+        return self._map_message(msg, copy_msg=True)
+
+    def _convert(self, namespace: str, variables: Dict[str, ValueInfo]) -> VariablesDelta:
+        snapshot = {
+            name: (info.id, info.generation, hash(info.repr)) for name, info in variables.items()
+        }
+        prev = self._states.get(namespace)
+        if prev is None:
+            delta = VariablesDelta(namespace, None, 1, variables, [])
+        else:
+            prev_version, prev_snapshot = prev
+            changed = {
+                name: variables[name]
+                for name, fingerprint in snapshot.items()
+                if prev_snapshot.get(name) != fingerprint
+            }
+            removed = [name for name in prev_snapshot if name not in snapshot]
+            delta = VariablesDelta(namespace, prev_version, prev_version + 1, changed, removed)
+
+        self._states[namespace] = (delta.version, snapshot)
+        return delta
+
+
+class VariablesPatcher(_NamespaceCodec):
+    """Frontend side of the namespace delta protocol.
+
+    Replaces VariablesDelta-s in incoming messages with complete variables dicts.
+    Must see all messages produced by the corresponding VariablesDiffer, in the same order.
+    If a delta doesn't fit the known version nevertheless, then the namespace remains unknown
+    (presented as empty) until the backend sends it in full. The backend gets asked to do this
+    via the next command (see pop_unknown_namespaces).
+    """
+
+    def __init__(self):
+        super().__init__()
+        # unknown namespaces, which haven't been requested yet
+        self._unrequested_namespaces = set()
+        # decoding and requesting happen in different threads
+        self._lock = threading.Lock()
+
+    def reset(self) -> None:
+        with self._lock:
+            super().reset()
+            self._unrequested_namespaces.clear()
+
+    def decode_message(self, msg: Record) -> Record:
+        with self._lock:
+            return self._map_message(msg, copy_msg=False)
+
+    def pop_unknown_namespaces(self) -> List[str]:
+        """Returns the namespaces, which the backend should send in full, if not asked already"""
+        with self._lock:
+            result = sorted(self._unrequested_namespaces)
+            self._unrequested_namespaces.clear()
+            return result
+
+    def _convert(self, namespace: str, delta: Any) -> Dict[str, ValueInfo]:
+        if not isinstance(delta, VariablesDelta):
+            # backend doesn't use deltas
+            return delta
+
+        if delta.base_version is None:
+            variables = delta.changed
+        else:
+            prev = self._states.get(namespace)
+            if prev is None or prev[0] != delta.base_version:
+                if prev is None or prev[0] is not None:
+                    logger.error(
+                        "Got delta for version %s of %s, but have %s",
+                        delta.base_version,
+                        namespace,
+                        None if prev is None else prev[0],
+                    )
+                    self._unrequested_namespaces.add(namespace)
+                # applying the delta would give wrong variables, wait for the complete namespace
+                self._states[namespace] = (None, {})
+                return {}
+
+            # previous dict may be still in use, so it can't be modified
+            variables = prev[1].copy()
+            variables.update(delta.changed)
+            for name in delta.removed:
+                variables.pop(name, None)
+
+        self._states[namespace] = (delta.version, variables)
+        return variables
+
+
+def _map_frames(msg: Record, fun: Callable[[FrameInfo], FrameInfo]) -> Record:
+    """Returns the message or its shallow copy with fun applied to the frames of its stacks"""
+    if type(msg).__name__ not in ["ToplevelResponse", "DebuggerResponse"]:
+        return msg
+
+    result = msg
+    stack = msg.get("stack")
+    if isinstance(stack, list):
+        result = copy.copy(msg)
+        result["stack"] = [fun(frame) for frame in stack]
+
+    user_exception = msg.get("user_exception")
+    if isinstance(user_exception, dict) and isinstance(user_exception.get("stack"), list):
+        if result is msg:
+            result = copy.copy(msg)
+        result["user_exception"] = dict(
+            user_exception, stack=[fun(frame) for frame in user_exception["stack"]]
+        )
+
+    return result
+
+
+class FrameSourceEncoder:
+    """Backend side of the frame source protocol.
+
+    A FrameInfo identifies its source by source_id (file and first line of the code) and
+    source_hash (version of the text). The text itself is sent only in the first message
+    referring to this version of the source, later messages leave FrameInfo.source empty.
+    """
+
+    def __init__(self):
+        # source_id -> hash of the text sent last time
+        self._sent_hashes = {}  # type: Dict[str, str]
+
+    def reset(self) -> None:
+        self._sent_hashes.clear()
+
+    def encode_message(self, msg: Record) -> Record:
+        """Returns the message itself or its shallow copy without already sent sources"""
+        return _map_frames(msg, self._encode_frame)
+
+    def _encode_frame(self, frame: FrameInfo) -> FrameInfo:
+        if frame.source_id is None or frame.source is None:
+            return frame
+
+        if self._sent_hashes.get(frame.source_id) == frame.source_hash:
+            return frame._replace(source=None)
+
+        self._sent_hashes[frame.source_id] = frame.source_hash
+        return frame
+
+
+class FrameSourceDecoder:
+    """Frontend side of the frame source protocol.
+
+    Remembers the texts of the sources and puts them back to the FrameInfo-s, which
+    came without the text. Must see all messages produced by the corresponding FrameSourceEncoder.
+    """
+
+    def __init__(self):
+        # source_id -> (hash, text)
+        self._sources = {}  # type: Dict[str, Tuple[str, str]]
+
+    def reset(self) -> None:
+        self._sources.clear()
+
+    def decode_message(self, msg: Record) -> Record:
+        return _map_frames(msg, self._decode_frame)
+
+    def get_source(self, source_id: str, source_hash: str) -> Optional[str]:
+        known = self._sources.get(source_id)
+        if known is None or known[0] != source_hash:
+            return None
+        return known[1]
+
+    def _decode_frame(self, frame: FrameInfo) -> FrameInfo:
+        if frame.source_id is None:
+            return frame
+
+        if frame.source is not None:
+            self._sources[frame.source_id] = (frame.source_hash, frame.source)
+            return frame
+
+        source = self.get_source(frame.source_id, frame.source_hash)
+        if source is None:
+            logger.error("Got unknown version %s of %s", frame.source_hash, frame.source_id)
+            return frame
+
+        return frame._replace(source=source)
+
+
 def normpath_with_actual_case(name: str) -> str:
     """In Windows return the path with the case it is stored in the filesystem"""
     if not os.path.exists(name):
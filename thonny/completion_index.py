@@ -0,0 +1,561 @@
+"""
+Persistent index of the modules and their top-level names in the sys.path of an interpreter.
+
+Allows proposing module names (after "import" and "from") and the names of a module (after
+"from module import" and "module.") right away, while jedi, which may need seconds with cold
+caches, computes the precise completions.
+
+The index gets built and refreshed by an analysis worker (see analysis_worker.py). The modules
+don't get imported, their names are collected from the source with ast. The entries of the
+modules installed by a distribution are reused as long as the RECORD file of the distribution
+stays the same. Other modules are reused as long as their files don't change.
+"""
+import ast
+import hashlib
+import json
+import os.path
+import re
+from logging import getLogger
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from thonny.common import CompletionInfo
+
+logger = getLogger(__name__)
+
+INDEX_FORMAT_VERSION = 1
+MAX_MODULE_FILE_SIZE = 2 * 1024 * 1024
+# how far the imports within a package are followed when collecting its names
+MAX_IMPORT_DEPTH = 3
+MAX_SUMMARY_LENGTH = 200
+
+# [type, signature, docstring summary] (type is named like in jedi)
+NameInfo = List[Optional[str]]
+
+_IMPORT_MODULE_REGEX = re.compile(
+    r"\s*(?:from\s+|import\s+(?:[\w.]+(?:\s+as\s+\w+)?\s*,\s*)*)([\w.]*)$"
+)
+_FROM_IMPORT_NAME_REGEX = re.compile(
+    r"\s*from\s+([\w.]+)\s+import\s+\(?\s*(?:\w+(?:\s+as\s+\w+)?\s*,\s*)*(\w*)$"
+)
+_ATTRIBUTE_REGEX = re.compile(r"(?<![\w.])([A-Za-z_]\w*)\.(\w*)$")
+_IMPORT_STATEMENT_REGEX = re.compile(
+    r"\s*import\s+([\w.]+(?:\s+as\s+\w+)?(?:\s*,\s*[\w.]+(?:\s+as\s+\w+)?)*)"
+)
+
+
+def get_index_path(user_dir: str, sys_path: List[str]) -> str:
+    digest = hashlib.sha1(repr(sys_path).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(user_dir, "completion_index", digest + ".json")
+
+
+def iter_update(index_path: str, sys_path: List[str]) -> Iterator[None]:
+    """Brings the index file up to date.
+
+    Yields after each distribution or module, so that the caller can spread the work.
+    """
+    old_sources = _load_sources(index_path, sys_path)
+    sources = {}
+    changed = False
+    for path_entry in sys_path:
+        for key, fingerprint, module_files in _iter_sources(path_entry):
+            old_source = old_sources.get(key)
+            if old_source is not None and old_source["fingerprint"] == fingerprint:
+                sources[key] = old_source
+            else:
+                logger.debug("Indexing %s", key)
+                sources[key] = {
+                    "fingerprint": fingerprint,
+                    "modules": {
+                        name: _index_module(path_entry, name, module_file)
+                        for name, module_file in module_files.items()
+                    },
+                }
+                changed = True
+            yield
+
+    if changed or sources.keys() != old_sources.keys():
+        _save_sources(index_path, sys_path, sources)
+
+
+def load_index(index_path: str) -> Optional["CompletionIndex"]:
+    try:
+        with open(index_path, encoding="utf-8") as fp:
+            data = json.load(fp)
+    except (OSError, ValueError):
+        logger.exception("Could not load completion index %s", index_path)
+        return None
+
+    if data.get("format") != INDEX_FORMAT_VERSION:
+        return None
+
+    return CompletionIndex(data["sources"])
+
+
+class CompletionIndex:
+    def __init__(self, sources: Dict[str, Dict[str, Any]]):
+        # first module in sys.path shadows others with the same name
+        self._modules = {}  # type: Dict[str, Dict[str, Any]]
+        for source in sources.values():
+            for name, entry in source["modules"].items():
+                self._modules.setdefault(name, entry)
+
+    def get_completions(self, lines: List[str], row: int, column: int) -> List[CompletionInfo]:
+        """Proposes module names or module's names for the cursor position, if possible.
+
+        Returns an empty list if the position doesn't look like one of
+        "import modu", "from modu", "from module import na" or "module.na",
+        or if the module is not in the index.
+        """
+        line_prefix = lines[row - 1][:column]
+
+        match = _IMPORT_MODULE_REGEX.match(line_prefix)
+        if match:
+            return self._get_module_completions(match.group(1))
+
+        match = _FROM_IMPORT_NAME_REGEX.match(line_prefix)
+        if match:
+            return self._get_name_completions(match.group(1), match.group(2), in_import=True)
+
+        match = _ATTRIBUTE_REGEX.search(line_prefix)
+        if match:
+            module_name = _get_imported_modules(lines).get(match.group(1))
+            if module_name is not None:
+                return self._get_name_completions(module_name, match.group(2), in_import=False)
+
+        return []
+
+    def _get_module_completions(self, prefix: str) -> List[CompletionInfo]:
+        if "." in prefix:
+            parent, _, name_prefix = prefix.rpartition(".")
+            entry = self._modules.get(parent)
+            if entry is None:
+                return []
+            names = entry["submodules"]
+            full_name_prefix = parent + "."
+        else:
+            name_prefix = prefix
+            names = self._modules
+            full_name_prefix = ""
+
+        return _create_completions(
+            [(name, ["module", None, None]) for name in names],
+            name_prefix,
+            full_name_prefix,
+            in_import=True,
+        )
+
+    def _get_name_completions(
+        self, module_name: str, prefix: str, in_import: bool
+    ) -> List[CompletionInfo]:
+        entry = self._modules.get(module_name)
+        if entry is None:
+            return []
+
+        items = list(entry["names"].items())
+        if in_import:
+            # submodules can be imported also when the package doesn't import them
+            items += [
+                (name, ["module", None, None])
+                for name in entry["submodules"]
+                if name not in entry["names"]
+            ]
+
+        return _create_completions(items, prefix, module_name + ".", in_import)
+
+
+def _create_completions(
+    items: List[Tuple[str, NameInfo]], prefix: str, full_name_prefix: str, in_import: bool
+) -> List[CompletionInfo]:
+    if not prefix.startswith("_"):
+        items = [item for item in items if not item[0].startswith("_")]
+
+    result = []
+    for name, (type_, signature, summary) in items:
+        if not name.lower().startswith(prefix.lower()):
+            continue
+
+        if type_ == "function" and not in_import:
+            name_with_symbols = name + ("()" if signature == "()" else "(")
+        else:
+            name_with_symbols = name
+
+        result.append(
+            CompletionInfo(
+                name=name,
+                name_with_symbols=name_with_symbols,
+                full_name=full_name_prefix + name,
+                type=type_,
+                prefix_length=len(prefix),
+                signatures=None,
+                docstring=summary,
+                module_name=full_name_prefix.rstrip(".") or name,
+                module_path=None,
+            )
+        )
+
+    return sorted(result, key=lambda c: (c.name.startswith("_"), c.name.lower()))
+
+
+def _get_imported_modules(lines: List[str]) -> Dict[str, str]:
+    """Maps the names bound by import statements to module names"""
+    result = {}
+    for line in lines:
+        if "import" not in line:
+            continue
+        match = _IMPORT_STATEMENT_REGEX.match(line)
+        if not match:
+            continue
+
+        for part in match.group(1).split(","):
+            words = part.split()
+            if len(words) == 3:
+                result[words[2]] = words[0]
+            else:
+                name = words[0].split(".")[0]
+                result[name] = name
+
+    return result
+
+
+def _load_sources(index_path: str, sys_path: List[str]) -> Dict[str, Dict[str, Any]]:
+    try:
+        with open(index_path, encoding="utf-8") as fp:
+            data = json.load(fp)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError):
+        logger.exception("Could not load completion index %s", index_path)
+        return {}
+
+    if data.get("format") != INDEX_FORMAT_VERSION or data.get("sys_path") != sys_path:
+        return {}
+
+    return data["sources"]
+
+
+def _save_sources(index_path: str, sys_path: List[str], sources: Dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    data = {"format": INDEX_FORMAT_VERSION, "sys_path": sys_path, "sources": sources}
+    # front-end may read the index meanwhile
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fp:
+        json.dump(data, fp, separators=(",", ":"))
+    os.replace(tmp_path, index_path)
+    logger.info("Saved completion index %s", index_path)
+
+
+def _iter_sources(path_entry: str) -> Iterator[Tuple[str, str, Dict[str, Optional[str]]]]:
+    """Yields key, fingerprint and module files (by module name) of each distribution and
+    each module not belonging to a distribution.
+
+    Extension modules are represented by None, as they can't be analyzed statically."""
+    try:
+        dir_names = sorted(os.listdir(path_entry))
+    except OSError:
+        # not existing or a zip file
+        return
+
+    distributed_names = set()
+    for dir_name in dir_names:
+        if not dir_name.endswith(".dist-info"):
+            continue
+
+        dist_path = os.path.join(path_entry, dir_name)
+        try:
+            with open(os.path.join(dist_path, "RECORD"), "rb") as fp:
+                record = fp.read()
+        except OSError:
+            continue
+
+        module_files = {}
+        for top_name in _get_record_top_names(record):
+            module = _get_module_for_dir_entry(path_entry, top_name)
+            if module is not None:
+                module_files[module[0]] = module[1]
+
+        distributed_names.update(module_files)
+        yield dist_path, hashlib.sha1(record).hexdigest(), module_files
+
+    for dir_name in dir_names:
+        module = _get_module_for_dir_entry(path_entry, dir_name)
+        if module is None or module[0] in distributed_names:
+            continue
+
+        path = os.path.join(path_entry, dir_name)
+        try:
+            fingerprint = _get_file_fingerprint(path)
+            if module[1] is not None and module[1] != path:
+                # package dir's mtime tells only whether modules were added or removed
+                fingerprint += ":" + _get_file_fingerprint(module[1])
+        except OSError:
+            continue
+
+        yield path, fingerprint, {module[0]: module[1]}
+
+
+def _get_file_fingerprint(path: str) -> str:
+    stat = os.stat(path)
+    return "%d:%d" % (stat.st_mtime_ns, stat.st_size)
+
+
+def _get_record_top_names(record: bytes) -> List[str]:
+    result = []
+    for line in record.decode("utf-8", errors="replace").splitlines():
+        top_name = line.split(",")[0].split("/")[0]
+        if (
+            top_name
+            and top_name not in result
+            and not top_name.startswith(".")
+            and not top_name.endswith(".dist-info")
+            and top_name != "__pycache__"
+        ):
+            result.append(top_name)
+    return result
+
+
+def _get_module_for_dir_entry(dir_path: str, name: str) -> Optional[Tuple[str, Optional[str]]]:
+    """Returns module name and the file to analyze (None for extension modules)"""
+    path = os.path.join(dir_path, name)
+    if name.endswith(".py"):
+        if name[:-3].isidentifier() and os.path.isfile(path):
+            return name[:-3], path
+    elif name.endswith((".so", ".pyd")):
+        module_name = name.split(".")[0]
+        if module_name.isidentifier():
+            return module_name, None
+    elif name.isidentifier():
+        init_path = os.path.join(path, "__init__.py")
+        if os.path.isfile(init_path):
+            return name, init_path
+
+    return None
+
+
+def _index_module(path_entry: str, name: str, module_file: Optional[str]) -> Dict[str, Any]:
+    entry = {"doc": None, "names": {}, "submodules": []}
+    if module_file is None:
+        return entry
+
+    collector = _NameCollector(path_entry, name)
+    entry["names"] = collector.get_public_names(module_file, 0)
+    entry["doc"] = collector.get_summary(module_file)
+
+    if os.path.basename(module_file) == "__init__.py":
+        package_dir = os.path.dirname(module_file)
+        try:
+            dir_names = sorted(os.listdir(package_dir))
+        except OSError:
+            dir_names = []
+        for dir_name in dir_names:
+            module = _get_module_for_dir_entry(package_dir, dir_name)
+            if module is not None and module[0] != "__init__":
+                entry["submodules"].append(module[0])
+
+    return entry
+
+
+class _NameCollector:
+    """Collects the public top-level names of the modules of a top-level module or package"""
+
+    def __init__(self, path_entry: str, top_name: str):
+        self._path_entry = path_entry
+        self._top_name = top_name
+        self._trees = {}  # type: Dict[str, Optional[ast.Module]]
+        self._public_names = {}  # type: Dict[str, Dict[str, NameInfo]]
+
+    def get_summary(self, module_file: str) -> Optional[str]:
+        tree = self._get_tree(module_file)
+        return None if tree is None else _get_summary(tree)
+
+    def get_public_names(self, module_file: str, depth: int) -> Dict[str, NameInfo]:
+        if module_file in self._public_names:
+            return self._public_names[module_file]
+
+        # guards against import cycles
+        self._public_names[module_file] = {}
+
+        tree = self._get_tree(module_file)
+        if tree is None:
+            return {}
+
+        names = {}  # type: Dict[str, NameInfo]
+        all_names = None
+        for node in _iter_toplevel_statements(tree.body):
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                names[node.name] = ["function", _format_signature(node.args), _get_summary(node)]
+            elif isinstance(node, ast.ClassDef):
+                names[node.name] = ["class", _get_class_signature(node), _get_summary(node)]
+            elif isinstance(node, ast.Assign):
+                for target in node.targets:
+                    if isinstance(target, ast.Name) and target.id == "__all__":
+                        all_names = _get_literal_strings(node.value)
+                    for name in _get_target_names(target):
+                        names[name] = ["statement", None, None]
+            elif isinstance(node, ast.AugAssign):
+                if isinstance(node.target, ast.Name) and node.target.id == "__all__":
+                    all_names = (all_names or []) + (_get_literal_strings(node.value) or [])
+            elif isinstance(node, ast.AnnAssign) and isinstance(node.target, ast.Name):
+                names[node.target.id] = ["statement", None, None]
+            elif isinstance(node, ast.Import):
+                for alias in node.names:
+                    names[alias.asname or alias.name.split(".")[0]] = ["module", None, None]
+            elif isinstance(node, ast.ImportFrom):
+                names.update(self._get_imported_names(module_file, node, depth))
+
+        if all_names is not None:
+            result = {name: names.get(name, ["statement", None, None]) for name in all_names}
+        else:
+            result = {name: info for name, info in names.items() if not name.startswith("_")}
+
+        self._public_names[module_file] = result
+        return result
+
+    def _get_imported_names(
+        self, module_file: str, node: ast.ImportFrom, depth: int
+    ) -> Dict[str, NameInfo]:
+        base_dir, parts = self._get_import_base(module_file, node)
+        if base_dir is None:
+            target_file = None
+        else:
+            target_file = _find_module_file(base_dir, parts)
+
+        if target_file is not None and depth < MAX_IMPORT_DEPTH:
+            target_names = self.get_public_names(target_file, depth + 1)
+        else:
+            target_names = {}
+
+        result = {}
+        for alias in node.names:
+            if alias.name == "*":
+                result.update(target_names)
+            elif alias.name in target_names:
+                result[alias.asname or alias.name] = target_names[alias.name]
+            elif base_dir is not None and _find_module_file(base_dir, parts + [alias.name]):
+                result[alias.asname or alias.name] = ["module", None, None]
+            else:
+                result[alias.asname or alias.name] = ["statement", None, None]
+
+        return result
+
+    def _get_import_base(
+        self, module_file: str, node: ast.ImportFrom
+    ) -> Tuple[Optional[str], List[str]]:
+        """Returns the dir and the name parts of the imported module, if it's in the same
+        top-level package"""
+        parts = node.module.split(".") if node.module else []
+        if node.level:
+            base_dir = os.path.dirname(module_file)
+            for _ in range(node.level - 1):
+                base_dir = os.path.dirname(base_dir)
+            return base_dir, parts
+        elif parts and parts[0] == self._top_name:
+            return self._path_entry, parts
+        else:
+            return None, parts
+
+    def _get_tree(self, module_file: str) -> Optional[ast.Module]:
+        if module_file not in self._trees:
+            self._trees[module_file] = _parse_module(module_file)
+        return self._trees[module_file]
+
+
+def _parse_module(module_file: str) -> Optional[ast.Module]:
+    try:
+        if os.path.getsize(module_file) > MAX_MODULE_FILE_SIZE:
+            return None
+        with open(module_file, "rb") as fp:
+            return ast.parse(fp.read(), module_file)
+    except (OSError, SyntaxError, ValueError):
+        logger.debug("Could not parse %s", module_file, exc_info=True)
+        return None
+
+
+def _find_module_file(base_dir: str, parts: List[str]) -> Optional[str]:
+    if not parts:
+        return None
+
+    path = os.path.join(base_dir, *parts)
+    if os.path.isfile(path + ".py"):
+        return path + ".py"
+
+    init_path = os.path.join(path, "__init__.py")
+    if os.path.isfile(init_path):
+        return init_path
+
+    return None
+
+
+def _iter_toplevel_statements(statements: List[ast.stmt]) -> Iterator[ast.stmt]:
+    """Includes also the statements in top-level if-s and try-s"""
+    for node in statements:
+        if isinstance(node, ast.If):
+            yield from _iter_toplevel_statements(node.body)
+            yield from _iter_toplevel_statements(node.orelse)
+        elif isinstance(node, ast.Try):
+            yield from _iter_toplevel_statements(node.body)
+            for handler in node.handlers:
+                yield from _iter_toplevel_statements(handler.body)
+            yield from _iter_toplevel_statements(node.orelse)
+            yield from _iter_toplevel_statements(node.finalbody)
+        else:
+            yield node
+
+
+def _get_target_names(target: ast.expr) -> List[str]:
+    if isinstance(target, ast.Name):
+        return [target.id]
+    elif isinstance(target, (ast.Tuple, ast.List)):
+        return [name for elt in target.elts for name in _get_target_names(elt)]
+    else:
+        return []
+
+
+def _get_literal_strings(node: ast.expr) -> Optional[List[str]]:
+    if not isinstance(node, (ast.List, ast.Tuple)):
+        return None
+
+    result = []
+    for elt in node.elts:
+        if isinstance(elt, ast.Constant) and isinstance(elt.value, str):
+            result.append(elt.value)
+    return result
+
+
+def _format_signature(args: ast.arguments, skip_first: bool = False) -> str:
+    posonlyargs = getattr(args, "posonlyargs", [])
+    parts = [arg.arg for arg in posonlyargs + args.args]
+    if posonlyargs:
+        parts.insert(len(posonlyargs), "/")
+    if skip_first and parts:
+        del parts[0]
+    if args.vararg:
+        parts.append("*" + args.vararg.arg)
+    elif args.kwonlyargs:
+        parts.append("*")
+    parts += [arg.arg for arg in args.kwonlyargs]
+    if args.kwarg:
+        parts.append("**" + args.kwarg.arg)
+    return "(" + ", ".join(parts) + ")"
+
+
+def _get_class_signature(node: ast.ClassDef) -> Optional[str]:
+    for child in node.body:
+        if isinstance(child, ast.FunctionDef) and child.name == "__init__":
+            return _format_signature(child.args, skip_first=True)
+    return None
+
+
+def _get_summary(node: ast.AST) -> Optional[str]:
+    try:
+        docstring = ast.get_docstring(node)
+    except Exception:
+        return None
+
+    if not docstring:
+        return None
+
+    for line in docstring.splitlines():
+        if line.strip():
+            return line.strip()[:MAX_SUMMARY_LENGTH]
+
+    return None
@@ -0,0 +1,170 @@
+"""
+Keeps the text of an editor in a form, which is convenient for the analyzers (paren matcher,
+locals marker, outline etc.).
+
+The document gets updated by the insertions and deletions of the text widget (see
+CodeViewText), so that the analyzers don't need to read the whole text from the widget.
+The parso tree of the document is computed on demand and reused until the next edit.
+Consecutive trees are produced by parso's diff parser, which reparses only the changed part.
+
+Recent changes are logged, so that a copy of the document (eg. in the back-end) can be brought
+up to date by sending only the changes (see get_changes_since and apply_changes).
+"""
+import collections
+import itertools
+from logging import getLogger
+from pathlib import Path
+from typing import Deque, Iterator, List, Optional, Tuple
+
+logger = getLogger(__name__)
+
+_pseudo_path_counter = itertools.count(1)
+
+MAX_LOGGED_CHANGES = 1000
+
+# (version after the change, lineno1, col1, lineno2, col2, inserted text).
+# Insertion has equal start and end, deletion has empty text.
+Change = Tuple[int, int, int, int, int, str]
+
+
+class Document:
+    def __init__(self, source: str = "", version: int = 0):
+        self._lines = source.split("\n")  # type: List[str]
+        self._version = version
+        self._changes = collections.deque(maxlen=MAX_LOGGED_CHANGES)  # type: Deque[Change]
+        self._source = source  # type: Optional[str]
+        self._tree = None
+        self._tree_version = None
+        self._grammar = None
+        # identifies the document in parso's cache of diff parser
+        self._pseudo_path = "<thonny-document-%d>" % next(_pseudo_path_counter)
+
+    def get_version(self) -> int:
+        """Increases with each change"""
+        return self._version
+
+    def get_source(self) -> str:
+        if self._source is None:
+            self._source = "\n".join(self._lines)
+        return self._source
+
+    def get_lines(self) -> List[str]:
+        """Lines without line breaks. Caller must not modify the list."""
+        return self._lines
+
+    def get_line_count(self) -> int:
+        return len(self._lines)
+
+    def get_end_position(self) -> Tuple[int, int]:
+        return len(self._lines), len(self._lines[-1])
+
+    def set_source(self, source: str) -> None:
+        self._lines = source.split("\n")
+        self._source = source
+        self._version += 1
+        self._changes.clear()
+
+    def insert(self, lineno: int, col: int, chars: str) -> None:
+        lineno, col = self._normalize_position(lineno, col)
+        line = self._lines[lineno - 1]
+        self._lines[lineno - 1 : lineno] = (line[:col] + chars + line[col:]).split("\n")
+        self._source = None
+        self._version += 1
+        self._changes.append((self._version, lineno, col, lineno, col, chars))
+
+    def delete(self, lineno1: int, col1: int, lineno2: int, col2: int) -> None:
+        lineno1, col1 = self._normalize_position(lineno1, col1)
+        lineno2, col2 = self._normalize_position(lineno2, col2)
+        if (lineno2, col2) <= (lineno1, col1):
+            return
+
+        new_line = self._lines[lineno1 - 1][:col1] + self._lines[lineno2 - 1][col2:]
+        self._lines[lineno1 - 1 : lineno2] = [new_line]
+        self._source = None
+        self._version += 1
+        self._changes.append((self._version, lineno1, col1, lineno2, col2, ""))
+
+    def get_changes_since(self, version: int) -> Optional[List[Change]]:
+        """Returns None if the changes since given version are not logged anymore"""
+        if version == self._version:
+            return []
+        if version > self._version or not self._changes or self._changes[0][0] > version + 1:
+            return None
+        return [change for change in self._changes if change[0] > version]
+
+    def apply_changes(self, changes: List[Change]) -> bool:
+        """Applies the changes given by get_changes_since of another copy of this document.
+
+        Changes, which are already applied, are skipped. Returns False, if the remaining
+        changes don't continue from current version.
+        """
+        changes = [change for change in changes if change[0] > self._version]
+        if changes and changes[0][0] != self._version + 1:
+            return False
+
+        for version, lineno1, col1, lineno2, col2, chars in changes:
+            if chars:
+                self.insert(lineno1, col1, chars)
+            else:
+                self.delete(lineno1, col1, lineno2, col2)
+            self._version = version
+
+        return True
+
+    def _normalize_position(self, lineno: int, col: int) -> Tuple[int, int]:
+        # like Tk, consider positions after the last line as the end of the text
+        if lineno > len(self._lines):
+            return self.get_end_position()
+        return lineno, min(col, len(self._lines[lineno - 1]))
+
+    def get_tree(self):
+        """Returns parso module for current source.
+
+        NB! Consecutive calls may return the same module object, which has been updated
+        in place, therefore the nodes shouldn't be kept between the versions.
+        """
+        if self._tree_version != self._version:
+            self._tree = self._parse()
+            self._tree_version = self._version
+        return self._tree
+
+    def _parse(self):
+        import parso
+
+        if self._grammar is None:
+            self._grammar = parso.load_grammar()
+
+        source = self.get_source()
+        try:
+            return self._grammar.parse(source, diff_cache=True, path=self._pseudo_path)
+        except Exception:
+            logger.exception("Diff parser failed, parsing from scratch")
+            self._forget_tree()
+            return self._grammar.parse(source)
+
+    def iter_leaves(self, start: Tuple[int, int], end: Tuple[int, int]) -> Iterator:
+        """Yields the leaves of the tree, which start in given range"""
+        tree = self.get_tree()
+        start = max(start, (1, 0))
+        if start >= tree.end_pos:
+            return
+
+        leaf = tree.get_leaf_for_position(start, include_prefixes=True)
+        while leaf is not None and leaf.start_pos < end:
+            if leaf.start_pos >= start:
+                yield leaf
+            leaf = leaf.get_next_leaf()
+
+    def close(self) -> None:
+        """Releases the resources held by the diff parser"""
+        self._forget_tree()
+        self._tree = None
+        self._tree_version = None
+
+    def _forget_tree(self) -> None:
+        if self._grammar is None:
+            return
+
+        from parso.cache import parser_cache
+
+        parser_cache.get(self._grammar._hashed, {}).pop(Path(self._pseudo_path), None)
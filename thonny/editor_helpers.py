@@ -1,7 +1,7 @@
 import tkinter as tk
 import traceback
 from logging import getLogger
-from typing import List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 from thonny import get_workbench
 from thonny.codeview import CodeViewText, SyntaxText, get_syntax_options_for_tag
@@ -16,6 +16,10 @@ all_boxes = []
 
 a_box_is_appearing = False
 
+# versions of editor documents, which the back-end has confirmed to have, by session id
+_backend_document_versions = {}  # type: Dict[str, int]
+_tracking_backend_document_versions = False
+
 logger = getLogger(__name__)
 
 
@@ -372,3 +376,84 @@ def get_relevant_source_and_cursor_position(text: SyntaxText) -> Tuple[str, int,
     else:
         row, col = get_cursor_position(text)
         return text.get("1.0", "end-1c"), row, col
+
+
+def get_analysis_args(text: SyntaxText) -> Dict[str, Any]:
+    """Returns the source, cursor position and filename arguments for an analysis command.
+
+    For editors, the source is given as the changes since the version of the document, which
+    the back-end already has, if possible.
+    """
+    if isinstance(text, CodeViewText):
+        row, column = get_cursor_position(text)
+        args = _get_document_args(text)
+    else:
+        source, row, column = get_relevant_source_and_cursor_position(text)
+        args = {"source": source}
+
+    args.update(row=row, column=column, filename=get_text_filename(text))
+    return args
+
+
+def analysis_response_is_current(msg, text: SyntaxText) -> bool:
+    """Tells whether the response was computed for current source and cursor position"""
+    if isinstance(text, CodeViewText):
+        row, column = get_cursor_position(text)
+        if (
+            msg.get("session_id") != str(text)
+            or msg.get("document_version") != text.get_document().get_version()
+        ):
+            return False
+    else:
+        source, row, column = get_relevant_source_and_cursor_position(text)
+        if msg.get("source") != source:
+            return False
+
+    return msg.get("row") == row and msg.get("column") == column
+
+
+def _get_document_args(text: CodeViewText) -> Dict[str, Any]:
+    global _tracking_backend_document_versions
+    if not _tracking_backend_document_versions:
+        get_workbench().bind("InlineResponse", _update_backend_document_version, True)
+        get_workbench().bind("BackendRestart", _forget_backend_document_versions, True)
+        _tracking_backend_document_versions = True
+
+    document = text.get_document()
+    session_id = str(text)
+    args = {
+        "session_id": session_id,
+        "document_version": document.get_version(),
+        # allows reusing the responses computed for the same content (see AnalysisWorkerPool)
+        "source_hash": hash(document.get_source()),
+    }
+
+    backend_version = _backend_document_versions.get(session_id)
+    if backend_version is None:
+        changes = None
+    else:
+        changes = document.get_changes_since(backend_version)
+
+    if changes is None:
+        args["source"] = document.get_source()
+    else:
+        args["changes"] = changes
+
+    return args
+
+
+def _update_backend_document_version(msg) -> None:
+    session_id = msg.get("session_id")
+    if session_id is None or msg.get("from_cache"):
+        return
+
+    version = msg.get("document_version")
+    if version is None:
+        # back-end has forgotten the document, next command needs to send whole source
+        _backend_document_versions.pop(session_id, None)
+    else:
+        _backend_document_versions[session_id] = version
+
+
+def _forget_backend_document_versions(event=None) -> None:
+    _backend_document_versions.clear()
@@ -1204,6 +1204,19 @@ def get_current_breakpoints():
     return result
 
 
+def get_current_breakpoint_options():
+    result = {}
+
+    for editor in get_workbench().get_editor_notebook().get_all_editors():
+        filename = editor.get_filename()
+        if filename:
+            options = editor.get_code_view().get_breakpoint_options()
+            if options:
+                result[filename] = options
+
+    return result
+
+
 def get_saved_current_script_filename(force=True):
     editor = get_workbench().get_editor_notebook().get_current_editor()
     if not editor:
@@ -26,6 +26,8 @@ def parse_object_id(object_id_repr):
 class MemoryFrame(TreeFrame):
     def __init__(self, master, columns, show_statusbar=False):
         TreeFrame.__init__(self, master, columns, show_statusbar=show_statusbar)
+        # generations of the shown ids, so that the back-end can tell whether the id is reused
+        self._object_generations = {}
 
         font = tk_font.nametofont("TkDefaultFont").copy()
         font.configure(underline=True)
@@ -37,7 +39,11 @@ class MemoryFrame(TreeFrame):
     def show_selected_object_info(self):
         object_id = self.get_object_id()
         if object_id is not None:
-            get_workbench().event_generate("ObjectSelect", object_id=object_id)
+            get_workbench().event_generate(
+                "ObjectSelect",
+                object_id=object_id,
+                generation=self._object_generations.get(object_id, None),
+            )
 
     def get_object_id(self):
         iid = self.tree.focus()
@@ -55,6 +61,7 @@ class MemoryFrame(TreeFrame):
 class VariablesFrame(MemoryFrame):
     def __init__(self, master):
         MemoryFrame.__init__(self, master, ("name", "id", "value"))
+        self._rows = {}  # (group title, name) -> (node id, values)
 
         self.tree.column("name", width=120, anchor=tk.W, stretch=False)
         self.tree.column("id", width=450, anchor=tk.W, stretch=True)
@@ -89,9 +96,10 @@ class VariablesFrame(MemoryFrame):
             # self.tree.columnconfigure(2, weight=1, width=400)
 
     def update_variables(self, all_variables):
-        self._clear_tree()
-
+        """Patches the rows in place, so that steps with few changes remain cheap
+        even for namespaces with thousands of names"""
         if not all_variables:
+            self._clear_tree()
             return
 
         if isinstance(all_variables, list):
@@ -99,24 +107,49 @@ class VariablesFrame(MemoryFrame):
         else:
             groups = [("", all_variables)]
 
+        rows = []
+        self._object_generations = {}
         for group_title, variables in groups:
             if group_title:
-                node_id = self.tree.insert("", "end", tags=("group_title",))
-                self.tree.set(node_id, "name", group_title)
+                rows.append(((group_title, None), "group_title", (group_title, "", "")))
 
             for name in sorted(variables.keys()):
                 if not name.startswith("__"):
-                    node_id = self.tree.insert("", "end", tags="item")
-                    self.tree.set(node_id, "name", name)
                     if isinstance(variables[name], ValueInfo):
                         description = variables[name].repr
                         id_str = variables[name].id
+                        self._object_generations[id_str] = variables[name].generation
                     else:
                         description = variables[name]
                         id_str = None
 
-                    self.tree.set(node_id, "id", format_object_id(id_str))
-                    self.tree.set(node_id, "value", description)
+                    values = (name, format_object_id(id_str) or "", description)
+                    rows.append(((group_title, name), "item", values))
+
+        self._patch_rows(rows)
+
+    def _patch_rows(self, rows):
+        # Rows of both sides are ordered the same way, therefore the surviving rows are
+        # already in correct order and new rows can be inserted at their final index.
+        wanted_keys = {key for key, _, _ in rows}
+        for key in list(self._rows):
+            if key not in wanted_keys:
+                self.tree.delete(self._rows.pop(key)[0])
+
+        for index, (key, tag, values) in enumerate(rows):
+            if key in self._rows:
+                node_id, current_values = self._rows[key]
+                if current_values != values:
+                    self.tree.item(node_id, values=values)
+                    self._rows[key] = (node_id, values)
+            else:
+                node_id = self.tree.insert("", index, tags=(tag,), values=values)
+                self._rows[key] = (node_id, values)
+
+    def _clear_tree(self):
+        self._rows = {}
+        self._object_generations = {}
+        MemoryFrame._clear_tree(self)
 
     def on_select(self, event):
         self.show_selected_object_info()
@@ -0,0 +1,188 @@
+"""
+Keeps the Shell text, which has been moved out of the text widget.
+
+The store behaves like a stack of lines. Text discarded from the top of the widget gets appended
+to the end of the store and the last lines of the store get taken back, when the user scrolls
+to the top of the widget. This way the widget holds only the part of the output around the
+viewport, while the whole output is still available for searching and saving.
+
+Text is kept utf-8 encoded, first in memory and after exceeding the memory limit in an anonymous
+temporary file, which is read via mmap.
+"""
+import mmap
+import tempfile
+from contextlib import nullcontext
+from logging import getLogger
+from typing import Iterator, Optional
+
+logger = getLogger(__name__)
+
+DEFAULT_MEMORY_LIMIT = 16 * 1024 * 1024
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+class OutputStore:
+    def __init__(self, memory_limit: int = DEFAULT_MEMORY_LIMIT):
+        self._memory_limit = memory_limit
+        self._buffer = bytearray()
+        self._file = None
+        self._size = 0
+        self._newline_count = 0
+
+    def __len__(self):
+        """Number of bytes in the store"""
+        return self._size
+
+    def get_line_count(self) -> int:
+        if self._size and not self._ends_with_newline():
+            return self._newline_count + 1
+        return self._newline_count
+
+    def append(self, text: str) -> None:
+        if not text:
+            return
+
+        self._append_data(text.encode("utf-8", errors="replace"))
+
+    def _append_data(self, data: bytes) -> None:
+        self._newline_count += data.count(b"\n")
+        self._size += len(data)
+
+        if self._file is None:
+            self._buffer += data
+            if len(self._buffer) > self._memory_limit:
+                self._move_to_file()
+        else:
+            self._file.seek(0, 2)
+            self._file.write(data)
+
+    def pop_lines(self, count: int) -> str:
+        """Removes and returns the last count lines (the last line may be incomplete)"""
+        if not self._size or count <= 0:
+            return ""
+
+        with self._open_data() as data:
+            search_end = self._size - 1 if data[self._size - 1] == ord("\n") else self._size
+            start = search_end
+            for _ in range(count):
+                start = data.rfind(b"\n", 0, search_end)
+                if start == -1:
+                    start = 0
+                    break
+                start += 1
+                search_end = start - 1
+
+            result = bytes(data[start : self._size])
+
+        self._truncate(start)
+        self._newline_count -= result.count(b"\n")
+        return result.decode("utf-8", errors="replace")
+
+    def split_off(self, line: int) -> "OutputStore":
+        """Removes the lines starting from given (0-based) line and returns them as a new store"""
+        result = OutputStore(self._memory_limit)
+        if line >= self.get_line_count():
+            return result
+
+        with self._open_data() as data:
+            start = 0
+            for _ in range(line):
+                start = data.find(b"\n", start) + 1
+
+            pos = start
+            while pos < self._size:
+                end = min(pos + READ_CHUNK_SIZE, self._size)
+                result._append_data(bytes(data[pos:end]))
+                pos = end
+
+        self._truncate(start)
+        self._newline_count -= result._newline_count
+        return result
+
+    def iter_chunks(self, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[str]:
+        if not self._size:
+            return
+
+        with self._open_data() as data:
+            start = 0
+            while start < self._size:
+                end = min(start + chunk_size, self._size)
+                if end < self._size:
+                    # don't cut in the middle of a multi-byte char
+                    while end > start and data[end] & 0xC0 == 0x80:
+                        end -= 1
+                yield bytes(data[start:end]).decode("utf-8", errors="replace")
+                start = end
+
+    def get_text(self) -> str:
+        return "".join(self.iter_chunks())
+
+    def find_line(self, needle: str, start_line: int = 0) -> Optional[int]:
+        """Returns the (0-based) number of the first line from start_line containing the needle"""
+        if not self._size or not needle:
+            return None
+
+        encoded_needle = needle.encode("utf-8")
+        with self._open_data() as data:
+            start = 0
+            for _ in range(start_line):
+                start = data.find(b"\n", start) + 1
+                if start == 0:
+                    return None
+
+            pos = data.find(encoded_needle, start)
+            if pos == -1:
+                return None
+
+            return start_line + _count_newlines(data, start, pos)
+
+    def clear(self) -> None:
+        self._buffer = bytearray()
+        self._size = 0
+        self._newline_count = 0
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self) -> None:
+        self.clear()
+
+    def _ends_with_newline(self) -> bool:
+        with self._open_data() as data:
+            return data[self._size - 1] == ord("\n")
+
+    def _move_to_file(self) -> None:
+        logger.info("Moving %d bytes of Shell output to a temporary file", len(self._buffer))
+        self._file = tempfile.TemporaryFile(prefix="thonny-shell-")
+        self._file.write(self._buffer)
+        self._file.flush()
+        self._buffer = bytearray()
+
+    def _truncate(self, size: int) -> None:
+        self._size = size
+        if self._file is None:
+            del self._buffer[size:]
+        else:
+            self._file.truncate(size)
+            if size <= self._memory_limit // 2:
+                self._file.seek(0)
+                self._buffer = bytearray(self._file.read(size))
+                self._file.close()
+                self._file = None
+
+    def _open_data(self):
+        if self._file is None:
+            return nullcontext(self._buffer)
+
+        self._file.flush()
+        return mmap.mmap(self._file.fileno(), self._size, access=mmap.ACCESS_READ)
+
+
+def _count_newlines(data, start: int, end: int) -> int:
+    # mmap doesn't have count
+    result = 0
+    while start < end:
+        chunk_end = min(start + READ_CHUNK_SIZE, end)
+        result += data[start:chunk_end].count(b"\n")
+        start = chunk_end
+    return result
@@ -56,7 +56,7 @@ class AstView(ui_utils.TreeFrame):
             return
 
         new_cw = editor.get_code_view()
-        new_source = new_cw.get_content()
+        new_source = new_cw.text.get_document().get_source()
         if self._current_code_view == new_cw and self._current_source == new_source:
             return
 
@@ -403,10 +403,6 @@ class Completer:
             self._completions_box.hide()
 
     def _check_trigger_keypress(self, event: tk.Event) -> None:
-        runner = get_runner()
-        if not runner or runner.is_running():
-            return
-
         if (
             control_is_pressed(event)
             or command_is_pressed(event)
@@ -418,6 +414,9 @@ class Completer:
         if not widget or not isinstance(widget, SyntaxText):
             return
 
+        if not _can_complete_in(widget):
+            return
+
         if not widget.is_python_text():
             return
 
@@ -457,28 +456,38 @@ class Completer:
         return True
 
     def request_completions_for_text(self, text: SyntaxText) -> None:
-        source, row, column = editor_helpers.get_relevant_source_and_cursor_position(text)
+        if isinstance(text, CodeViewText):
+            # jedi's response will replace these
+            self._present_indexed_completions(text)
+
         get_runner().send_command(
             InlineCommand(
                 "shell_autocomplete" if isinstance(text, ShellText) else "editor_autocomplete",
-                source=source,
-                row=row,
-                column=column,
-                filename=editor_helpers.get_text_filename(text),
+                **editor_helpers.get_analysis_args(text),
             )
         )
 
+    def _present_indexed_completions(self, text: CodeViewText) -> None:
+        index = get_runner().get_completion_index()
+        if index is None:
+            return
+
+        row, column = editor_helpers.get_cursor_position(text)
+        completions = index.get_completions(text.get_document().get_lines(), row, column)
+        if completions:
+            if not self._completions_box:
+                self._completions_box = CompletionsBox(self)
+            self._completions_box.present_completions(text, completions)
+
     def _handle_completions_response(self, msg) -> None:
         text = editor_helpers.get_active_text_widget()
         if not text:
             return
 
-        source, row, column = editor_helpers.get_relevant_source_and_cursor_position(text)
-
         if msg.get("error"):
             self._close_box()
             messagebox.showerror("Autocomplete error", msg.error, master=get_workbench())
-        elif msg.source != source or msg.row != row or msg.column != column:
+        elif not editor_helpers.analysis_response_is_current(msg, text):
             # situation has changed, information is obsolete
             # ignore this event
             return
@@ -516,12 +525,23 @@ def _is_python_name_char(c: str) -> bool:
     return c.isalnum() or c == "_"
 
 
+def _can_complete_in(text: Optional[tk.Text]) -> bool:
+    runner = get_runner()
+    if not runner:
+        return False
+
+    if isinstance(text, CodeViewText):
+        # may be answered by analysis workers while the program is running
+        return runner.is_ready_for_editor_analysis()
+
+    return not runner.is_running()
+
+
 def load_plugin() -> None:
     completer = Completer()
 
     def can_complete():
-        runner = get_runner()
-        return runner and not runner.is_running()
+        return _can_complete_in(editor_helpers.get_active_text_widget())
 
     get_workbench().add_command(
         "autocomplete",
@@ -7,7 +7,7 @@ from typing import List, Optional
 from thonny import editor_helpers, get_runner, get_workbench
 from thonny.codeview import SyntaxText
 from thonny.common import InlineCommand, SignatureInfo
-from thonny.editor_helpers import DocuBoxBase, get_active_text_widget, get_text_filename
+from thonny.editor_helpers import DocuBoxBase, get_active_text_widget
 from thonny.languages import tr
 from thonny.shell import ShellText
 from thonny.ui_utils import ems_to_pixels
@@ -89,14 +89,10 @@ class Calltipper:
         self.request_calltip_for_text(text)
 
     def request_calltip_for_text(self, text: SyntaxText) -> None:
-        source, row, column = editor_helpers.get_relevant_source_and_cursor_position(text)
         get_runner().send_command(
             InlineCommand(
                 "get_shell_calltip" if isinstance(text, ShellText) else "get_editor_calltip",
-                row=row,
-                column=column,
-                source=source,
-                filename=get_text_filename(text),
+                **editor_helpers.get_analysis_args(text),
             )
         )
 
@@ -105,12 +101,10 @@ class Calltipper:
         if not text:
             return
 
-        source, row, column = editor_helpers.get_relevant_source_and_cursor_position(text)
-
         if msg.get("error"):
             self._hide_box()
             messagebox.showerror("Calltip error", msg.error, master=get_workbench())
-        elif msg.source != source or msg.row != row or msg.column != column:
+        elif not editor_helpers.analysis_response_is_current(msg, text):
             # situation has changed, information is obsolete
             return
         elif not msg.signatures:
@@ -10,6 +10,11 @@ priorities of triple-quoted-string tags are higher and therefore user
 doesn't see these wrong taggings. In some cases (eg. open strings)
 these wrong tags are removed later.
 
+In editors the second phase doesn't search the whole text. Instead, the state of the lexer
+(whether it is inside a triple-quoted string) is remembered for the start of each line and
+after an edit the lines are lexed again only until the state matches the remembered one.
+Single-line tokens are searched only from the parts of the lines outside of triple-quoted strings.
+
 In Shell only current command entry is colored
 
 Regexes are adapted from idlelib
@@ -17,6 +22,7 @@ Regexes are adapted from idlelib
 import re
 import tkinter
 from logging import getLogger
+from typing import List, Optional, Tuple
 
 from thonny import get_workbench
 from thonny.codeview import CodeViewText
@@ -26,6 +32,160 @@ logger = getLogger(__name__)
 
 TODO = "COLOR_TODO"
 
+# state of a line, which hasn't been lexed yet
+_UNKNOWN = object()
+
+# column ranges of triple-quoted strings in a line
+Spans = List[Tuple[int, Optional[int]]]
+
+_LINE_SCAN_REGEX = re.compile(
+    r"(?P<comment>#)|(?P<string3>(?:(?<!\w)[rRbBuUfF]{1,2})?(?:\"\"\"|\'\'\'))|(?P<string>[\"\'])"
+)
+_STRING_REGEXES = {
+    '"': re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"?'),
+    "'": re.compile(r"'[^'\\]*(?:\\.[^'\\]*)*'?"),
+}
+_STRING3_END_REGEXES = {
+    '"""': re.compile(r'\\.|"""'),
+    "'''": re.compile(r"\\.|'''"),
+}
+
+
+def lex_line(line: str, state: Optional[str]) -> Tuple[Spans, Optional[str]]:
+    """Finds the triple-quoted strings in a line (without the line break).
+
+    State is None or the delimiter of the triple-quoted string, which is open at the start (or
+    end) of the line. Returns the column ranges of the triple-quoted strings (end is None, if
+    the string continues on the next line) and the state at the end of the line.
+    """
+    spans = []
+    pos = 0
+    if state is not None:
+        end = _find_string3_end(line, 0, state)
+        if end is None:
+            return [(0, None)], state
+        spans.append((0, end))
+        pos = end
+
+    while True:
+        match = _LINE_SCAN_REGEX.search(line, pos)
+        if match is None or match.lastgroup == "comment":
+            return spans, None
+
+        if match.lastgroup == "string":
+            pos = _STRING_REGEXES[match.group()].match(line, match.start()).end()
+        else:
+            delimiter = match.group()[-3:]
+            end = _find_string3_end(line, match.end(), delimiter)
+            spans.append((match.start(), end))
+            if end is None:
+                return spans, delimiter
+            pos = end
+
+
+def _find_string3_end(line, pos, delimiter):
+    for match in _STRING3_END_REGEXES[delimiter].finditer(line, pos):
+        if match.group() == delimiter:
+            return match.end()
+    return None
+
+
+def _get_code_segments(line, spans):
+    """Returns the column ranges outside of given triple-quoted strings"""
+    segments = []
+    pos = 0
+    for start, end in spans:
+        if start > pos:
+            segments.append((pos, start))
+        pos = len(line) if end is None else end
+
+    if pos < len(line):
+        segments.append((pos, len(line)))
+
+    return segments
+
+
+class LineStates:
+    """Remembers the state of the lexer (see lex_line) at the start of each line.
+
+    After an edit, the lines need to be lexed again only from the first modified line until
+    a line, which ends with the same state as before.
+    """
+
+    def __init__(self):
+        # state at the start of each line + state at the end of the last line
+        self._states = [None]  # type: List[object]
+        self._dirty_from = None  # type: Optional[int]
+        self._dirty_until = 0
+
+    def get_line_count(self) -> int:
+        return len(self._states) - 1
+
+    def get_state(self, lineno: int) -> Optional[str]:
+        return self._states[lineno - 1]
+
+    def reset(self, line_count: int) -> None:
+        self._states = [None] + [_UNKNOWN] * line_count
+        self._dirty_from = None
+        self.mark_dirty(1, line_count)
+
+    def adjust_line_count(self, lineno: int, line_count: int) -> None:
+        """Keeps the states of the lines after the edited line in their places"""
+        delta = line_count - self.get_line_count()
+        if delta > 0:
+            self._states[lineno:lineno] = [_UNKNOWN] * delta
+        elif delta < 0:
+            del self._states[lineno : lineno - delta]
+
+        if self._dirty_from is not None and self._dirty_until > lineno:
+            self._dirty_until = max(self._dirty_until + delta, lineno)
+        self.mark_dirty(lineno, lineno + max(delta, 0))
+
+    def mark_dirty(self, first: int, last: int) -> None:
+        if self._dirty_from is None:
+            self._dirty_from, self._dirty_until = first, last
+        else:
+            self._dirty_from = min(self._dirty_from, first)
+            self._dirty_until = max(self._dirty_until, last)
+
+    def relex(self, lines: List[str]) -> Optional[Tuple[int, List[Spans]]]:
+        """Updates the states of dirty lines and the lines affected by them.
+
+        Returns the number of first lexed line and the triple-quoted string spans of each lexed
+        line or None, if nothing was dirty.
+        """
+        if self._dirty_from is None:
+            return None
+
+        assert len(lines) == self.get_line_count()
+        first = lineno = max(self._dirty_from, 1)
+        until = min(self._dirty_until, len(lines))
+        self._dirty_from = None
+
+        spans_by_line = []
+        while lineno <= len(lines):
+            spans, end_state = lex_line(lines[lineno - 1], self._states[lineno - 1])
+            spans_by_line.append(spans)
+            converged = self._states[lineno] == end_state
+            self._states[lineno] = end_state
+            if converged and lineno >= until:
+                break
+            lineno += 1
+
+        return first, spans_by_line
+
+    def get_open_string3_start(self, lines: List[str]) -> Optional[Tuple[int, int]]:
+        """Returns the position of the triple-quoted string, which is not closed at the end"""
+        if self._states[-1] is None:
+            return None
+
+        lineno = len(self._states) - 1
+        while self._states[lineno - 1] is not None:
+            lineno -= 1
+
+        spans, _ = lex_line(lines[lineno - 1], None)
+        return lineno, spans[-1][0]
+
 
 class SyntaxColorer:
     def __init__(self, text: tkinter.Text):
@@ -261,7 +421,25 @@ class SyntaxColorer:
 
 
 class CodeViewSyntaxColorer(SyntaxColorer):
+    def __init__(self, text):
+        super().__init__(text)
+        self._line_states = LineStates()
+        self._lexed_with_coloring = None
+        self._open_string3_start = None
+
+    def mark_dirty(self, event=None):
+        super().mark_dirty(event)
+
+        sequence = getattr(event, "sequence", None)
+        if sequence in ("TextInsert", "TextDelete"):
+            index = event.index if sequence == "TextInsert" else event.index1
+            lineno = int(self.text.index(index).split(".")[0])
+            line_count = int(self.text.index("end-1c").split(".")[0])
+            self._line_states.adjust_line_count(lineno, line_count)
+
     def _update_coloring(self):
+        self._update_line_states()
+
         viewport_start = self.text.index("@0,0")
         viewport_end = self.text.index(
             "@%d,%d lineend" % (self.text.winfo_width(), self.text.winfo_height())
@@ -294,21 +472,107 @@ class CodeViewSyntaxColorer(SyntaxColorer):
             else:
                 search_start = update_end
 
-        # Multiline tokens need to be searched from the whole source
-        if self._multiline_dirty:
-            self._update_multiline_tokens("1.0", "end")
+    def _update_line_states(self):
+        lines = self.text.get_document().get_lines()
+        if self._use_coloring != self._lexed_with_coloring:
+            for tag in self.multiline_tags:
+                self.text.tag_remove(tag, "1.0", "end")
+            self._open_string3_start = None
+            self._lexed_with_coloring = self._use_coloring
+            self._line_states.reset(len(lines))
 
-        # Get rid of wrong open string tags (https://github.com/thonny/thonny/issues/943)
-        search_start = viewport_start
-        while True:
-            tag_range = self.text.tag_nextrange("open_string", search_start, viewport_end)
-            if not tag_range:
-                break
+        if not self._use_coloring:
+            return
+
+        if self._line_states.get_line_count() != len(lines):
+            logger.warning("Line states got out of sync with the text")
+            self._line_states.reset(len(lines))
+
+        relexed = self._line_states.relex(lines)
+        if relexed is None:
+            return
 
-            if "string3" in self.text.tag_names(tag_range[0]):
-                self.text.tag_remove("open_string", tag_range[0], tag_range[1])
+        first, spans_by_line = relexed
+        ranges = []
+        for lineno, spans in enumerate(spans_by_line, first):
+            for start_col, end_col in spans:
+                ranges.append("%d.%d" % (lineno, start_col))
+                if end_col is None:
+                    ranges.append("%d.0" % (lineno + 1))
+                else:
+                    ranges.append("%d.%d" % (lineno, end_col))
+
+        start_index = "%d.0" % first
+        end_index = "%d.0" % (first + len(spans_by_line))
+        self.text.tag_remove("string3", start_index, end_index)
+        if ranges:
+            self.text.tag_add("string3", *ranges)
+
+        # Single-line tokens of these lines may have got into or out of triple-quoted strings
+        self.text.tag_add(TODO, start_index, end_index)
 
-            search_start = tag_range[1]
+        open_string3_start = self._line_states.get_open_string3_start(lines)
+        if open_string3_start != self._open_string3_start:
+            self.text.tag_remove("open_string3", "1.0", "end")
+            if open_string3_start is not None:
+                self.text.tag_add("open_string3", "%d.%d" % open_string3_start, "end")
+            self._open_string3_start = open_string3_start
+
+        self._raise_tags()
+
+    def _update_uniline_tokens(self, start, end):
+        first = int(start.split(".")[0])
+        end_lineno, end_col = map(int, end.split("."))
+        lines = self.text.get_document().get_lines()
+        last = min(end_lineno if end_col > 0 else end_lineno - 1, len(lines))
+
+        # collect the ranges for adding each tag with a single call
+        ranges_by_tag = {tag: [] for tag in self.uniline_tags | {"tab"}}
+        for lineno in range(first, last + 1):
+            line = lines[lineno - 1]
+            if self._use_coloring:
+                spans, _ = lex_line(line, self._line_states.get_state(lineno))
+                for segment_start, segment_end in _get_code_segments(line, spans):
+                    self._find_uniline_tokens(
+                        line, lineno, segment_start, segment_end, ranges_by_tag
+                    )
+
+            if self._highlight_tabs:
+                col = line.find("\t")
+                while col != -1:
+                    ranges_by_tag["tab"] += ["%d.%d" % (lineno, col), "%d.%d" % (lineno, col + 1)]
+                    col = line.find("\t", col + 1)
+
+        start_index = "%d.0" % first
+        end_index = "%d.0" % (last + 1)
+        for tag, ranges in ranges_by_tag.items():
+            self.text.tag_remove(tag, start_index, end_index)
+            if ranges:
+                self.text.tag_add(tag, *ranges)
+
+        self.text.tag_remove(TODO, start_index, end_index)
+
+    def _find_uniline_tokens(self, line, lineno, start_col, end_col, ranges_by_tag):
+        for match in self.uniline_regex.finditer(line, start_col, end_col):
+            for token_type, token_text in match.groupdict().items():
+                if token_text and token_type in self.uniline_tags:
+                    token_text = token_text.strip()
+                    match_start, match_end = match.span(token_type)
+                    ranges_by_tag[token_type] += [
+                        "%d.%d" % (lineno, match_start),
+                        "%d.%d" % (lineno, match_end),
+                    ]
+
+                    # Mark also the word following def or class
+                    if token_text in ("def", "class"):
+                        id_match = self.id_regex.match(line, match_end, end_col)
+                        if id_match:
+                            id_range = ["%d.%d" % (lineno, col) for col in id_match.span(1)]
+                            ranges_by_tag["definition"] += id_range
+                            if token_text == "def":
+                                ranges_by_tag["function_definition"] += id_range
+                            else:
+                                ranges_by_tag["class_definition"] += id_range
 
 
 class ShellSyntaxColorer(SyntaxColorer):
@@ -0,0 +1,199 @@
+import linecache
+import os.path
+import tkinter as tk
+from logging import getLogger
+from tkinter import ttk
+from typing import Dict, Tuple
+
+from thonny import get_runner, get_workbench, ui_utils
+from thonny.common import decode_line_set, encode_line_set, is_same_path
+from thonny.languages import tr
+from thonny.ui_utils import ems_to_pixels
+
+logger = getLogger(__name__)
+
+MAX_ROW_COUNT = 200
+
+EXECUTED_LINE_COLOR = "#D5F0C8"
+MISSED_LINE_COLOR = "#F7CACA"
+
+
+class CoverageView(ui_utils.TreeFrame):
+    def __init__(self, master):
+        ui_utils.TreeFrame.__init__(
+            self,
+            master,
+            columns=("location", "details", "coverage", "time"),
+            displaycolumns=(0, 1, 2, 3),
+            show_statusbar=True,
+        )
+
+        self.tree.column("location", width=ems_to_pixels(12), anchor=tk.W, stretch=False)
+        self.tree.column("details", width=ems_to_pixels(20), anchor=tk.W, stretch=True)
+        self.tree.column("coverage", width=ems_to_pixels(8), anchor=tk.E, stretch=False)
+        self.tree.column("time", width=ems_to_pixels(6), anchor=tk.E, stretch=False)
+
+        self.tree.heading("location", text=tr("Location"), anchor=tk.W)
+        self.tree.heading("details", text=tr("Details"), anchor=tk.W)
+        self.tree.heading("coverage", text=tr("Coverage"), anchor=tk.E)
+        self.tree.heading("time", text=tr("Time"), anchor=tk.E)
+
+        self._mode_var = tk.StringVar(value="files")
+        for i, (mode, label) in enumerate([("files", tr("Files")), ("lines", tr("Slowest lines"))]):
+            ttk.Radiobutton(
+                self.statusbar,
+                text=label,
+                value=mode,
+                variable=self._mode_var,
+                command=self._update_tree,
+            ).grid(row=0, column=i, padx=(5, 0))
+        ttk.Checkbutton(
+            self.statusbar,
+            text=tr("Measure time per line"),
+            variable=get_workbench().get_variable("run.coverage_line_timing"),
+        ).grid(row=0, column=2, padx=(10, 0))
+        self._status_label = ttk.Label(self.statusbar)
+        self._status_label.grid(row=0, column=3, sticky="w", padx=10)
+
+        # filename -> (executed lines, missed lines, times of executed lines or None)
+        self._files = {}  # type: Dict[str, Tuple[list, list, list]]
+        self._row_locations = {}  # type: Dict[str, Tuple[str, int]]
+        self._line_timing = False
+
+        get_workbench().bind("CommandAccepted", self._on_command_accepted, True)
+        get_workbench().bind("CoverageResult", self._on_result, True)
+        get_workbench().get_editor_notebook().bind(
+            "<<NotebookTabChanged>>", self._update_shading, True
+        )
+
+    def _on_command_accepted(self, event):
+        if event.command.get("name") == "Coverage":
+            self._files = {}
+            # the sources may have changed since the last run
+            linecache.checkcache()
+            self._update_tree()
+            self._update_shading()
+            self._status_label.configure(text=tr("Running..."))
+
+    def _on_result(self, msg):
+        self._line_timing = msg.line_timing
+        self._files = {
+            filename: (
+                decode_line_set(file_result["executed"]),
+                decode_line_set(file_result.get("missed", [])),
+                file_result.get("times"),
+            )
+            for filename, file_result in msg.files.items()
+        }
+
+        executed_count = sum(len(executed) for executed, _, _ in self._files.values())
+        missed_count = sum(len(missed) for _, missed, _ in self._files.values())
+        self._status_label.configure(
+            text=tr("%d of %d lines executed") % (executed_count, executed_count + missed_count)
+            + ", %.2f s" % msg.duration
+        )
+        self._update_tree()
+        self._update_shading()
+
+    def _update_tree(self):
+        self.clear()
+        self._row_locations = {}
+        if self._mode_var.get() == "files":
+            self._show_files()
+        elif self._files and not self._line_timing:
+            self.tree.insert("", "end", values=("", tr("Time per line was not measured"), "", ""))
+        else:
+            self._show_slowest_lines()
+
+    def _show_files(self):
+        for filename in sorted(self._files):
+            executed, missed, times = self._files[filename]
+            executable_count = len(executed) + len(missed)
+            percent = len(executed) * 100 // max(executable_count, 1)
+            iid = self.tree.insert(
+                "",
+                "end",
+                values=(
+                    os.path.basename(filename),
+                    _format_line_numbers(missed),
+                    "%d/%d (%d%%)" % (len(executed), executable_count, percent),
+                    "" if times is None else _format_time(sum(times)),
+                ),
+            )
+            self._row_locations[iid] = (filename, 1)
+
+    def _show_slowest_lines(self):
+        lines = []
+        for filename, (executed, _, times) in self._files.items():
+            lines.extend(zip(times, [filename] * len(executed), executed))
+        lines.sort(reverse=True)
+
+        for line_time, filename, lineno in lines[:MAX_ROW_COUNT]:
+            iid = self.tree.insert(
+                "",
+                "end",
+                values=(
+                    "%s:%d" % (os.path.basename(filename), lineno),
+                    linecache.getline(filename, lineno).strip(),
+                    "",
+                    _format_time(line_time),
+                ),
+            )
+            self._row_locations[iid] = (filename, lineno)
+
+    def _update_shading(self, event=None):
+        for editor in get_workbench().get_editor_notebook().get_all_editors():
+            filename = editor.get_filename()
+            colors_by_line = {}
+            if filename is not None:
+                for result_filename, (executed, missed, _) in self._files.items():
+                    if is_same_path(result_filename, filename):
+                        colors_by_line.update(dict.fromkeys(executed, EXECUTED_LINE_COLOR))
+                        colors_by_line.update(dict.fromkeys(missed, MISSED_LINE_COLOR))
+            editor.get_code_view().set_gutter_shading("coverage", colors_by_line)
+
+    def on_double_click(self, event):
+        location = self._row_locations.get(self.tree.focus())
+        if location is not None and os.path.isfile(location[0]):
+            get_workbench().get_editor_notebook().show_file_at_line(*location)
+
+
+def _format_line_numbers(line_numbers):
+    """Formats line numbers as ranges, eg. 3-5, 8"""
+    encoded = encode_line_set(line_numbers)
+    return ", ".join(
+        str(first) if count == 1 else "%d-%d" % (first, first + count - 1)
+        for first, count in zip(encoded[::2], encoded[1::2])
+    )
+
+
+def _format_time(seconds):
+    if seconds < 1:
+        return "%.1f ms" % (seconds * 1000)
+    else:
+        return "%.2f s" % seconds
+
+
+def _start_coverage_enabled():
+    return (
+        get_workbench().get_editor_notebook().get_current_editor() is not None
+        and get_runner().get_backend_proxy()
+        and get_runner().get_backend_proxy().can_measure_coverage()
+    )
+
+
+def _start_coverage():
+    get_workbench().show_view("CoverageView", set_focus=False)
+    get_runner().execute_current("Coverage")
+
+
+def load_plugin() -> None:
+    get_workbench().add_view(CoverageView, tr("Coverage"), "s")
+    get_workbench().add_command(
+        "run_current_script_with_coverage",
+        "run",
+        tr("Run current script with coverage"),
+        _start_coverage,
+        tester=_start_coverage_enabled,
+        group=11,
+    )
@@ -2,19 +2,25 @@
 import ast
 import builtins
 import functools
+import hashlib
 import importlib.util
 import inspect
 import io
+import itertools
 import os.path
+import pickle
 import queue
 import re
 import site
 import subprocess
 import sys
+import threading
+import time
 import tokenize
 import traceback
 import types
 import warnings
+from collections import OrderedDict, namedtuple
 from typing import Dict, List, Optional, Tuple, Union
 
 import __main__
@@ -22,25 +28,30 @@ import thonny
 from thonny import report_time
 from thonny.backend import MainBackend, logger
 from thonny.common import (
+    BINARY_MESSAGE_FORMAT,
     OBJECT_LINK_END,
     OBJECT_LINK_START,
     REPL_PSEUDO_FILENAME,
     STRING_PSEUDO_FILENAME,
+    TEXT_MESSAGE_FORMAT,
     BackendEvent,
     CommandToBackend,
     DistInfo,
     EOFCommand,
     FrameInfo,
+    FrameSourceEncoder,
     ImmediateCommand,
     InlineCommand,
     InlineResponse,
     InputSubmission,
+    MessageDecodingError,
     MessageFromBackend,
     TextRange,
     ToplevelCommand,
     ToplevelResponse,
     UserError,
     ValueInfo,
+    VariablesDiffer,
     execute_system_command,
     execute_with_frontend_sys_path,
     get_augmented_system_path,
@@ -48,15 +59,28 @@ from thonny.common import (
     get_python_version_string,
     get_single_dir_child_data,
     path_startswith,
+    read_one_incoming_message_bytes,
     running_in_virtual_environment,
     serialize_message,
+    serialize_message_binary,
     update_system_path,
 )
+from thonny.plugins.cpython_backend.cp_heap import ObjectHeap, StaleObjectError
+from thonny.plugins.cpython_backend.cp_repr import ReprEngine
 
 _REPL_HELPER_NAME = "_thonny_repl_print"
+# Output without newline gets sent when the buffer reaches this size or gets this old (s)
+_OUTPUT_BUFFER_SIZE = 8192
+_OUTPUT_FLUSH_DELAY = 0.05
+_OBJECT_INFO_MAX_REPR_LENGTH = 1000000
 
 _CONFIG_FILENAME = os.path.join(thonny.THONNY_USER_DIR, "backend_configuration.ini")
 
+FrameSourceInfo = namedtuple(
+    "FrameSourceInfo", ["source", "firstlineno", "in_library", "source_id", "source_hash"]
+)
+_MISSING_FRAME_SOURCE_INFO = FrameSourceInfo(None, None, True, None, None)
+
 
 _backend = None
 
@@ -72,6 +96,7 @@ class MainCPythonBackend(MainBackend):
 
         self._ini = None
         self._options = options
+        self._message_format = options.get("run.message_format", TEXT_MESSAGE_FORMAT)
         self._object_info_tweakers = []
         self._warned_shadow_casters = set()
         self._import_handlers = {}
@@ -79,8 +104,14 @@ class MainCPythonBackend(MainBackend):
         self._source_preprocessors = []
         self._ast_postprocessors = []
         self._main_dir = os.path.dirname(sys.modules["thonny"].__file__)
-        self._heap = {}  # WeakValueDictionary would be better, but can't store reference to None
+        self._heap = ObjectHeap()
+        self._repr_engine = ReprEngine()
+        # Output may be sent also from user threads and OutputBuffer's thread
+        self._message_lock = threading.RLock()
+        self._variables_differ = VariablesDiffer()
         self._source_info_by_frame = {}
+        self._frame_source_cache = FrameSourceCache()
+        self._frame_source_encoder = FrameSourceEncoder()
         self._init_help()
         self._install_fake_streams()
         self._install_repl_helper()
@@ -148,12 +179,21 @@ class MainCPythonBackend(MainBackend):
         # Reading must be done synchronously
         # https://github.com/thonny/thonny/issues/1363
         self._read_one_incoming_message()
-        return self._incoming_message_queue.get()
+        msg = self._incoming_message_queue.get()
+        if isinstance(msg, CommandToBackend) and msg.get("resync_namespaces"):
+            # frontend couldn't apply some of the deltas
+            self._variables_differ.forget(msg["resync_namespaces"])
+        return msg
 
     def add_object_info_tweaker(self, tweaker):
         """Tweaker should be 2-argument function taking value and export record"""
         self._object_info_tweakers.append(tweaker)
 
+    def add_repr_provider(self, type_, provider):
+        """Provider should be 2-argument function taking value and max length and returning
+        a cheap repr for the values of this type (and its subclasses)"""
+        self._repr_engine.register_provider(type_, provider)
+
     def add_import_handler(self, module_name, handler):
         if module_name not in self._import_handlers:
             self._import_handlers[module_name] = []
@@ -251,6 +291,24 @@ class MainCPythonBackend(MainBackend):
     def _read_incoming_msg_line(self) -> str:
         return self._original_stdin.readline()
 
+    def _read_incoming_message(self) -> Optional[CommandToBackend]:
+        if self._message_format != BINARY_MESSAGE_FORMAT:
+            return super()._read_incoming_message()
+
+        while True:
+            try:
+                text, msg = read_one_incoming_message_bytes(self._original_stdin.buffer)
+            except MessageDecodingError:
+                # the broken frame has been consumed, try the next one
+                logger.exception("Could not decode incoming message")
+                continue
+            if msg is not None:
+                return msg
+            elif not text:
+                return None
+            else:
+                logger.warning("Skipping unexpected input %r", text)
+
     def _handle_user_input(self, msg: InputSubmission) -> None:
         self._input_queue.put(msg)
 
@@ -455,9 +513,21 @@ class MainCPythonBackend(MainBackend):
 
     def _cmd_FastDebug(self, cmd):
         self.switch_env_to_script_mode(cmd)
-        from thonny.plugins.cpython_backend.cp_tracers import FastTracer
+        from thonny.plugins.cpython_backend.cp_tracers import get_fast_tracer_class
+
+        return self._execute_file(cmd, get_fast_tracer_class())
+
+    def _cmd_Coverage(self, cmd):
+        self.switch_env_to_script_mode(cmd)
+        from thonny.plugins.cpython_backend.cp_tracers import get_coverage_tracer_class
+
+        return self._execute_file(cmd, get_coverage_tracer_class())
+
+    def _cmd_Profile(self, cmd):
+        self.switch_env_to_script_mode(cmd)
+        from thonny.plugins.cpython_backend.cp_profiler import SamplingProfiler
 
-        return self._execute_file(cmd, FastTracer)
+        return self._execute_file(cmd, SamplingProfiler)
 
     def _cmd_Debug(self, cmd):
         self.switch_env_to_script_mode(cmd)
@@ -582,18 +652,35 @@ class MainCPythonBackend(MainBackend):
         raise RuntimeError("Frame '{0}' not found".format(cmd.frame_id))
 
     def _cmd_get_heap(self, cmd):
+        # Heap may be big, therefore it is exported page by page
+        offset = cmd.get("offset", 0)
         result = {}
-        for key in self._heap:
-            result[key] = self.export_value(self._heap[key])
+        for object_id, value in self._heap.get_page(offset, cmd.get("limit", None)):
+            result[object_id] = self.export_value(value)
+
+        return InlineResponse(
+            "get_heap",
+            heap=result,
+            offset=offset,
+            total_count=len(self._heap),
+            stats=self._heap.get_stats(),
+        )
 
-        return InlineResponse("get_heap", heap=result)
+    def _cmd_get_heap_stats(self, cmd):
+        return {"stats": self._heap.get_stats()}
 
     def _cmd_get_object_info(self, cmd):
+        try:
+            value = self._heap.get(cmd.object_id, cmd.get("generation", None))
+            value_available = True
+        except StaleObjectError:
+            value = None
+            value_available = False
+
         if self._current_executor and self._current_executor.is_in_past():
             info = {"id": cmd.object_id, "error": "past info not available"}
 
-        elif cmd.object_id in self._heap:
-            value = self._heap[cmd.object_id]
+        elif value_available:
             attributes = {}
             if cmd.include_attributes:
                 for name in dir(value):
@@ -604,10 +691,13 @@ class MainCPythonBackend(MainBackend):
                         except Exception:
                             pass
 
-            self._heap[id(type(value))] = type(value)
+            self._heap.store(type(value))
             info = {
                 "id": cmd.object_id,
-                "repr": repr(value),
+                "generation": self._heap.get_generation(cmd.object_id),
+                "repr": self._repr_engine.repr(
+                    value, _OBJECT_INFO_MAX_REPR_LENGTH, allow_slow=True
+                ),
                 "type": str(type(value)),
                 "full_type_name": str(type(value))
                 .replace("<class '", "")
@@ -630,9 +720,9 @@ class MainCPythonBackend(MainBackend):
             ):
                 self._add_function_info(value, info)
             elif isinstance(value, (list, tuple, set)):
-                self._add_elements_info(value, info)
+                self._add_elements_info(value, info, cmd.get("items_limit", None))
             elif isinstance(value, dict):
-                self._add_entries_info(value, info)
+                self._add_entries_info(value, info, cmd.get("items_limit", None))
             elif isinstance(value, float):
                 self._add_float_info(value, info)
             elif hasattr(value, "image_data"):
@@ -649,6 +739,23 @@ class MainCPythonBackend(MainBackend):
 
         return dict(id=cmd.object_id, info=info)
 
+    def _cmd_get_object_items(self, cmd):
+        try:
+            value = self._heap.get(cmd.object_id, cmd.get("generation", None))
+        except StaleObjectError:
+            return dict(object_id=cmd.object_id, error="object info not available")
+
+        result = dict(object_id=cmd.object_id, offset=cmd.offset)
+        if isinstance(value, (list, tuple, set)):
+            result["elements"] = self._export_elements(value, cmd.offset, cmd.limit)
+        elif isinstance(value, dict):
+            result["entries"] = self._export_entries(value, cmd.offset, cmd.limit)
+        else:
+            return dict(object_id=cmd.object_id, error="object doesn't have elements")
+
+        result["items_count"] = len(value)
+        return result
+
     def _cmd_mkdir(self, cmd):
         os.mkdir(cmd.path)
 
@@ -799,15 +906,30 @@ class MainCPythonBackend(MainBackend):
         except Exception:
             pass
 
-    def _add_elements_info(self, value, info):
-        info["elements"] = []
-        for element in value:
-            info["elements"].append(self.export_value(element))
+    def _add_elements_info(self, value, info, limit):
+        # Collection may be huge, frontend asks for more with get_object_items
+        info["elements"] = self._export_elements(value, 0, limit)
+        info["items_count"] = len(value)
+
+    def _add_entries_info(self, value, info, limit):
+        info["entries"] = self._export_entries(value, 0, limit)
+        info["items_count"] = len(value)
+
+    def _export_elements(self, value, offset, limit):
+        end = None if limit is None else offset + limit
+        if isinstance(value, (list, tuple)):
+            elements = value[offset:end]
+        else:
+            elements = itertools.islice(value, offset, end)
+
+        return [self.export_value(element) for element in elements]
 
-    def _add_entries_info(self, value, info):
-        info["entries"] = []
-        for key in value:
-            info["entries"].append((self.export_value(key), self.export_value(value[key])))
+    def _export_entries(self, value, offset, limit):
+        end = None if limit is None else offset + limit
+        return [
+            (self.export_value(key), self.export_value(item))
+            for key, item in itertools.islice(value.items(), offset, end)
+        ]
 
     def _add_float_info(self, value, info):
         if not value.is_integer():
@@ -868,7 +990,7 @@ class MainCPythonBackend(MainBackend):
                 except Exception as e:
                     obj_repr = "<repr error: " + str(e) + ">"
                 print(OBJECT_LINK_START % id(obj), obj_repr, OBJECT_LINK_END, sep="")
-                self._heap[id(obj)] = obj
+                self._heap.store(obj)
                 builtins._ = obj
 
         setattr(builtins, _REPL_HELPER_NAME, _handle_repl_value)
@@ -886,6 +1008,7 @@ class MainCPythonBackend(MainBackend):
 
         # yes, both out and err will be directed to out (but with different tags)
         # this allows client to see the order of interleaving writes to stdout/stderr
+        self._output_buffer = OutputBuffer(self)
         sys.stdin = FakeInputStream(self, sys.stdin)
         sys.stdout = FakeOutputStream(self, sys.stdout, "stdout")
         sys.stderr = FakeOutputStream(self, sys.stdout, "stderr")
@@ -904,6 +1027,8 @@ class MainCPythonBackend(MainBackend):
 
     def send_message(self, msg: MessageFromBackend) -> None:
         report_time(f"Sending message {msg.event_type}")
+        # buffered output must arrive before input requests, debugger responses etc.
+        self._output_buffer.flush()
         sys.stdout.flush()
 
         if isinstance(msg, ToplevelResponse):
@@ -912,23 +1037,39 @@ class MainCPythonBackend(MainBackend):
             if "globals" not in msg:
                 msg["globals"] = self.export_globals()
 
-        self._original_stdout.write(serialize_message(msg) + "\n")
-        self._original_stdout.flush()
+        # frontend gets only changes compared to the namespaces and sources in previous messages
+        msg = self._frame_source_encoder.encode_message(msg)
+        self._write_message(self._variables_differ.encode_message(msg))
         if isinstance(msg, ToplevelResponse):
             self._check_load_jedi()
 
-    def export_value(self, value, max_repr_length=5000):
-        self._heap[id(value)] = value
-        try:
-            rep = repr(value)
-        except Exception:
-            # See https://bitbucket.org/plas/thonny/issues/584/problem-with-thonnys-back-end-obj-no
-            rep = "??? <repr error>"
+    def _write_message(self, msg: MessageFromBackend) -> None:
+        with self._message_lock:
+            self._write_message_unlocked(msg)
+
+    def _write_message_unlocked(self, msg: MessageFromBackend) -> None:
+        if self._message_format == BINARY_MESSAGE_FORMAT:
+            try:
+                data = serialize_message_binary(msg)
+            except (pickle.PicklingError, TypeError, AttributeError):
+                # Frontend understands also text messages in binary mode
+                logger.warning(
+                    "Could not serialize %s in binary format", msg.event_type, exc_info=True
+                )
+            else:
+                self._original_stdout.flush()
+                # with -u, buffer is a raw stream and may accept only part of the data
+                view = memoryview(data)
+                while view:
+                    view = view[self._original_stdout.buffer.write(view) :]
+                return
 
-        if len(rep) > max_repr_length:
-            rep = rep[:max_repr_length] + "…"
+        self._original_stdout.write(serialize_message(msg) + "\n")
+        self._original_stdout.flush()
 
-        return ValueInfo(id(value), rep)
+    def export_value(self, value, max_repr_length=5000):
+        generation = self._heap.store(value)
+        return ValueInfo(id(value), self._repr_engine.repr(value, max_repr_length), generation)
 
     def export_variables(self, variables):
         result = {}
@@ -968,7 +1109,7 @@ class MainCPythonBackend(MainBackend):
             code_name = system_frame.f_code.co_name
 
             if not relevance_checker or relevance_checker(system_frame):
-                source, firstlineno, in_library = self._get_frame_source_info(system_frame)
+                source_info = self._get_frame_source_info(system_frame)
 
                 result.insert(
                     0,
@@ -986,10 +1127,12 @@ class MainCPythonBackend(MainBackend):
                         locals=self.export_variables(system_frame.f_locals),
                         globals=self.export_variables(system_frame.f_globals),
                         freevars=system_frame.f_code.co_freevars,
-                        source=source,
+                        source=source_info.source,
+                        source_id=source_info.source_id,
+                        source_hash=source_info.source_hash,
                         lineno=system_frame.f_lineno,
-                        firstlineno=firstlineno,
-                        in_library=in_library,
+                        firstlineno=source_info.firstlineno,
+                        in_library=source_info.in_library,
                         event="line",
                         focus=TextRange(system_frame.f_lineno, 0, system_frame.f_lineno + 1, 0),
                         node_tags=None,
@@ -1040,7 +1183,7 @@ class MainCPythonBackend(MainBackend):
     def _get_frame_source_info(self, frame):
         fid = id(frame)
         if fid not in self._source_info_by_frame:
-            self._source_info_by_frame[fid] = _fetch_frame_source_info(frame)
+            self._source_info_by_frame[fid] = self._frame_source_cache.get_frame_source_info(frame)
 
         return self._source_info_by_frame[fid]
 
@@ -1129,13 +1272,17 @@ class FakeOutputStream(FakeStream):
                 data = data.decode(errors="replace")
 
             if data != "":
-                self._backend._send_output(data=data, stream_name=self._stream_name)
+                self._backend._output_buffer.write(data, self._stream_name)
                 self._processed_symbol_count += len(data)
         finally:
             self._backend._exit_io_function()
 
         return len(data)
 
+    def flush(self):
+        self._backend._output_buffer.flush()
+        self._target_stream.flush()
+
     def writelines(self, lines):
         try:
             self._backend._enter_io_function()
@@ -1144,6 +1291,67 @@ class FakeOutputStream(FakeStream):
             self._backend._exit_io_function()
 
 
+class OutputBuffer:
+    """Collects the writes to fake stdout and stderr, so that a loop of print(x, end="")
+    doesn't produce a message per call.
+
+    Complete lines get sent right away. Writes to different streams don't get merged,
+    so that their order is kept. Remaining output is sent after a short delay,
+    when a message gets sent or when the buffer fills up.
+    """
+
+    def __init__(self, backend: MainCPythonBackend):
+        self._backend = backend
+        self._lock = threading.RLock()
+        self._parts = []  # type: List[str]
+        self._size = 0
+        self._stream_name = None
+        self._pending_event = threading.Event()
+        self._flusher = None
+
+    def write(self, data: str, stream_name: str) -> None:
+        with self._lock:
+            if self._parts and stream_name != self._stream_name:
+                self._flush_unlocked()
+
+            self._stream_name = stream_name
+            self._parts.append(data)
+            self._size += len(data)
+            if "\n" in data or self._size >= _OUTPUT_BUFFER_SIZE:
+                self._flush_unlocked()
+            else:
+                self._schedule_flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_unlocked()
+
+    def _flush_unlocked(self) -> None:
+        if not self._parts:
+            return
+
+        data = "".join(self._parts)
+        self._parts = []
+        self._size = 0
+        self._backend._send_output(data=data, stream_name=self._stream_name)
+
+    def _schedule_flush(self) -> None:
+        if self._flusher is None:
+            self._flusher = threading.Thread(
+                target=self._run_flusher, name="OutputFlusher", daemon=True
+            )
+            self._flusher.start()
+
+        self._pending_event.set()
+
+    def _run_flusher(self) -> None:
+        while True:
+            self._pending_event.wait()
+            time.sleep(_OUTPUT_FLUSH_DELAY)
+            self._pending_event.clear()
+            self.flush()
+
+
 class FakeInputStream(FakeStream):
     def __init__(self, backend: MainCPythonBackend, target_stream):
         super().__init__(backend, target_stream)
@@ -1296,10 +1504,7 @@ class Executor:
                 statements = compile(module, filename, "exec")
             elif mode == "exec":
                 report_time("Before preparing ast in executor")
-                root = self._prepare_ast(source, filename, mode)
-                for func in ast_postprocessors:
-                    func(root)
-                statements = compile(root, filename, mode)
+                statements = self._compile_user_code(source, filename, ast_postprocessors)
                 report_time("After compiling ast in executor")
             else:
                 raise ValueError("Unknown mode", mode)
@@ -1317,6 +1522,12 @@ class Executor:
         """override in subclass for custom-loading user modules"""
         return None
 
+    def _compile_user_code(self, source, filename, ast_postprocessors):
+        root = self._prepare_ast(source, filename, "exec")
+        for func in ast_postprocessors:
+            func(root)
+        return compile(root, filename, "exec")
+
     def _prepare_ast(self, source, filename, mode):
         return ast.parse(source, filename, mode)
 
@@ -1344,39 +1555,79 @@ class SimpleRunner(Executor):
     pass
 
 
-def _fetch_frame_source_info(frame):
-    if frame.f_code.co_filename is None or not os.path.exists(frame.f_code.co_filename):
-        return None, None, True
+class FrameSourceCache:
+    """Keeps the sources of the exported frames.
+
+    Without the cache each export of a module frame would read and decode the whole file.
+    Entries of a file are valid as long as the modification time and size of the file don't change.
+    """
 
-    is_libra = _is_library_file(frame.f_code.co_filename)
+    def __init__(self, max_file_count: int = 100):
+        self._max_file_count = max_file_count
+        # filename -> (file signature, text of the file, source infos by code)
+        self._files = OrderedDict()  # type: OrderedDict[str, Tuple[Tuple[int, int], List, Dict]]
 
-    if frame.f_code.co_name == "<lambda>":
-        source = inspect.getsource(frame.f_code)
-        return source, frame.f_code.co_firstlineno, is_libra
-    elif frame.f_code.co_name == "<module>":
-        # inspect.getsource and getsourcelines don't help here
-        with tokenize.open(frame.f_code.co_filename) as fp:
-            return fp.read(), 1, is_libra
-    else:
-        # function or class
+    def get_frame_source_info(self, frame) -> FrameSourceInfo:
+        code = frame.f_code
         try:
-            source = inspect.getsource(frame.f_code)
+            stat = os.stat(code.co_filename)
+        except (OSError, TypeError, ValueError):
+            return _MISSING_FRAME_SOURCE_INFO
+
+        signature = (stat.st_mtime_ns, stat.st_size)
+        entry = self._files.get(code.co_filename)
+        if entry is None or entry[0] != signature:
+            # text of the file will be read only if needed
+            entry = (signature, [], {})
+            self._files[code.co_filename] = entry
+            if len(self._files) > self._max_file_count:
+                self._files.popitem(last=False)
+        else:
+            self._files.move_to_end(code.co_filename)
+
+        code_key = (code.co_name, code.co_firstlineno)
+        infos = entry[2]
+        if code_key not in infos:
+            infos[code_key] = self._fetch_source_info(code, entry[1])
 
-            # inspect.getsource is not reliable, see eg:
+        return infos[code_key]
+
+    def _fetch_source_info(self, code, file_text_holder: List[str]) -> FrameSourceInfo:
+        def get_file_text():
+            if not file_text_holder:
+                with tokenize.open(code.co_filename) as fp:
+                    file_text_holder.append(fp.read())
+            return file_text_holder[0]
+
+        if code.co_name == "<module>":
+            # inspect.getsource and getsourcelines don't help here
+            source, firstlineno = get_file_text(), 1
+        else:
+            try:
+                source, firstlineno = inspect.getsource(code), code.co_firstlineno
+            except OSError:
+                logger.exception("Problem getting source")
+                return _MISSING_FRAME_SOURCE_INFO
+
+            # inspect.getsource is not reliable for functions and classes, see eg:
             # https://bugs.python.org/issue35101
             # If the code name is not present as definition
             # in the beginning of the source,
             # then play safe and return the whole script
             first_line = source.splitlines()[0]
-            if re.search(r"\b(class|def)\b\s+\b%s\b" % frame.f_code.co_name, first_line) is None:
-                with tokenize.open(frame.f_code.co_filename) as fp:
-                    return fp.read(), 1, is_libra
-
-            else:
-                return source, frame.f_code.co_firstlineno, is_libra
-        except OSError:
-            logger.exception("Problem getting source")
-            return None, None, True
+            if (
+                code.co_name != "<lambda>"
+                and re.search(r"\b(class|def)\b\s+\b%s\b" % code.co_name, first_line) is None
+            ):
+                source, firstlineno = get_file_text(), 1
+
+        return FrameSourceInfo(
+            source=source,
+            firstlineno=firstlineno,
+            in_library=_is_library_file(code.co_filename),
+            source_id="%s:%d" % (code.co_filename, firstlineno),
+            source_hash=hashlib.sha1(source.encode("utf-8", errors="surrogatepass")).hexdigest(),
+        )
 
 
 def format_exception_with_frame_info(e_type, e_value, e_traceback, shorten_filenames=False):
@@ -0,0 +1,154 @@
+"""
+Keeps the code objects instrumented by NiceTracer between runs.
+
+Each entry consists of the marshalled code object and the table of the nodes, which the
+marker calls in the code refer to. The table keeps only the properties of the nodes, which
+are needed while tracing (location, tags and relations), therefore a cache hit doesn't need
+to parse the source at all.
+
+The cache key is computed by the tracer and covers the source, filename, Python version and
+the version of the instrumentation.
+"""
+import marshal
+import os.path
+import tempfile
+from logging import getLogger
+from typing import Dict, List, Optional, Tuple
+
+from thonny.common import TextRange
+
+logger = getLogger(__name__)
+
+DEFAULT_MAX_ENTRY_COUNT = 500
+
+_CODE_SUFFIX = ".code"
+_NODES_SUFFIX = ".nodes"
+
+
+class CachedNode:
+    """Stands in for an instrumented AST node while tracing code loaded from the cache"""
+
+    __slots__ = [
+        "lineno",
+        "col_offset",
+        "end_lineno",
+        "end_col_offset",
+        "tags",
+        "parent_node",
+        "parent_statement_focus",
+    ]
+
+
+class InstrumentedCodeCache:
+    def __init__(self, cache_dir: str, max_entry_count: int = DEFAULT_MAX_ENTRY_COUNT):
+        self._cache_dir = cache_dir
+        self._max_entry_count = max_entry_count
+
+    def load(self, key: str, node_id_base: int) -> Optional[Tuple[object, Dict[int, object]]]:
+        """Returns the code and the nodes by their ids or None if the key is not cached"""
+        path = os.path.join(self._cache_dir, key)
+        try:
+            with open(path + _NODES_SUFFIX, "rb") as fp:
+                node_table = marshal.load(fp)
+            with open(path + _CODE_SUFFIX, "rb") as fp:
+                code = marshal.load(fp)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            logger.exception("Could not load instrumented code from %s", path)
+            return None
+
+        return code, _create_nodes(node_table, node_id_base)
+
+    def store(self, key: str, code, nodes: List[object]) -> None:
+        """Stores the code and the nodes, which the code refers to by id base + position"""
+        try:
+            os.makedirs(self._cache_dir, exist_ok=True)
+            path = os.path.join(self._cache_dir, key)
+            # nodes get written last, because loading checks them first
+            self._write_atomically(path + _CODE_SUFFIX, marshal.dumps(code))
+            self._write_atomically(path + _NODES_SUFFIX, marshal.dumps(_create_node_table(nodes)))
+            self._prune()
+        except Exception:
+            logger.exception("Could not store instrumented code for %s", key)
+
+    def _write_atomically(self, path: str, data: bytes) -> None:
+        fd, temp_path = tempfile.mkstemp(dir=self._cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                fp.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def _prune(self) -> None:
+        """Removes least recently stored entries when there are too many"""
+        entries = [
+            entry for entry in os.scandir(self._cache_dir) if entry.name.endswith(_NODES_SUFFIX)
+        ]
+        if len(entries) <= self._max_entry_count:
+            return
+
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[: len(entries) - self._max_entry_count // 2]:
+            key = entry.name[: -len(_NODES_SUFFIX)]
+            for suffix in [_NODES_SUFFIX, _CODE_SUFFIX]:
+                try:
+                    os.remove(os.path.join(self._cache_dir, key + suffix))
+                except OSError:
+                    pass
+
+
+def _create_node_table(nodes: List[object]) -> List[tuple]:
+    # Parent nodes, which are not exported themselves, get appended to the table
+    indices = {id(node): i for i, node in enumerate(nodes)}
+    all_nodes = list(nodes)
+    table = []
+    i = 0
+    while i < len(all_nodes):
+        node = all_nodes[i]
+        parent = getattr(node, "parent_node", None)
+        if parent is None:
+            parent_index = -1
+        else:
+            if id(parent) not in indices:
+                indices[id(parent)] = len(all_nodes)
+                all_nodes.append(parent)
+            parent_index = indices[id(parent)]
+
+        statement_focus = getattr(node, "parent_statement_focus", None)
+        table.append(
+            (
+                getattr(node, "lineno", None),
+                getattr(node, "col_offset", None),
+                getattr(node, "end_lineno", None),
+                getattr(node, "end_col_offset", None),
+                tuple(getattr(node, "tags", ())),
+                parent_index,
+                None if statement_focus is None else tuple(statement_focus),
+            )
+        )
+        i += 1
+
+    return table
+
+
+def _create_nodes(node_table: List[tuple], node_id_base: int) -> Dict[int, object]:
+    all_nodes = [CachedNode() for _ in node_table]
+    for node, record in zip(all_nodes, node_table):
+        (
+            node.lineno,
+            node.col_offset,
+            node.end_lineno,
+            node.end_col_offset,
+            tags,
+            parent_index,
+            statement_focus,
+        ) = record
+        node.tags = set(tags)
+        node.parent_node = None if parent_index == -1 else all_nodes[parent_index]
+        if statement_focus is not None:
+            node.parent_statement_focus = TextRange(*statement_focus)
+
+    return {node_id_base + i: node for i, node in enumerate(all_nodes)}
@@ -0,0 +1,151 @@
+"""
+Keeps references to the objects the frontend knows about (via ValueInfo ids).
+
+Recently exported objects are kept with strong references (the number of those is limited),
+so that even temporary objects (eg. bound methods presented as attributes) can be inspected.
+Objects which allow weak references stay available also after dropping out of the strong tier,
+as long as the program keeps them alive. Others get evicted.
+
+Each entry gets a generation number when an object is stored under its id. As ids get recycled
+after objects are collected, the generation allows detecting stale ids.
+"""
+import itertools
+import weakref
+from collections import OrderedDict
+from logging import getLogger
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = getLogger(__name__)
+
+DEFAULT_MAX_STRONG_REFS = 10000
+
+
+class StaleObjectError(KeyError):
+    """Raised when the id refers to an object, which is not available anymore"""
+
+
+class _HeapEntry:
+    __slots__ = ("generation", "weak_ref")
+
+    def __init__(self, generation: int, weak_ref: Optional[weakref.ref]):
+        self.generation = generation
+        self.weak_ref = weak_ref
+
+
+class ObjectHeap:
+    def __init__(self, max_strong_refs: int = DEFAULT_MAX_STRONG_REFS):
+        self._max_strong_refs = max_strong_refs
+        self._entries = {}  # type: Dict[int, _HeapEntry]
+        self._strong_refs = OrderedDict()  # type: OrderedDict[int, Any]
+        self._generation_counter = itertools.count(1)
+        self._eviction_count = 0
+        self._collection_count = 0
+
+    def store(self, value) -> int:
+        """Registers the value (or refreshes its registration) and returns its generation"""
+        object_id = id(value)
+        entry = self._entries.get(object_id)
+        if entry is None or not self._refers_to(object_id, entry, value):
+            entry = _HeapEntry(next(self._generation_counter), self._create_weak_ref(value))
+            self._entries[object_id] = entry
+
+        self._strong_refs[object_id] = value
+        self._strong_refs.move_to_end(object_id)
+        if len(self._strong_refs) > self._max_strong_refs:
+            self._trim_strong_refs()
+
+        return entry.generation
+
+    def get(self, object_id: int, generation: Optional[int] = None) -> Any:
+        entry = self._entries.get(object_id)
+        if entry is None:
+            raise StaleObjectError(object_id)
+
+        if generation is not None and generation != entry.generation:
+            raise StaleObjectError(object_id)
+
+        if object_id in self._strong_refs:
+            return self._strong_refs[object_id]
+
+        value = entry.weak_ref()
+        if value is None:
+            # collected, but callback hasn't run yet
+            raise StaleObjectError(object_id)
+
+        return value
+
+    def get_generation(self, object_id: int) -> Optional[int]:
+        entry = self._entries.get(object_id)
+        return None if entry is None else entry.generation
+
+    def __getitem__(self, object_id: int) -> Any:
+        return self.get(object_id)
+
+    def __contains__(self, object_id: int) -> bool:
+        try:
+            self.get(object_id)
+            return True
+        except StaleObjectError:
+            return False
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_page(self, offset: int, limit: Optional[int]) -> List[Tuple[int, Any]]:
+        """Returns (id, value) pairs ordered by id"""
+        ids = sorted(self._entries)
+        if limit is None:
+            page_ids = ids[offset:]
+        else:
+            page_ids = ids[offset : offset + limit]
+
+        result = []
+        for object_id in page_ids:
+            try:
+                result.append((object_id, self.get(object_id)))
+            except StaleObjectError:
+                pass
+        return result
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "strong_count": len(self._strong_refs),
+            "weak_count": sum(1 for e in self._entries.values() if e.weak_ref is not None),
+            "max_strong_refs": self._max_strong_refs,
+            "eviction_count": self._eviction_count,
+            "collection_count": self._collection_count,
+        }
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._strong_refs.clear()
+
+    def _refers_to(self, object_id: int, entry: _HeapEntry, value) -> bool:
+        if object_id in self._strong_refs:
+            return self._strong_refs[object_id] is value
+        else:
+            return entry.weak_ref is not None and entry.weak_ref() is value
+
+    def _create_weak_ref(self, value) -> Optional[weakref.ref]:
+        object_id = id(value)
+
+        def on_collected(ref):
+            entry = self._entries.get(object_id)
+            if entry is not None and entry.weak_ref is ref:
+                del self._entries[object_id]
+                self._collection_count += 1
+
+        try:
+            return weakref.ref(value, on_collected)
+        except TypeError:
+            # int, str, tuple, list, dict, None etc.
+            return None
+
+    def _trim_strong_refs(self) -> None:
+        while len(self._strong_refs) > self._max_strong_refs:
+            object_id, _ = self._strong_refs.popitem(last=False)
+            entry = self._entries.get(object_id)
+            if entry is not None and entry.weak_ref is None:
+                del self._entries[object_id]
+                self._eviction_count += 1
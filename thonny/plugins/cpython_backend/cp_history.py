@@ -0,0 +1,113 @@
+"""
+Keeps the states saved by NiceTracer.
+
+Consecutive states share the parts, which didn't change (see NiceTracer._export_stack),
+therefore the size of a state is estimated by the parts it doesn't share with the previous state.
+When the estimated size of the history exceeds the limit, the oldest states get evicted.
+States are addressed by their absolute index, which doesn't change after evictions.
+"""
+from logging import getLogger
+from typing import Any, Dict, List, Optional
+
+logger = getLogger(__name__)
+
+DEFAULT_MEMORY_LIMIT = 100 * 1024 * 1024
+
+# rough estimates of the memory taken by the parts of a state
+_STATE_SIZE = 1000
+_FRAME_SIZE = 300
+_VALUE_SIZE = 150
+
+
+class StateHistory:
+    def __init__(self, memory_limit: int = DEFAULT_MEMORY_LIMIT):
+        self.memory_limit = memory_limit
+        self.first_index = 0
+        self.size = 0
+        self._states = []  # type: List[Dict[str, Any]]
+        self._sizes = []  # type: List[int]
+        self._offset = 0  # number of evicted states still present in the lists
+
+    def __len__(self):
+        """Index of the next state"""
+        return self.first_index + len(self._states) - self._offset
+
+    def __bool__(self):
+        return len(self._states) > self._offset
+
+    def __getitem__(self, index: int) -> Dict[str, Any]:
+        if index < 0:
+            index += len(self)
+
+        if index < self.first_index:
+            raise IndexError("State %d has been evicted" % index)
+
+        return self._states[index - self.first_index + self._offset]
+
+    def append(self, state: Dict[str, Any]) -> None:
+        prev_state = self[-1] if self else None
+        state_size = _estimate_state_size(state, prev_state)
+        self._states.append(state)
+        self._sizes.append(state_size)
+        self.size += state_size
+
+    def trim(self, keep_from: int) -> None:
+        """Evicts oldest states (but not the ones from keep_from) until the size fits the limit"""
+        evicted_count = 0
+        while self.size > self.memory_limit and self.first_index < min(keep_from, len(self) - 1):
+            self.size -= self._sizes[self._offset]
+            self._states[self._offset] = None
+            self._offset += 1
+            self.first_index += 1
+            evicted_count += 1
+
+        if evicted_count:
+            logger.debug("Evicted %d states, first state is %d", evicted_count, self.first_index)
+
+        if self._offset > 1000 and self._offset > len(self._states) // 2:
+            del self._states[: self._offset]
+            del self._sizes[: self._offset]
+            self._offset = 0
+
+    def get_info(self) -> Dict[str, int]:
+        return {
+            "first_index": self.first_index,
+            "count": len(self._states) - self._offset,
+            "size": self.size,
+            "memory_limit": self.memory_limit,
+        }
+
+
+def _estimate_state_size(state: Dict[str, Any], prev_state: Optional[Dict[str, Any]]) -> int:
+    result = _STATE_SIZE
+
+    if prev_state is None or state["stack"] is not prev_state["stack"]:
+        prev_stack = [] if prev_state is None else prev_state["stack"]
+        shared_frame_ids = {id(frame) for frame in prev_stack}
+        shared_dict_ids = set()
+        for frame in prev_stack:
+            shared_dict_ids.add(id(frame.locals))
+            shared_dict_ids.add(id(frame.globals))
+
+        for frame in state["stack"]:
+            if id(frame) in shared_frame_ids:
+                continue
+
+            result += _FRAME_SIZE + _estimate_evaluations_size(frame.current_evaluations)
+            for variables in [frame.locals, frame.globals]:
+                if variables is not None and id(variables) not in shared_dict_ids:
+                    result += _estimate_variables_size(variables)
+
+    evaluations = state["active_frame_overrides"].get("current_evaluations")
+    if evaluations:
+        result += _estimate_evaluations_size(evaluations)
+
+    return result
+
+
+def _estimate_variables_size(variables) -> int:
+    return sum(_VALUE_SIZE + len(name) + len(value.repr) for name, value in variables.items())
+
+
+def _estimate_evaluations_size(evaluations) -> int:
+    return sum(_VALUE_SIZE + len(value.repr) for _, value in evaluations)
@@ -46,12 +46,14 @@ if __name__ == "__main__":
     from thonny import report_time
 
     report_time("Before importing MainCPythonBackend")
-    from thonny.common import PROCESS_ACK
+    from thonny.common import format_process_ack, negotiate_message_format
     from thonny.plugins.cpython_backend.cp_back import MainCPythonBackend
 
     thonny.prepare_thonny_user_dir()
     thonny.configure_backend_logging()
-    print(PROCESS_ACK)
+    options = ast.literal_eval(sys.argv[2])
+    options["run.message_format"] = negotiate_message_format(options.get("run.message_format"))
+    print(format_process_ack(options["run.message_format"]))
 
     if using_temp_augmented_sys_path:
         # Don't make thonny container available for user programs.
@@ -63,7 +65,6 @@ if __name__ == "__main__":
         del sys.path[0]
 
     target_cwd = sys.argv[1]
-    options = ast.literal_eval(sys.argv[2])
     report_time("Before constructing backend")
     # Don't introduce new variables after constructing the backend, as it cleaned the main scope
     MainCPythonBackend(target_cwd, options).mainloop()
@@ -0,0 +1,141 @@
+"""
+Sampling profiler for the "Profile" command.
+
+A background thread looks at the stack of the thread running the user program at regular
+intervals and counts how often each line and function appears in it. The user program runs
+without any tracing, therefore the overhead is low and doesn't depend on the kind of code.
+
+The counts are sent to the frontend as deltas in "ProfileProgress" events, the frontend sums
+them up. For each line and function two counts are kept: "self" counts the samples where it was
+the innermost user frame and "total" counts the samples where it was anywhere in the stack.
+The samples taken while the program waits for input are not counted.
+"""
+import os.path
+import sys
+import threading
+import time
+from collections import Counter
+from logging import getLogger
+
+import thonny
+from thonny.common import BackendEvent
+from thonny.plugins.cpython_backend.cp_back import Executor, FakeInputStream
+
+logger = getLogger(__name__)
+
+DEFAULT_SAMPLING_INTERVAL = 0.005
+DEFAULT_REPORT_INTERVAL = 0.5
+
+_THONNY_DIR = os.path.dirname(thonny.__file__)
+_INPUT_WAITING_CODE = FakeInputStream._generic_read.__code__
+
+
+class SamplingProfiler(Executor):
+    def __init__(self, backend, original_cmd):
+        super().__init__(backend, original_cmd)
+        self._sampling_interval = original_cmd.get(
+            "sampling_interval", DEFAULT_SAMPLING_INTERVAL
+        )
+        self._report_interval = original_cmd.get("report_interval", DEFAULT_REPORT_INTERVAL)
+        self._target_thread_id = None
+        self._stop_event = threading.Event()
+        self._counts_lock = threading.Lock()
+        self._reset_counts()
+        self._internal_code_cache = {}  # code -> whether it belongs to Thonny
+
+    def _execute_prepared_user_code(self, statements, global_vars):
+        self._target_thread_id = threading.get_ident()
+        self._stop_event.clear()
+        sampler = threading.Thread(target=self._run_sampler, name="ProfileSampler", daemon=True)
+        sampler.start()
+        start_time = time.perf_counter()
+        try:
+            return super()._execute_prepared_user_code(statements, global_vars)
+        finally:
+            duration = time.perf_counter() - start_time
+            self._stop_event.set()
+            sampler.join()
+            self._backend.send_message(self._create_progress_event(final=True, duration=duration))
+
+    def _run_sampler(self):
+        next_report_time = time.perf_counter() + self._report_interval
+        while not self._stop_event.wait(self._sampling_interval):
+            frame = sys._current_frames().get(self._target_thread_id)
+            if frame is not None:
+                self._take_sample(frame)
+            # Don't keep a reference to the frame while the program runs
+            frame = None
+
+            if time.perf_counter() >= next_report_time:
+                # NB! send_message would flush the output buffers of the main thread
+                self._backend._write_message(self._create_progress_event())
+                next_report_time = time.perf_counter() + self._report_interval
+
+    def _take_sample(self, frame):
+        lines = []
+        functions = []
+        while frame is not None:
+            code = frame.f_code
+            if code is _INPUT_WAITING_CODE:
+                with self._counts_lock:
+                    self._waiting_sample_count += 1
+                return
+
+            if not self._is_internal_code(code):
+                lines.append((code.co_filename, frame.f_lineno))
+                functions.append((code.co_filename, code.co_firstlineno, code.co_name))
+
+            frame = frame.f_back
+
+        if not lines:
+            # eg. the program is just being started
+            return
+
+        with self._counts_lock:
+            self._sample_count += 1
+            self._line_self_counts[lines[0]] += 1
+            self._function_self_counts[functions[0]] += 1
+            # recursive calls shouldn't increase the totals more than once per sample
+            self._line_total_counts.update(set(lines))
+            self._function_total_counts.update(set(functions))
+
+    def _is_internal_code(self, code):
+        # The frames of the backend stay below the user code, but Thonny's streams and
+        # import hooks may appear on top of it
+        result = self._internal_code_cache.get(code)
+        if result is None:
+            result = os.path.normcase(code.co_filename).startswith(os.path.normcase(_THONNY_DIR))
+            self._internal_code_cache[code] = result
+        return result
+
+    def _create_progress_event(self, final=False, **extra_fields):
+        with self._counts_lock:
+            event = BackendEvent(
+                "ProfileProgress",
+                sample_count=self._sample_count,
+                waiting_sample_count=self._waiting_sample_count,
+                lines=_combine_counts(self._line_self_counts, self._line_total_counts),
+                functions=_combine_counts(
+                    self._function_self_counts, self._function_total_counts
+                ),
+                sampling_interval=self._sampling_interval,
+                main_module_path=self._main_module_path,
+                final=final,
+                **extra_fields,
+            )
+            self._reset_counts()
+
+        return event
+
+    def _reset_counts(self):
+        # counts since the last report
+        self._sample_count = 0
+        self._waiting_sample_count = 0
+        self._line_self_counts = Counter()
+        self._line_total_counts = Counter()
+        self._function_self_counts = Counter()
+        self._function_total_counts = Counter()
+
+
+def _combine_counts(self_counts, total_counts):
+    return {key: (self_counts.get(key, 0), count) for key, count in total_counts.items()}
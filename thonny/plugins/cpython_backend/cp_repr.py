@@ -0,0 +1,342 @@
+"""
+Bounded repr for exported values.
+
+Works in the spirit of reprlib, but instead of limiting the number of items on each level,
+it stops producing output as soon as the length budget is exhausted, so that a huge list or
+dict costs about as much as a small one. Result is the same as repr(value) shortened to
+max_length characters (followed by an ellipsis if something was cut).
+
+Builtin containers and the containers from the collections module (including their
+subclasses, which don't override __repr__) are written by the engine itself. Other types are
+handled by registered providers or by repr(value). Python can't interrupt a running repr, so
+a value, whose repr has exceeded the time budget, is later represented with the default object
+repr. Same happens with the values of the same type, which are at least as long as the slow one.
+"""
+import sys
+import time
+from collections import Counter, OrderedDict, defaultdict, deque
+from logging import getLogger
+from typing import Any, Callable, Dict, List, Optional
+
+logger = getLogger(__name__)
+
+ELLIPSIS = "…"
+DEFAULT_TIME_BUDGET = 0.1  # seconds
+DEFAULT_CACHE_SIZE = 10000
+MAX_DEPTH = 100
+REPR_ERROR = "??? <repr error>"
+
+# reprs of these can be reused for as long as the object is alive
+_IMMUTABLE_TYPES = {str, bytes, int, float, complex, range}
+
+ReprProvider = Callable[[Any, int], str]
+
+
+class _BudgetExhausted(Exception):
+    pass
+
+
+class _Writer:
+    __slots__ = ("parts", "remaining")
+
+    def __init__(self, max_length: int):
+        self.parts = []  # type: List[str]
+        self.remaining = max_length
+
+    def write(self, s: str) -> None:
+        if len(s) > self.remaining:
+            self.parts.append(s[: self.remaining])
+            self.remaining = 0
+            raise _BudgetExhausted()
+
+        self.parts.append(s)
+        self.remaining -= len(s)
+
+
+class ReprEngine:
+    def __init__(
+        self, time_budget: float = DEFAULT_TIME_BUDGET, cache_size: int = DEFAULT_CACHE_SIZE
+    ):
+        self._time_budget = time_budget
+        self._cache_size = cache_size
+        self._providers = {}  # type: Dict[type, ReprProvider]
+        # id -> (value, max_length, repr), value is kept to keep the id valid
+        self._cache = OrderedDict()  # type: OrderedDict[int, tuple]
+        # id -> (value, duration) for the values, whose repr has exceeded the time budget
+        self._slow_values = OrderedDict()  # type: OrderedDict[int, tuple]
+        # type -> smallest len() of its slow values
+        self._slow_lengths = {}  # type: Dict[type, int]
+
+    def register_provider(self, type_: type, provider: ReprProvider) -> None:
+        """Provider gets the value and max length and should return a (short) repr.
+
+        It is used also for the subclasses of the type. Result gets shortened if needed.
+        """
+        self._providers[type_] = provider
+
+    def repr(self, value: Any, max_length: int, allow_slow: bool = False) -> str:
+        if type(value) in _IMMUTABLE_TYPES:
+            cached = self._cache.get(id(value))
+            if cached is not None and cached[0] is value and cached[1] == max_length:
+                self._cache.move_to_end(id(value))
+                return cached[2]
+
+            result = self._compute(value, max_length, allow_slow)
+            self._cache[id(value)] = (value, max_length, result)
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+            return result
+
+        return self._compute(value, max_length, allow_slow)
+
+    def _compute(self, value: Any, max_length: int, allow_slow: bool) -> str:
+        writer = _Writer(max_length)
+        try:
+            self._write(value, writer, 0, set(), allow_slow)
+        except _BudgetExhausted:
+            return "".join(writer.parts) + ELLIPSIS
+        except Exception:
+            # See https://bitbucket.org/plas/thonny/issues/584/problem-with-thonnys-back-end-obj-no
+            return REPR_ERROR
+
+        return "".join(writer.parts)
+
+    def _write(self, value: Any, writer: _Writer, depth: int, active_ids: set, allow_slow):
+        value_type = type(value)
+
+        if value_type is str or value_type is bytes:
+            writer.write(_repr_prefix(value, writer.remaining + 1))
+            return
+
+        container_writer = self._find_container_writer(value_type)
+        if container_writer is not None:
+            write_container, recursion_marker = container_writer
+            if id(value) in active_ids:
+                writer.write(recursion_marker)
+                return
+            if depth >= MAX_DEPTH:
+                writer.write(ELLIPSIS)
+                return
+
+            active_ids.add(id(value))
+            try:
+                write_container(value, writer, depth + 1, active_ids, allow_slow)
+            finally:
+                active_ids.discard(id(value))
+            return
+
+        provider = self._find_provider(value_type)
+        if provider is not None:
+            writer.write(provider(value, writer.remaining + 1))
+            return
+
+        if not allow_slow and self._is_known_to_be_slow(value, value_type):
+            writer.write(object.__repr__(value))
+            return
+
+        start_time = time.perf_counter()
+        rep = repr(value)
+        duration = time.perf_counter() - start_time
+        if duration > self._time_budget:
+            self._remember_slow(value, value_type, duration)
+        writer.write(rep)
+
+    def _find_container_writer(self, value_type: type):
+        """Returns writing method and recursion marker or None.
+
+        Subclasses, which override __repr__, are not handled here.
+        """
+        if not issubclass(value_type, _CONTAINER_BASE_TYPES):
+            return None
+
+        value_repr = value_type.__repr__
+        if issubclass(value_type, dict):
+            if value_repr is dict.__repr__:
+                return self._write_dict, "{...}"
+            elif issubclass(value_type, OrderedDict) and value_repr is OrderedDict.__repr__:
+                return self._write_ordered_dict, "{...}"
+            elif issubclass(value_type, defaultdict) and value_repr is defaultdict.__repr__:
+                return self._write_defaultdict, "{...}"
+            elif issubclass(value_type, Counter) and value_repr is Counter.__repr__:
+                return self._write_counter, "{...}"
+        elif issubclass(value_type, list):
+            if value_repr is list.__repr__:
+                return self._write_list, "[...]"
+        elif issubclass(value_type, tuple):
+            if value_repr is tuple.__repr__:
+                return self._write_tuple, "(...)"
+            elif hasattr(value_type, "_fields") and _is_namedtuple_repr(value_repr):
+                return self._write_namedtuple, "(...)"
+        elif issubclass(value_type, (set, frozenset)):
+            if value_repr is set.__repr__ or value_repr is frozenset.__repr__:
+                return self._write_set, "{...}"
+        elif issubclass(value_type, deque):
+            if value_repr is deque.__repr__:
+                return self._write_deque, "[...]"
+
+        return None
+
+    def _write_items(self, items, writer: _Writer, depth: int, active_ids: set, allow_slow):
+        for i, item in enumerate(items):
+            if i:
+                writer.write(", ")
+            self._write(item, writer, depth, active_ids, allow_slow)
+
+    def _write_pairs(self, pairs, writer: _Writer, depth: int, active_ids: set, allow_slow):
+        writer.write("{")
+        for i, (key, item) in enumerate(pairs):
+            if i:
+                writer.write(", ")
+            self._write(key, writer, depth, active_ids, allow_slow)
+            writer.write(": ")
+            self._write(item, writer, depth, active_ids, allow_slow)
+        writer.write("}")
+
+    def _write_dict(self, value, writer: _Writer, depth: int, active_ids: set, allow_slow):
+        # like dict.__repr__, not affected by overridden items
+        self._write_pairs(dict.items(value), writer, depth, active_ids, allow_slow)
+
+    def _write_ordered_dict(self, value, writer: _Writer, depth: int, active_ids: set, allow_slow):
+        if not value:
+            writer.write(type(value).__name__ + "()")
+            return
+
+        writer.write(type(value).__name__ + "(")
+        if sys.version_info >= (3, 12):
+            self._write_pairs(value.items(), writer, depth, active_ids, allow_slow)
+        else:
+            writer.write("[")
+            for i, (key, item) in enumerate(value.items()):
+                if i:
+                    writer.write(", ")
+                writer.write("(")
+                self._write(key, writer, depth, active_ids, allow_slow)
+                writer.write(", ")
+                self._write(item, writer, depth, active_ids, allow_slow)
+                writer.write(")")
+            writer.write("]")
+        writer.write(")")
+
+    def _write_defaultdict(self, value, writer: _Writer, depth: int, active_ids: set, allow_slow):
+        writer.write(type(value).__name__ + "(")
+        self._write(value.default_factory, writer, depth, active_ids, allow_slow)
+        writer.write(", ")
+        self._write_pairs(dict.items(value), writer, depth, active_ids, allow_slow)
+        writer.write(")")
+
+    def _write_counter(self, value, writer: _Writer, depth: int, active_ids: set, allow_slow):
+        if not value:
+            writer.write(type(value).__name__ + "()")
+            return
+
+        try:
+            pairs = value.most_common()
+        except TypeError:
+            # like Counter.__repr__ when counts can't be compared
+            pairs = dict.items(value)
+
+        writer.write(type(value).__name__ + "(")
+        self._write_pairs(pairs, writer, depth, active_ids, allow_slow)
+        writer.write(")")
+
+    def _write_list(self, value, writer: _Writer, depth: int, active_ids: set, allow_slow):
+        writer.write("[")
+        self._write_items(value, writer, depth, active_ids, allow_slow)
+        writer.write("]")
+
+    def _write_tuple(self, value, writer: _Writer, depth: int, active_ids: set, allow_slow):
+        writer.write("(")
+        self._write_items(value, writer, depth, active_ids, allow_slow)
+        writer.write(",)" if len(value) == 1 else ")")
+
+    def _write_namedtuple(self, value, writer: _Writer, depth: int, active_ids: set, allow_slow):
+        writer.write(type(value).__name__ + "(")
+        for i, (name, item) in enumerate(zip(type(value)._fields, value)):
+            if i:
+                writer.write(", ")
+            writer.write(name + "=")
+            self._write(item, writer, depth, active_ids, allow_slow)
+        writer.write(")")
+
+    def _write_set(self, value, writer: _Writer, depth: int, active_ids: set, allow_slow):
+        value_type = type(value)
+        if not value:
+            writer.write(value_type.__name__ + "()")
+            return
+
+        if value_type is set:
+            prefix, suffix = "{", "}"
+        else:
+            prefix, suffix = value_type.__name__ + "({", "})"
+
+        writer.write(prefix)
+        self._write_items(value, writer, depth, active_ids, allow_slow)
+        writer.write(suffix)
+
+    def _write_deque(self, value, writer: _Writer, depth: int, active_ids: set, allow_slow):
+        writer.write(type(value).__name__ + "([")
+        self._write_items(value, writer, depth, active_ids, allow_slow)
+        if value.maxlen is None:
+            writer.write("])")
+        else:
+            writer.write("], maxlen=%d)" % value.maxlen)
+
+    def _find_provider(self, value_type: type):
+        if not self._providers:
+            return None
+
+        for cls in value_type.__mro__:
+            provider = self._providers.get(cls)
+            if provider is not None:
+                return provider
+
+        return None
+
+    def _is_known_to_be_slow(self, value: Any, value_type: type) -> bool:
+        slow = self._slow_values.get(id(value))
+        if slow is not None and slow[0] is value:
+            return True
+
+        slow_length = self._slow_lengths.get(value_type)
+        if slow_length is None:
+            return False
+
+        length = _get_length(value)
+        return length is not None and length >= slow_length
+
+    def _remember_slow(self, value: Any, value_type: type, duration: float) -> None:
+        logger.info("repr of a %s took %.2f s, won't be used anymore", value_type, duration)
+        self._slow_values[id(value)] = (value, duration)
+        if len(self._slow_values) > self._cache_size:
+            self._slow_values.popitem(last=False)
+
+        length = _get_length(value)
+        if length is not None and length < self._slow_lengths.get(value_type, sys.maxsize):
+            self._slow_lengths[value_type] = length
+
+
+_CONTAINER_BASE_TYPES = (dict, list, tuple, set, frozenset, deque)
+
+
+def _is_namedtuple_repr(value_repr) -> bool:
+    # __repr__ created by collections.namedtuple (also used by typing.NamedTuple)
+    return getattr(value_repr, "__module__", None) == "collections"
+
+
+def _get_length(value: Any) -> Optional[int]:
+    try:
+        return len(value)
+    except Exception:
+        return None
+
+
+def _repr_prefix(value, length: int) -> str:
+    """repr of a prefix is enough for filling the budget"""
+    prefix = value[:length]
+    if len(prefix) < len(value):
+        # repr chooses the quotes according to the whole value
+        quote, other_quote = ("'", '"') if isinstance(value, str) else (b"'", b'"')
+        if quote in value:
+            prefix += quote + other_quote if other_quote in value else quote
+
+    return repr(prefix)
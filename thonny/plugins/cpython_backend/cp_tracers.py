@@ -2,23 +2,35 @@ import _ast
 import ast
 import builtins
 import dis
+import functools
+import gc
+import hashlib
+import importlib.util
 import inspect
 import os.path
 import site
 import sys
-from collections import namedtuple
+import threading
+import time
+import tokenize
+import types
+import weakref
+from collections import Counter, namedtuple
 from importlib.machinery import PathFinder, SourceFileLoader
 from logging import getLogger
 from typing import Union
 
+import thonny
 from thonny import report_time
 from thonny.common import (
+    BackendEvent,
     DebuggerCommand,
     DebuggerResponse,
     FrameInfo,
     InlineCommand,
     InlineResponse,
     TextRange,
+    encode_line_set,
     is_same_path,
     path_startswith,
     range_contains_smaller,
@@ -26,6 +38,8 @@ from thonny.common import (
     try_load_modules_with_frontend_sys_path,
 )
 from thonny.plugins.cpython_backend.cp_back import Executor, format_exception_with_frame_info
+from thonny.plugins.cpython_backend.cp_code_cache import InstrumentedCodeCache
+from thonny.plugins.cpython_backend.cp_history import StateHistory
 
 BEFORE_STATEMENT_MARKER = "_thonny_hidden_before_stmt"
 BEFORE_EXPRESSION_MARKER = "_thonny_hidden_before_expr"
@@ -41,6 +55,28 @@ _CO_WEIRDO = _CO_GENERATOR | _CO_COROUTINE | _CO_ITERABLE_COROUTINE | _CO_ASYNC_
 
 logger = getLogger(__name__)
 
+if hasattr(sys, "monitoring"):
+    _MONITORING_TOOL_ID = sys.monitoring.DEBUGGER_ID
+    _MONITORING_EVENTS = [
+        sys.monitoring.events.PY_START,
+        sys.monitoring.events.PY_RESUME,
+        sys.monitoring.events.LINE,
+        sys.monitoring.events.PY_RETURN,
+        sys.monitoring.events.PY_YIELD,
+        sys.monitoring.events.PY_UNWIND,
+        sys.monitoring.events.RAISE,
+    ]
+    _MONITORED_CODE_EVENTS = (
+        sys.monitoring.events.LINE
+        | sys.monitoring.events.PY_RETURN
+        | sys.monitoring.events.PY_YIELD
+    )
+
+# decisions of FastTracer about new frames
+_TRACE = 0
+_SKIP = 1
+_SKIP_UNLESS_REPORTED = 2
+
 TempFrameInfo = namedtuple(
     "TempFrameInfo",
     [
@@ -57,6 +93,106 @@ TempFrameInfo = namedtuple(
 )
 
 
+def _get_code_cache_value(cache, code, compute):
+    """Looks up a value computed for the code object, computes it on the first request.
+
+    Entries are keyed by the id of the code object and hold a weak reference to it,
+    so that a code object with reused id doesn't get the value of a dead one.
+    """
+    entry = cache.get(id(code))
+    if entry is None or entry[0]() is not code:
+        entry = (weakref.ref(code), compute(code))
+        cache[id(code)] = entry
+    return entry[1]
+
+
+def _compile_log_message(message):
+    """Compiles the message as the body of an f-string.
+
+    Before Python 3.12 the expressions in braces can't contain backslashes or the quotes
+    delimiting the f-string, so the message gets delimited with quotes it doesn't use.
+    """
+    # raw string is for keeping the backslashes in the text, but it can't end with a backslash
+    body = message.rstrip("\\")
+    tail = message[len(body) :]
+    for quote in ['"', "'", '"""', "'''"]:
+        if quote in body or len(quote) == 1 and ("\n" in body or "\r" in body):
+            continue
+        if len(quote) == 3 and body.endswith(quote[0]):
+            continue
+
+        source = "rf" + quote + body + quote
+        if tail:
+            source += " " + repr(tail)
+        return compile(source, "<logpoint message>", "eval")
+
+    raise SyntaxError("log message uses all kinds of quotes")
+
+
+class BreakpointCondition:
+    """
+    Condition, hit count and log message of a breakpoint, compiled once per breakpoint.
+
+    Gets evaluated in the backend on each hit, so that only the hits, which should stop
+    the program, get reported to the frontend.
+    """
+
+    def __init__(self, options, location):
+        self.options = options
+        self.hit_count = 0
+        self._location = location
+        self._required_hit_count = options.get("hit_count") or 0
+        self._error = None
+        self._condition_code = None
+        self._log_message_code = None
+
+        try:
+            if options.get("condition"):
+                self._condition_code = compile(
+                    options["condition"].strip(), "<breakpoint condition>", "eval"
+                )
+            if options.get("log_message"):
+                self._log_message_code = _compile_log_message(options["log_message"])
+        except SyntaxError as e:
+            self._error = e
+
+    def should_stop(self, frame):
+        """Registers a hit. Prints the log message instead of stopping, if one is given."""
+        if self._error is not None:
+            self._report_error(self._error)
+            return True
+
+        if self._condition_code is not None:
+            try:
+                if not eval(self._condition_code, frame.f_globals, frame.f_locals):
+                    return False
+            except Exception as e:
+                # can't tell, better let the user see what's going on
+                self._report_error(e)
+                return True
+
+        self.hit_count += 1
+        if self.hit_count < self._required_hit_count:
+            return False
+
+        if self._log_message_code is not None:
+            try:
+                message = eval(self._log_message_code, frame.f_globals, frame.f_locals)
+            except Exception as e:
+                message = "%s (%s: %s)" % (self.options["log_message"], type(e).__name__, e)
+            print(message)
+            return False
+
+        return True
+
+    def _report_error(self, error):
+        print(
+            "Error in breakpoint options at %s: %s: %s"
+            % (self._location, type(error).__name__, error),
+            file=sys.stderr,
+        )
+
+
 class Tracer(Executor):
     def __init__(self, backend, original_cmd):
         super().__init__(backend, original_cmd)
@@ -66,9 +202,24 @@ class Tracer(Executor):
         self._last_reported_frame_ids = set()
         self._affected_frame_ids_per_exc_id = {}
         self._canonic_path_cache = {}
+        self._allow_stepping_into_libraries = None
         self._file_interest_cache = {}
+        # id(code) -> (weakref to code, whether frames of the code are interesting)
+        self._code_interest_cache = {}
         self._file_breakpoints_cache = {}
+        # for finding out, where the debugging overhead comes from
+        self._skipped_frame_count = 0
+        # Keyed by weak references to traced code objects, so that neither the code objects
+        # nor their reused ids get mixed up with the new code
+        self._traced_frame_counts = Counter()
+        self._code_descriptions = {}
+        self._breakpoint_options = None
+        # (canonic path, lineno) -> BreakpointCondition, for active breakpoints ...
+        self._breakpoint_conditions = {}
+        # ... and all breakpoints seen, so that hit counts survive the commands without them
+        self._all_breakpoint_conditions = {}
         self._command_completion_handler = None
+        self._last_animation_time = 0
 
         # first (automatic) stepping command depends on whether any breakpoints were set or not
         breakpoints = self._original_cmd.breakpoints
@@ -85,6 +236,7 @@ class Tracer(Executor):
             frame_id=None,
             exception=None,
             breakpoints=breakpoints,
+            breakpoint_options=self._original_cmd.get("breakpoint_options", {}),
         )
 
         self._initialize_new_command(None)
@@ -108,20 +260,52 @@ class Tracer(Executor):
     def _execute_prepared_user_code(self, statements, global_vars):
         old_breakpointhook = None
         try:
-            sys.settrace(self._trace)
+            self._install_tracing()
             if hasattr(sys, "breakpointhook"):
                 old_breakpointhook = sys.breakpointhook
                 sys.breakpointhook = self._breakpointhook
 
             return super()._execute_prepared_user_code(statements, global_vars)
         finally:
-            sys.settrace(None)
+            self._uninstall_tracing()
             if hasattr(sys, "breakpointhook"):
                 sys.breakpointhook = old_breakpointhook
+            logger.info("Frame interest stats: %r", self.get_frame_interest_stats())
+
+    def get_frame_interest_stats(self):
+        """Tells how many new frames were skipped and traced (and which code got traced most)"""
+        return {
+            "skipped": self._skipped_frame_count,
+            "traced": sum(self._traced_frame_counts.values()),
+            "most_traced": [
+                (self._code_descriptions[code_ref], count)
+                for code_ref, count in self._traced_frame_counts.most_common(10)
+            ],
+        }
+
+    def _count_traced_frame(self, code):
+        # without callback the existing reference gets reused
+        code_ref = weakref.ref(code)
+        if code_ref not in self._code_descriptions:
+            self._code_descriptions[code_ref] = "%s:%d (%s)" % (
+                code.co_filename,
+                code.co_firstlineno,
+                code.co_name,
+            )
+        self._traced_frame_counts[code_ref] += 1
+
+    def _install_tracing(self):
+        sys.settrace(self._trace)
+
+    def _uninstall_tracing(self):
+        sys.settrace(None)
 
     def _is_interesting_frame(self, frame):
-        code = frame.f_code
+        return _get_code_cache_value(
+            self._code_interest_cache, frame.f_code, self._is_interesting_code
+        )
 
+    def _is_interesting_code(self, code):
         return not (
             code is None
             or code.co_filename is None
@@ -153,7 +337,7 @@ class Tracer(Executor):
             and is_same_path(path, self._main_module_path)
             or extension in (".py", ".pyw")
             and (
-                self._current_command.get("allow_stepping_into_libraries", False)
+                self._allow_stepping_into_libraries
                 or (
                     self._main_module_path is not None
                     and path_startswith(path, os.path.dirname(self._main_module_path))
@@ -191,13 +375,74 @@ class Tracer(Executor):
             self, "_cmd_%s_completed" % self._current_command.name
         )
 
+        allow_stepping_into_libraries = self._current_command.get(
+            "allow_stepping_into_libraries", False
+        )
+        if (
+            self._current_command.breakpoints != self._prev_breakpoints
+            or allow_stepping_into_libraries != self._allow_stepping_into_libraries
+        ):
+            self._allow_stepping_into_libraries = allow_stepping_into_libraries
+            self._invalidate_frame_interest()
+
         if self._current_command.breakpoints != self._prev_breakpoints:
-            self._file_interest_cache = {}  # because there may be new breakpoints
             self._file_breakpoints_cache = {}
             for path, linenos in self._current_command.breakpoints.items():
                 self._file_breakpoints_cache[path] = linenos
                 self._file_breakpoints_cache[self._get_canonic_path(path)] = linenos
 
+        breakpoint_options = self._current_command.get("breakpoint_options", {})
+        if breakpoint_options != self._breakpoint_options:
+            self._update_breakpoint_conditions(breakpoint_options)
+
+    def _invalidate_frame_interest(self):
+        self._file_interest_cache = {}
+        self._code_interest_cache = {}
+
+    def _repeat_current_command(self, current_frame, **state_fields):
+        """
+        Starts the next round of a repeated command (eg. step_over x N) without a round trip
+        to the UI. State fields describe the current state like the UI would have done.
+        """
+        cmd = self._current_command
+        self._prev_breakpoints = cmd.breakpoints
+        self._current_command = DebuggerCommand(
+            **dict(cmd.__dict__, repeat=cmd["repeat"] - 1, **state_fields)
+        )
+        self._initialize_new_command(current_frame)
+
+    def _should_report_animation_state(self):
+        """Tells whether an intermediate state of a repeated command should be shown"""
+        interval = self._current_command.get("animation_interval")
+        if not interval:
+            return False
+
+        now = time.perf_counter()
+        if now - self._last_animation_time < interval:
+            return False
+
+        self._last_animation_time = now
+        return True
+
+    def _update_breakpoint_conditions(self, breakpoint_options):
+        self._breakpoint_options = breakpoint_options
+        self._breakpoint_conditions = {}
+        for path, options_per_lineno in breakpoint_options.items():
+            canonic_path = self._get_canonic_path(path)
+            for lineno, options in options_per_lineno.items():
+                key = (canonic_path, lineno)
+                condition = self._all_breakpoint_conditions.get(key)
+                if condition is None or condition.options != options:
+                    condition = BreakpointCondition(options, "%s:%d" % (path, lineno))
+                    self._all_breakpoint_conditions[key] = condition
+                self._breakpoint_conditions[key] = condition
+
+    def _get_breakpoint_condition(self, filename, lineno):
+        if not self._breakpoint_conditions:
+            return None
+
+        return self._breakpoint_conditions.get((self._get_canonic_path(filename), lineno))
+
     def _register_affected_frame(self, exception_obj, frame):
         # I used to store the frame ids in a new field inside exception object,
         # but Python 3.8 doesn't allow this (https://github.com/thonny/thonny/issues/1403)
@@ -268,25 +513,33 @@ class FastTracer(Tracer):
         self._command_frame_returned = False
         self._code_linenos_cache = {}
         self._code_breakpoints_cache = {}
+        # command name -> id(code) -> (weakref to code, decision about new frames of the code)
+        self._frame_decisions = {}
 
     def _initialize_new_command(self, current_frame):
         super()._initialize_new_command(current_frame)
         self._command_frame_returned = False
         if self._current_command.breakpoints != self._prev_breakpoints:
             self._code_breakpoints_cache = {}
+            self._restore_tracing_in_stack(current_frame)
 
-            # restore tracing for active frames which were skipped before
-            # but have breakpoints now
-            frame = current_frame
-            while frame is not None:
-                if (
-                    frame.f_trace is None
-                    and frame.f_code is not None
-                    and self._get_breakpoints_in_code(frame.f_code)
-                ):
-                    frame.f_trace = self._trace
+    def _invalidate_frame_interest(self):
+        super()._invalidate_frame_interest()
+        self._frame_decisions = {}
+
+    def _restore_tracing_in_stack(self, current_frame):
+        # restore tracing for active frames which were skipped before
+        # but have breakpoints now
+        frame = current_frame
+        while frame is not None:
+            if (
+                frame.f_trace is None
+                and frame.f_code is not None
+                and self._get_breakpoints_in_code(frame.f_code)
+            ):
+                frame.f_trace = self._trace
 
-                frame = frame.f_back
+            frame = frame.f_back
 
     def _breakpointhook(self, *args, **kw):
         frame = inspect.currentframe()
@@ -298,24 +551,42 @@ class FastTracer(Tracer):
     def _should_skip_frame(self, frame, event):
         if event == "call":
             # new frames
-            return (
-                (
-                    self._current_command.name == "resume"
-                    and not self._get_breakpoints_in_code(frame.f_code)
-                    or self._current_command.name == "step_over"
-                    and not self._get_breakpoints_in_code(frame.f_code)
-                    and id(frame) not in self._last_reported_frame_ids
-                    or self._current_command.name == "step_out"
-                    and not self._get_breakpoints_in_code(frame.f_code)
-                )
-                or not self._is_interesting_frame(frame)
+            code = frame.f_code
+            decisions = self._frame_decisions.get(self._current_command.name)
+            if decisions is None:
+                decisions = self._frame_decisions[self._current_command.name] = {}
+
+            decision = _get_code_cache_value(decisions, code, self._decide_about_new_frames)
+            skip = (
+                decision == _SKIP
+                or decision == _SKIP_UNLESS_REPORTED
+                and id(frame) not in self._last_reported_frame_ids
                 or self._backend.is_doing_io()
             )
+            if skip:
+                self._skipped_frame_count += 1
+            else:
+                self._count_traced_frame(code)
+            return skip
 
         else:
             # once we have entered a frame, we need to reach the return event
             return False
 
+    def _decide_about_new_frames(self, code):
+        if not _get_code_cache_value(
+            self._code_interest_cache, code, self._is_interesting_code
+        ):
+            return _SKIP
+        elif self._get_breakpoints_in_code(code):
+            return _TRACE
+        elif self._current_command.name in ["resume", "step_out"]:
+            return _SKIP
+        elif self._current_command.name in ["step_over", "step_until"]:
+            return _SKIP_UNLESS_REPORTED
+        else:
+            return _TRACE
+
     def _trace(self, frame, event, arg):
         if self._should_skip_frame(frame, event):
             return None
@@ -330,7 +601,10 @@ class FastTracer(Tracer):
 
             self._fresh_exception = None
             # can we skip this frame?
-            if self._current_command.name == "step_over" and not self._current_command.breakpoints:
+            if (
+                self._current_command.name in ["step_over", "step_until"]
+                and not self._current_command.breakpoints
+            ):
                 return None
 
         elif event == "return":
@@ -351,15 +625,34 @@ class FastTracer(Tracer):
             self._fresh_exception = None
 
             if self._command_completion_handler(frame):
-                self._report_current_state(frame)
-                self._fetch_next_debugger_command(frame)
+                self._handle_completed_command(frame)
 
         else:
             self._fresh_exception = None
 
         return self._trace
 
-    def _report_current_state(self, frame):
+    def _handle_completed_command(self, frame):
+        if self._current_command.get("repeat", 1) > 1:
+            if self._should_report_animation_state():
+                self._report_current_state(frame, intermediate=True)
+            else:
+                # the frames would have been reported after each step
+                self._last_reported_frame_ids = {
+                    id(f) for f in self._iter_interesting_frames(frame)
+                }
+            self._repeat_current_command(frame, frame_id=id(frame))
+        else:
+            self._report_current_state(frame)
+            self._fetch_next_debugger_command(frame)
+
+    def _iter_interesting_frames(self, frame):
+        while frame is not None:
+            if self._is_interesting_frame(frame):
+                yield frame
+            frame = frame.f_back
+
+    def _report_current_state(self, frame, intermediate=False):
         stack = self._backend._export_stack(frame, self._is_interesting_frame)
         msg = DebuggerResponse(
             stack=stack,
@@ -368,6 +661,8 @@ class FastTracer(Tracer):
             exception_info=self._export_exception_info(),
             tracer_class="FastTracer",
         )
+        if intermediate:
+            msg["intermediate"] = True
 
         self._last_reported_frame_ids = set(map(lambda f: f.id, stack))
 
@@ -377,18 +672,27 @@ class FastTracer(Tracer):
         return True
 
     def _cmd_step_over_completed(self, frame):
+        # breakpoint gets checked first, so that the hit gets counted
         return (
-            id(frame) == self._current_command.frame_id
+            self._at_a_breakpoint(frame)
+            or id(frame) == self._current_command.frame_id
             or self._command_frame_returned
-            or self._at_a_breakpoint(frame)
         )
 
     def _cmd_step_out_completed(self, frame):
-        return self._command_frame_returned or self._at_a_breakpoint(frame)
+        return self._at_a_breakpoint(frame) or self._command_frame_returned
 
     def _cmd_resume_completed(self, frame):
         return self._at_a_breakpoint(frame)
 
+    def _cmd_step_until_completed(self, frame):
+        return (
+            self._at_a_breakpoint(frame)
+            or id(frame) == self._current_command.frame_id
+            and frame.f_lineno == self._current_command.target_lineno
+            or self._command_frame_returned
+        )
+
     def _get_breakpoints_in_code(self, f_code):
         bps_in_file = self._get_breakpoints_in_file(f_code.co_filename)
 
@@ -412,11 +716,15 @@ class FastTracer(Tracer):
 
     def _at_a_breakpoint(self, frame):
         # TODO: try re-entering same line in loop
-        return frame.f_lineno in self._get_breakpoints_in_code(frame.f_code)
+        if frame.f_lineno not in self._get_breakpoints_in_code(frame.f_code):
+            return False
+
+        condition = self._get_breakpoint_condition(frame.f_code.co_filename, frame.f_lineno)
+        return condition is None or condition.should_stop(frame)
 
     def _is_interesting_exception(self, frame, arg):
         return super()._is_interesting_exception(frame, arg) and (
-            self._current_command.name in ["step_into", "step_over"]
+            self._current_command.name in ["step_into", "step_over", "step_until"]
             and (
                 # in command frame or its parent frames
                 id(frame) == self._current_command["frame_id"]
@@ -425,24 +733,466 @@ class FastTracer(Tracer):
         )
 
 
+class MonitoringFastTracer(FastTracer):
+    """FastTracer built on sys.monitoring (PEP 669), available since Python 3.12.
+
+    Instead of calling a trace function for every event in every frame, LINE events get enabled
+    only for the code objects, which need them for the current command. Events are switched per
+    code object when the command changes. Line locations, which can't complete the current
+    command, get disabled after their first event.
+    """
+
+    def __init__(self, backend, original_cmd):
+        self._monitoring_active = False
+        self._monitored_codes = {}
+        self._thread_id = threading.get_ident()
+        super().__init__(backend, original_cmd)
+
+    def _install_tracing(self):
+        monitoring = sys.monitoring
+        events = monitoring.events
+        monitoring.use_tool_id(_MONITORING_TOOL_ID, "thonny")
+        monitoring.register_callback(_MONITORING_TOOL_ID, events.PY_START, self._on_py_start)
+        monitoring.register_callback(_MONITORING_TOOL_ID, events.PY_RESUME, self._on_py_start)
+        monitoring.register_callback(_MONITORING_TOOL_ID, events.LINE, self._on_line)
+        monitoring.register_callback(_MONITORING_TOOL_ID, events.PY_RETURN, self._on_py_return)
+        monitoring.register_callback(_MONITORING_TOOL_ID, events.PY_YIELD, self._on_py_return)
+        monitoring.register_callback(_MONITORING_TOOL_ID, events.PY_UNWIND, self._on_py_unwind)
+        monitoring.register_callback(_MONITORING_TOOL_ID, events.RAISE, self._on_raise)
+        self._monitoring_active = True
+        self._update_events(None)
+
+    def _uninstall_tracing(self):
+        if not self._monitoring_active:
+            return
+
+        monitoring = sys.monitoring
+        monitoring.set_events(_MONITORING_TOOL_ID, monitoring.events.NO_EVENTS)
+        for code in self._monitored_codes:
+            monitoring.set_local_events(_MONITORING_TOOL_ID, code, monitoring.events.NO_EVENTS)
+        self._monitored_codes = {}
+
+        for event in _MONITORING_EVENTS:
+            monitoring.register_callback(_MONITORING_TOOL_ID, event, None)
+        monitoring.free_tool_id(_MONITORING_TOOL_ID)
+        self._monitoring_active = False
+
+    def _initialize_new_command(self, current_frame):
+        super()._initialize_new_command(current_frame)
+        if self._monitoring_active:
+            self._update_events(current_frame)
+
+    def _restore_tracing_in_stack(self, current_frame):
+        # done by _update_events
+        pass
+
+    def _update_events(self, current_frame):
+        monitoring = sys.monitoring
+        events = monitoring.events
+
+        for code in self._monitored_codes:
+            monitoring.set_local_events(_MONITORING_TOOL_ID, code, events.NO_EVENTS)
+        self._monitored_codes = {}
+
+        global_events = events.PY_START | events.PY_RESUME | events.PY_UNWIND
+        if self._current_command.name in ["step_into", "step_over", "step_until"]:
+            # other commands don't report exceptions
+            global_events |= events.RAISE
+        monitoring.set_events(_MONITORING_TOOL_ID, global_events)
+
+        frame = current_frame
+        while frame is not None:
+            if frame.f_code is not None and self._is_interesting_frame(frame):
+                if self._current_command.name == "resume" and not self._get_breakpoints_in_code(
+                    frame.f_code
+                ):
+                    # only for reporting returns of the frames shown in the UI
+                    self._monitor_code(frame.f_code, events.PY_RETURN | events.PY_YIELD)
+                else:
+                    self._monitor_code(frame.f_code, _MONITORED_CODE_EVENTS)
+            frame = frame.f_back
+
+        # PY_START and LINE events disabled for the previous command need to be considered again
+        monitoring.restart_events()
+
+    def _monitor_code(self, code, events):
+        events |= self._monitored_codes.get(code, 0)
+        if events != self._monitored_codes.get(code):
+            sys.monitoring.set_local_events(_MONITORING_TOOL_ID, code, events)
+            self._monitored_codes[code] = events
+
+    def _on_py_start(self, code, instruction_offset):
+        if threading.get_ident() != self._thread_id or self._backend.is_doing_io():
+            # may need to reconsider this code later
+            return None
+
+        frame = sys._getframe(1)
+        if not self._should_skip_frame(frame, "call"):
+            self._check_store_main_frame_id(frame)
+            self._fresh_exception = None
+            # Return events matter only for the frames in the stack (see _update_events)
+            self._monitor_code(code, sys.monitoring.events.LINE)
+
+        # local events of the code object don't depend on PY_START anymore
+        return sys.monitoring.DISABLE
+
+    def _on_line(self, code, line_number):
+        if threading.get_ident() != self._thread_id:
+            return None
+
+        frame = sys._getframe(1)
+        self._fresh_exception = None
+
+        if self._command_completion_handler(frame):
+            self._handle_completed_command(frame)
+            return None
+
+        if line_number not in self._get_breakpoints_in_code(code) and (
+            self._current_command.name == "resume"
+            or self._current_command.name == "step_out"
+            and not self._command_frame_returned
+            or self._current_command.name == "step_until"
+            and not self._command_frame_returned
+            and line_number != self._current_command.target_lineno
+        ):
+            return sys.monitoring.DISABLE
+
+        return None
+
+    def _on_py_return(self, code, instruction_offset, retval):
+        if threading.get_ident() != self._thread_id:
+            return None
+
+        self._handle_frame_exit(sys._getframe(1))
+        return None
+
+    def _on_py_unwind(self, code, instruction_offset, exception):
+        if threading.get_ident() == self._thread_id:
+            self._handle_frame_exit(sys._getframe(1))
+
+    def _handle_frame_exit(self, frame):
+        self._fresh_exception = None
+        frame_id = id(frame)
+        if frame_id == self._current_command["frame_id"]:
+            self._command_frame_returned = True
+            if self._current_command.name in ["step_out", "step_until"]:
+                # lines disabled before the return may be needed now
+                sys.monitoring.restart_events()
+        self._check_notify_return(frame_id)
+
+    def _on_raise(self, code, instruction_offset, exception):
+        if threading.get_ident() != self._thread_id or not self._monitored_codes.get(code):
+            return
+
+        frame = sys._getframe(1)
+        arg = (type(exception), exception, exception.__traceback__)
+        if self._is_interesting_exception(frame, arg):
+            self._fresh_exception = arg
+            self._register_affected_frame(exception, frame)
+            # UI doesn't know about separate exception events
+            self._report_current_state(frame)
+            self._fetch_next_debugger_command(frame)
+
+
+def get_fast_tracer_class():
+    """Prefers sys.monitoring, unless it's not available or another debugger is using it"""
+    if hasattr(sys, "monitoring") and sys.monitoring.get_tool(sys.monitoring.DEBUGGER_ID) is None:
+        return MonitoringFastTracer
+    else:
+        return FastTracer
+
+
+class CoverageTracer(Executor):
+    """Records executed lines of the user modules and optionally wall time spent on each line.
+
+    Time of a line lasts until the next traced line event, therefore it includes the time of
+    the calls into library code, but not the time of the lines in called user functions.
+    The result is sent in a single "CoverageResult" event after the program has completed.
+    """
+
+    def __init__(self, backend, original_cmd):
+        super().__init__(backend, original_cmd)
+        self._thonny_src_dir = os.path.dirname(sys.modules["thonny"].__file__)
+        self._line_timing = original_cmd.get("line_timing", False)
+        self._file_interest_cache = {}
+        self._code_interest_cache = {}
+        self._executed_lines = {}  # by filename
+        # code -> line numbers of the code, which haven't been executed yet
+        self._pending_lines = {}
+        self._line_times = Counter()  # by (filename, lineno)
+        self._timed_location = None
+        self._timed_location_start_time = None
+
+    def _execute_prepared_user_code(self, statements, global_vars):
+        start_time = time.perf_counter()
+        try:
+            self._install_tracing()
+            return super()._execute_prepared_user_code(statements, global_vars)
+        finally:
+            self._uninstall_tracing()
+            self._switch_timed_location(None, time.perf_counter())
+            self._backend.send_message(
+                self._create_result_event(statements, time.perf_counter() - start_time)
+            )
+
+    def _install_tracing(self):
+        sys.settrace(self._trace)
+
+    def _uninstall_tracing(self):
+        sys.settrace(None)
+
+    def _trace(self, frame, event, arg):
+        # called for new frames
+        code = frame.f_code
+        if not self._is_interesting_code(code):
+            return None
+
+        if self._line_timing:
+            return self._trace_timed_lines
+        elif self._pending_lines[code]:
+            return self._trace_lines
+        else:
+            # all lines of the code have been covered already
+            return None
+
+    def _trace_lines(self, frame, event, arg):
+        if event == "line":
+            code = frame.f_code
+            self._executed_lines[code.co_filename].add(frame.f_lineno)
+            pending_lines = self._pending_lines[code]
+            pending_lines.discard(frame.f_lineno)
+            if not pending_lines:
+                # returning None wouldn't turn off tracing of this frame
+                frame.f_trace_lines = False
+
+        return self._trace_lines
+
+    def _trace_timed_lines(self, frame, event, arg):
+        now = time.perf_counter()
+        if event == "line":
+            code = frame.f_code
+            self._executed_lines[code.co_filename].add(frame.f_lineno)
+            self._switch_timed_location((code.co_filename, frame.f_lineno), now)
+        elif event == "return":
+            self._switch_timed_location(self._find_caller_location(frame), now)
+
+        return self._trace_timed_lines
+
+    def _switch_timed_location(self, location, now):
+        if self._timed_location is not None:
+            self._line_times[self._timed_location] += now - self._timed_location_start_time
+        self._timed_location = location
+        self._timed_location_start_time = now
+
+    def _find_caller_location(self, frame):
+        """Location in the innermost interesting frame below given frame"""
+        frame = frame.f_back
+        while frame is not None:
+            if self._is_interesting_code(frame.f_code):
+                return frame.f_code.co_filename, frame.f_lineno
+            frame = frame.f_back
+
+        return None
+
+    def _is_interesting_code(self, code):
+        result = self._code_interest_cache.get(code)
+        if result is None:
+            result = self._is_interesting_module_file(code.co_filename)
+            self._code_interest_cache[code] = result
+            if result:
+                self._executed_lines.setdefault(code.co_filename, set())
+                # first line of a function gets executed by the enclosing code
+                self._pending_lines[code] = _get_line_starts(code) - {code.co_firstlineno}
+
+        return result
+
+    def _is_interesting_module_file(self, path):
+        # user modules are the ones next to the main module
+        result = self._file_interest_cache.get(path)
+        if result is None:
+            _, extension = os.path.splitext(path.lower())
+            result = self._main_module_path is not None and (
+                is_same_path(path, self._main_module_path)
+                or extension in (".py", ".pyw")
+                and path_startswith(path, os.path.dirname(self._main_module_path))
+                and not path_startswith(path, sys.prefix)
+                and not path_startswith(path, sys.base_prefix)
+                and not path_startswith(path, site.getusersitepackages() or "usersitenotexists")
+                and not path_startswith(path, self._thonny_src_dir)
+            )
+            self._file_interest_cache[path] = result
+
+        return result
+
+    def _create_result_event(self, main_code, duration):
+        files = {}
+        for filename, executed_lines in self._executed_lines.items():
+            if is_same_path(filename, self._main_module_path):
+                code = main_code
+            else:
+                code = _compile_module_file(filename)
+
+            file_result = {"executed": encode_line_set(executed_lines)}
+            if code is not None:
+                file_result["missed"] = encode_line_set(
+                    _get_executable_lines(code) - executed_lines
+                )
+            if self._line_timing:
+                # in the order of executed lines
+                file_result["times"] = [
+                    round(self._line_times.get((filename, lineno), 0), 6)
+                    for lineno in sorted(executed_lines)
+                ]
+            files[filename] = file_result
+
+        return BackendEvent(
+            "CoverageResult",
+            files=files,
+            line_timing=self._line_timing,
+            duration=duration,
+            main_module_path=self._main_module_path,
+        )
+
+
+class MonitoringCoverageTracer(CoverageTracer):
+    """CoverageTracer built on sys.monitoring (PEP 669), available since Python 3.12.
+
+    Without line timing, each line location gets disabled after its first event, so that the
+    code runs almost at full speed after it has been covered.
+    """
+
+    def _install_tracing(self):
+        monitoring = sys.monitoring
+        events = monitoring.events
+        monitoring.use_tool_id(monitoring.COVERAGE_ID, "thonny")
+        if self._line_timing:
+            monitoring.register_callback(monitoring.COVERAGE_ID, events.LINE, self._on_timed_line)
+            monitoring.register_callback(monitoring.COVERAGE_ID, events.PY_RETURN, self._on_exit)
+            monitoring.register_callback(monitoring.COVERAGE_ID, events.PY_YIELD, self._on_exit)
+            monitoring.set_events(
+                monitoring.COVERAGE_ID, events.LINE | events.PY_RETURN | events.PY_YIELD
+            )
+        else:
+            monitoring.register_callback(monitoring.COVERAGE_ID, events.LINE, self._on_line)
+            monitoring.set_events(monitoring.COVERAGE_ID, events.LINE)
+
+    def _uninstall_tracing(self):
+        monitoring = sys.monitoring
+        events = monitoring.events
+        monitoring.set_events(monitoring.COVERAGE_ID, events.NO_EVENTS)
+        for event in [events.LINE, events.PY_RETURN, events.PY_YIELD]:
+            monitoring.register_callback(monitoring.COVERAGE_ID, event, None)
+        monitoring.free_tool_id(monitoring.COVERAGE_ID)
+        # disabled locations would stay disabled for the next user of the tool id
+        monitoring.restart_events()
+
+    def _on_line(self, code, lineno):
+        if self._is_interesting_code(code):
+            self._executed_lines[code.co_filename].add(lineno)
+        return sys.monitoring.DISABLE
+
+    def _on_timed_line(self, code, lineno):
+        if not self._is_interesting_code(code):
+            return sys.monitoring.DISABLE
+
+        self._executed_lines[code.co_filename].add(lineno)
+        self._switch_timed_location((code.co_filename, lineno), time.perf_counter())
+        return None
+
+    def _on_exit(self, code, instruction_offset, retval):
+        if not self._is_interesting_code(code):
+            return sys.monitoring.DISABLE
+
+        self._switch_timed_location(
+            self._find_caller_location(sys._getframe(1)), time.perf_counter()
+        )
+        return None
+
+
+def get_coverage_tracer_class():
+    """Prefers sys.monitoring, unless it's not available or another coverage tool is using it"""
+    if hasattr(sys, "monitoring") and sys.monitoring.get_tool(sys.monitoring.COVERAGE_ID) is None:
+        return MonitoringCoverageTracer
+    else:
+        return CoverageTracer
+
+
+def _compile_module_file(filename):
+    try:
+        with tokenize.open(filename) as fp:
+            return compile(fp.read(), filename, "exec", dont_inherit=True)
+    except Exception:
+        logger.exception("Could not compile %s for finding executable lines", filename)
+        return None
+
+
+def _get_line_starts(code):
+    # line 0 is used for the instructions preceding the first line of a module
+    return {lineno for _, lineno in dis.findlinestarts(code) if lineno}
+
+
+def _get_executable_lines(code):
+    result = set()
+    codes = [code]
+    while codes:
+        code = codes.pop()
+        result.update(_get_line_starts(code))
+        codes.extend(const for const in code.co_consts if isinstance(const, types.CodeType))
+    return result
+
+
 class NiceTracer(Tracer):
     def __init__(self, backend, original_cmd):
         super().__init__(backend, original_cmd)
         self._instrumented_files = set()
         self._install_marker_functions()
         self._custom_stack = []
-        self._saved_states = []
+        self._saved_states = StateHistory()
         self._current_state_index = 0
-
-        from collections import Counter
+        # for sharing unchanged parts between consecutive states
+        self._prev_exported_frames = {}
+        self._prev_exported_globals = {}
 
         self._fulltags = Counter()
         self._nodes = {}
+        # nodes exported while instrumenting the current source get ids starting from the base
+        self._node_id_base = 0
+        self._exported_nodes = []
+        self._code_cache = InstrumentedCodeCache(
+            os.path.join(thonny.THONNY_USER_DIR, "instrumented_code_cache")
+        )
+
+        # With "lazy" fine-grained stepping, expressions inside functions get instrumented only
+        # after the user steps into the function. The function objects get the fine-grained code,
+        # which takes effect with their next call.
+        self._fine_grained_stepping = original_cmd.get("fine_grained_stepping", "lazy")
+        # filename -> (source, mode, lazily instrumented code of the file)
+        self._lazy_sources = {}
+        # lazily instrumented code objects (including nested ones) by id
+        self._lazy_codes = {}
+        # id of lazily instrumented code -> corresponding fine-grained code
+        self._fine_grained_codes = {}
+        self._upgraded_code_ids = set()
 
     def _breakpointhook(self, *args, **kw):
         self._report_state(len(self._saved_states) - 1)
         self._fetch_next_debugger_command(None)
 
+    def _initialize_new_command(self, current_frame):
+        super()._initialize_new_command(current_frame)
+        history_size_mb = self._current_command.get("history_size_mb")
+        if history_size_mb is not None:
+            self._saved_states.memory_limit = history_size_mb * 1024 * 1024
+
+        if (
+            self._current_command.name == "step_into"
+            and current_frame is not None
+            and id(current_frame.system_frame.f_code) in self._lazy_codes
+        ):
+            # The user is interested in the details of this function.
+            # Current call can't get new code, but next calls can.
+            self._use_fine_grained_code(current_frame.system_frame.f_code)
+
     def _install_marker_functions(self):
         # Make dummy marker functions universally available by putting them
         # into builtin scope
@@ -457,23 +1207,102 @@ class NiceTracer(Tracer):
             if not hasattr(builtins, name):
                 setattr(builtins, name, getattr(self, name))
 
+    def _compile_user_code(self, source, filename, ast_postprocessors):
+        if ast_postprocessors:
+            # postprocessors may depend on anything, so the result can't be cached
+            return super()._compile_user_code(source, filename, ast_postprocessors)
+
+        return self._compile_instrumented(source, filename, "exec")
+
+    def _compile_instrumented(
+        self, source: Union[str, bytes], filename: str, mode: str, fine_grained=None
+    ):
+        if fine_grained is None:
+            fine_grained = self._fine_grained_stepping == "everywhere"
+
+        key = _get_instrumentation_key(source, filename, mode, fine_grained)
+        cached = self._code_cache.load(key, _get_node_id_base(key))
+        if cached is not None:
+            code, nodes = cached
+            self._nodes.update(nodes)
+            self._instrumented_files.add(filename)
+        else:
+            root = self._instrument_ast(source, filename, mode, key, fine_grained)
+            code = compile(root, filename, mode, dont_inherit=True)
+            self._code_cache.store(key, code, self._exported_nodes)
+
+        if not fine_grained:
+            self._lazy_sources[filename] = (source, mode, code)
+            # keeping the code objects alive guarantees that their ids don't get reused
+            self._lazy_codes.update((id(c), c) for c in _iter_code_tree(code))
+
+        return code
+
     def _prepare_ast(self, source: Union[str, bytes], filename: str, mode: str):
+        key = _get_instrumentation_key(source, filename, mode, True)
+        return self._instrument_ast(source, filename, mode, key, True)
+
+    def _instrument_ast(
+        self, source: Union[str, bytes], filename: str, mode: str, key: str, fine_grained: bool
+    ):
         # ast_utils need to be imported after asttokens
         # is (custom-)imported
         try_load_modules_with_frontend_sys_path(["asttokens", "six", "astroid"])
         from thonny import ast_utils
 
         root = ast.parse(source, filename, mode)
+        self._node_id_base = _get_node_id_base(key)
+        self._exported_nodes = []
 
         ast_utils.mark_text_ranges(root, source)
         self._tag_nodes(root)
-        self._insert_expression_markers(root)
+        self._insert_expression_markers(root, fine_grained)
         self._insert_statement_markers(root)
         self._insert_for_target_markers(root)
         self._instrumented_files.add(filename)
 
         return root
 
+    def _use_fine_grained_code(self, code):
+        """Gives fine-grained version of the lazily instrumented code to its functions"""
+        fine_code = self._get_fine_grained_code(code)
+        if fine_code is None:
+            return
+
+        # Functions created later from the same code will be updated when they get called
+        self._upgraded_code_ids.add(id(code))
+        for referrer in gc.get_referrers(code):
+            if isinstance(referrer, types.FunctionType) and referrer.__code__ is code:
+                try:
+                    referrer.__code__ = fine_code
+                except ValueError:
+                    logger.exception("Could not replace code of %r", referrer)
+
+    def _get_fine_grained_code(self, code):
+        if id(code) not in self._fine_grained_codes:
+            if code.co_filename not in self._lazy_sources:
+                return None
+
+            # Called from the trace function, so the compilation doesn't get traced
+            source, mode, lazy_root = self._lazy_sources[code.co_filename]
+            fine_root = self._compile_instrumented(source, code.co_filename, mode, True)
+
+            # Expression markers don't create new code objects,
+            # so both versions consist of same code objects in same order
+            for lazy_code, fine_code in zip(_iter_code_tree(lazy_root), _iter_code_tree(fine_root)):
+                if (lazy_code.co_name, lazy_code.co_firstlineno) != (
+                    fine_code.co_name,
+                    fine_code.co_firstlineno,
+                ):
+                    logger.error("Could not match fine-grained code for %s", code.co_filename)
+                    break
+                self._fine_grained_codes[id(lazy_code)] = fine_code
+
+            # code may belong to an older version of the file
+            self._fine_grained_codes.setdefault(id(code), None)
+
+        return self._fine_grained_codes.get(id(code))
+
     def _should_skip_frame(self, frame, event):
         # nice tracer can't skip any of the frames which need to be
         # shown in the stacktrace
@@ -487,17 +1316,19 @@ class NiceTracer(Tracer):
                 return False
 
             else:
-                return not self._is_interesting_frame(frame) or self._backend.is_doing_io()
+                skip = not self._is_interesting_frame(frame) or self._backend.is_doing_io()
+                if skip:
+                    self._skipped_frame_count += 1
+                else:
+                    self._count_traced_frame(code)
+                return skip
 
         else:
             # once we have entered a frame, we need to reach the return event
             return False
 
-    def _is_interesting_frame(self, frame):
-        return (
-            frame.f_code.co_filename in self._instrumented_files
-            and super()._is_interesting_frame(frame)
-        )
+    def _is_interesting_code(self, code):
+        return code.co_filename in self._instrumented_files and super()._is_interesting_code(code)
 
     def find_spec(self, fullname, path=None, target=None):
         spec = PathFinder.find_spec(fullname, path, target)
@@ -575,6 +1406,13 @@ class NiceTracer(Tracer):
                 # it cares about "before_statement" events in the first statement of the body
                 self._custom_stack.append(CustomStackFrame(frame, "call"))
 
+                code_id = id(frame.f_code)
+                if code_id in self._lazy_codes and (
+                    code_id in self._upgraded_code_ids
+                    or self._current_command.name == "step_into"
+                ):
+                    self._use_fine_grained_code(frame.f_code)
+
         elif event == "exception":
             # Note that Nicer can't filter out exception based on current command
             # because it must be possible to go back and replay with different command
@@ -683,6 +1521,22 @@ class NiceTracer(Tracer):
                     (focus, self._backend.export_value(args["value"]))
                 )
 
+        # Conditions get evaluated when the program enters the line, in the present.
+        # Result is kept in the state for responding to the commands later.
+        breakpoint_stop = None
+        if (
+            self._breakpoint_conditions
+            and event in ["before_statement", "before_expression"]
+            and (
+                prev_state_frame is None
+                or id(prev_state_frame.system_frame) != id(frame)
+                or prev_state_frame.focus.lineno != focus.lineno
+            )
+        ):
+            condition = self._get_breakpoint_condition(frame.f_code.co_filename, focus.lineno)
+            if condition is not None:
+                breakpoint_stop = condition.should_stop(frame)
+
         # Save the snapshot.
         # Check if we can share something with previous state
         if (
@@ -723,8 +1577,11 @@ class NiceTracer(Tracer):
             "fresh_exception_id": id(self._fresh_exception),
             "exception_info": exception_info,
         }
+        if breakpoint_stop is not None:
+            msg["breakpoint_stop"] = breakpoint_stop
 
         self._saved_states.append(msg)
+        self._saved_states.trim(self._current_state_index)
 
     def _respond_to_commands(self):
         """Tries to respond to client commands with states collected so far.
@@ -746,16 +1603,28 @@ class NiceTracer(Tracer):
                 cmd_complete = tester(frame, self._current_command)
 
                 if cmd_complete:
+                    # Coalesced rounds of a repeated command are also in client log,
+                    # so that stepping back visits them
                     state["in_client_log"] = True
-                    self._report_state(self._current_state_index)
-                    self._fetch_next_debugger_command(frame)
+                    if self._current_command.get("repeat", 1) > 1:
+                        if self._should_report_animation_state():
+                            self._report_state(self._current_state_index, intermediate=True)
+                        self._repeat_current_command(
+                            frame,
+                            frame_id=id(frame.system_frame),
+                            state=frame.event,
+                            focus=frame.focus,
+                        )
+                    else:
+                        self._report_state(self._current_state_index)
+                        self._fetch_next_debugger_command(frame)
 
             if self._current_command.name == "step_back":
-                if self._current_state_index == 0:
-                    # Already in first state. Remain in this loop
+                if self._current_state_index == self._saved_states.first_index:
+                    # Already in first (retained) state. Remain in this loop
                     pass
                 else:
-                    assert self._current_state_index > 0
+                    assert self._current_state_index > self._saved_states.first_index
                     # Current event is no longer present in GUI "undo log"
                     self._saved_states[self._current_state_index]["in_client_log"] = False
                     self._current_state_index -= 1
@@ -766,7 +1635,7 @@ class NiceTracer(Tracer):
     def _create_actual_active_frame(self, state):
         return state["stack"][-1]._replace(**state["active_frame_overrides"])
 
-    def _report_state(self, state_index):
+    def _report_state(self, state_index, intermediate=False):
         in_present = state_index == len(self._saved_states) - 1
         if in_present:
             # For reported new events re-export stack to make sure it is not shared.
@@ -783,6 +1652,8 @@ class NiceTracer(Tracer):
         state["stack"] = state["stack"].copy()
 
         state["in_present"] = in_present
+        if intermediate:
+            state["intermediate"] = True
         if not in_present:
             # for past states fix the newest frame
             state["stack"][-1] = self._create_actual_active_frame(state)
@@ -798,9 +1669,9 @@ class NiceTracer(Tracer):
             module_name = system_frame.f_globals.get("__name__", None)
             code_name = system_frame.f_code.co_name
 
-            source, firstlineno, in_library = self._backend._get_frame_source_info(system_frame)
+            source_info = self._backend._get_frame_source_info(system_frame)
 
-            assert firstlineno is not None, "nofir " + str(system_frame)
+            assert source_info.firstlineno is not None, "nofir " + str(system_frame)
             frame_id = id(system_frame)
             new_stack.append(
                 FrameInfo(
@@ -811,10 +1682,12 @@ class NiceTracer(Tracer):
                     locals=tframe.locals,
                     globals=tframe.globals,
                     freevars=system_frame.f_code.co_freevars,
-                    source=source,
+                    source=source_info.source,
+                    source_id=source_info.source_id,
+                    source_hash=source_info.source_hash,
                     lineno=system_frame.f_lineno,
-                    firstlineno=firstlineno,
-                    in_library=in_library,
+                    firstlineno=source_info.firstlineno,
+                    in_library=source_info.in_library,
                     event=tframe.event,
                     focus=tframe.focus,
                     node_tags=tframe.node_tags,
@@ -828,6 +1701,7 @@ class NiceTracer(Tracer):
 
         state["stack"] = new_stack
         state["tracer_class"] = "NiceTracer"
+        state["history_info"] = self._saved_states.get_info()
 
         self._backend.send_message(DebuggerResponse(**state))
 
@@ -920,11 +1794,11 @@ class NiceTracer(Tracer):
         # Check if the selected message has been previously sent to front-end
         return (
             self._saved_states[self._current_state_index]["in_client_log"]
-            or self._current_state_index == 0
+            or self._current_state_index == self._saved_states.first_index
         )
 
     def _cmd_step_out_completed(self, frame, cmd):
-        if self._current_state_index == 0:
+        if self._current_state_index == self._saved_states.first_index:
             return False
 
         if frame.event == "after_statement":
@@ -950,10 +1824,31 @@ class NiceTracer(Tracer):
     def _cmd_resume_completed(self, frame, cmd):
         return self._at_a_breakpoint(frame, cmd)
 
+    def _cmd_step_until_completed(self, frame, cmd):
+        if self._at_a_breakpoint(frame, cmd):
+            return True
+
+        if id(frame.system_frame) == cmd.frame_id:
+            target = {frame.system_frame.f_code.co_filename: {cmd.target_lineno}}
+            return self._at_a_breakpoint_line(frame, cmd, target)
+        else:
+            # keep running in successor frames
+            return not self._frame_is_alive(cmd.frame_id)
+
     def _at_a_breakpoint(self, frame, cmd, breakpoints=None):
         if breakpoints is None:
             breakpoints = cmd["breakpoints"]
 
+        if not self._at_a_breakpoint_line(frame, cmd, breakpoints):
+            return False
+
+        filename = frame.system_frame.f_code.co_filename
+        return (
+            self._get_breakpoint_condition(filename, frame.focus.lineno) is None
+            or self._saved_states[self._current_state_index].get("breakpoint_stop", False)
+        )
+
+    def _at_a_breakpoint_line(self, frame, cmd, breakpoints):
         return (
             frame.event in ["before_statement", "before_expression"]
             and frame.system_frame.f_code.co_filename in breakpoints
@@ -982,8 +1877,9 @@ class NiceTracer(Tracer):
 
         def export_globals(module_name, frame):
             if module_name not in exported_globals_per_module:
-                exported_globals_per_module[module_name] = self._backend.export_variables(
-                    frame.f_globals
+                exported_globals_per_module[module_name] = self._share_unchanged(
+                    self._backend.export_variables(frame.f_globals),
+                    self._prev_exported_globals.get(module_name),
                 )
             return exported_globals_per_module[module_name]
 
@@ -991,28 +1887,46 @@ class NiceTracer(Tracer):
             system_frame = custom_frame.system_frame
             module_name = system_frame.f_globals.get("__name__", None)
 
-            result.append(
-                TempFrameInfo(
-                    # need to store the reference to the frame to avoid it being GC-d
-                    # otherwise frame id-s would be reused and this would
-                    # mess up communication with the frontend.
-                    system_frame=system_frame,
-                    locals=None
-                    if system_frame.f_locals is system_frame.f_globals
-                    else self._backend.export_variables(system_frame.f_locals),
-                    globals=export_globals(module_name, system_frame),
-                    event=custom_frame.event,
-                    focus=custom_frame.focus,
-                    node_tags=custom_frame.node_tags,
-                    current_evaluations=custom_frame.current_evaluations.copy(),
-                    current_statement=custom_frame.current_statement,
-                    current_root_expression=custom_frame.current_root_expression,
+            prev_frame_info = self._prev_exported_frames.get(id(system_frame))
+            if prev_frame_info is not None and prev_frame_info.system_frame is not system_frame:
+                prev_frame_info = None
+
+            if system_frame.f_locals is system_frame.f_globals:
+                frame_locals = None
+            else:
+                frame_locals = self._share_unchanged(
+                    self._backend.export_variables(system_frame.f_locals),
+                    None if prev_frame_info is None else prev_frame_info.locals,
                 )
+
+            frame_info = TempFrameInfo(
+                # need to store the reference to the frame to avoid it being GC-d
+                # otherwise frame id-s would be reused and this would
+                # mess up communication with the frontend.
+                system_frame=system_frame,
+                locals=frame_locals,
+                globals=export_globals(module_name, system_frame),
+                event=custom_frame.event,
+                focus=custom_frame.focus,
+                node_tags=custom_frame.node_tags,
+                current_evaluations=custom_frame.current_evaluations.copy(),
+                current_statement=custom_frame.current_statement,
+                current_root_expression=custom_frame.current_root_expression,
             )
+            result.append(self._share_unchanged(frame_info, prev_frame_info))
 
         assert result  # not empty
+        self._prev_exported_frames = {id(frame.system_frame): frame for frame in result}
+        self._prev_exported_globals = exported_globals_per_module
         return result
 
+    def _share_unchanged(self, value, prev_value):
+        # Lets consecutive states share the objects, which didn't change (see cp_history)
+        if prev_value is not None and value == prev_value:
+            return prev_value
+        else:
+            return value
+
     def _thonny_hidden_before_stmt(self, node_id):
         # The code to be debugged will be instrumented with this function
         # inserted before each statement.
@@ -1351,7 +2265,7 @@ class NiceTracer(Tracer):
 
                 ast.fix_missing_locations(node)
 
-    def _insert_expression_markers(self, node):
+    def _insert_expression_markers(self, node, in_functions=True):
         """
         TODO: this docstring is outdated
         each expression e gets wrapped like this:
@@ -1363,6 +2277,8 @@ class NiceTracer(Tracer):
             _node_is_zoomable indicates whether this node has subexpressions
             _node_role is either 'last_call_arg', 'last_op_arg', 'first_or_arg',
                                  'first_and_arg', 'function' or None
+
+        If in_functions is False, then bodies of functions and lambdas are left as they are.
         """
         tracer = self
 
@@ -1381,6 +2297,10 @@ class NiceTracer(Tracer):
 
                         if "ignore_children" in node.tags:
                             transformed_node = node
+                        elif isinstance(node, ast.Lambda) and not in_functions:
+                            # only defaults are evaluated in the enclosing scope
+                            node.args = self.visit(node.args)
+                            transformed_node = node
                         else:
                             transformed_node = ast.NodeTransformer.generic_visit(self, node)
 
@@ -1404,6 +2324,14 @@ class NiceTracer(Tracer):
                 elif tracer._is_case_pattern(node):
                     # ignore this and children
                     return node
+                elif not in_functions and isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    # decorators, defaults and annotations are evaluated in the enclosing scope
+                    body = node.body
+                    node.body = []
+                    try:
+                        return ast.NodeTransformer.generic_visit(self, node)
+                    finally:
+                        node.body = body
                 else:
                     # Descend into statements
                     return ast.NodeTransformer.generic_visit(self, node)
@@ -1417,9 +2345,10 @@ class NiceTracer(Tracer):
 
     def _export_node(self, node):
         assert isinstance(node, (ast.expr, ast.stmt))
-        node_id = id(node)
+        node_id = self._node_id_base + len(self._exported_nodes)
+        self._exported_nodes.append(node)
         self._nodes[node_id] = node
-        return ast.Num(node_id)
+        return ast.Constant(node_id)
 
     def _debug(self, *args):
         logger.debug("TRACER: " + str(args))
@@ -1447,12 +2376,51 @@ class FancySourceFileLoader(SourceFileLoader):
         old_tracer = sys.gettrace()
         sys.settrace(None)
         try:
-            root = self._tracer._prepare_ast(data, path, "exec")
-            return super().source_to_code(root, path)
+            return self._tracer._compile_instrumented(data, path, "exec")
         finally:
             sys.settrace(old_tracer)
 
 
+@functools.lru_cache(maxsize=None)
+def _get_instrumentation_version() -> bytes:
+    """Changes when Python or the code responsible for the instrumentation changes"""
+    result = hashlib.sha256(importlib.util.MAGIC_NUMBER + sys.version.encode("utf-8"))
+    for path in [__file__, os.path.join(os.path.dirname(thonny.__file__), "ast_utils.py")]:
+        try:
+            with open(path, "rb") as fp:
+                result.update(fp.read())
+        except OSError:
+            logger.warning("Could not read %s", path)
+
+    return result.digest()
+
+
+def _get_instrumentation_key(
+    source: Union[str, bytes], filename: str, mode: str, fine_grained: bool
+) -> str:
+    if isinstance(source, str):
+        source = source.encode("utf-8", errors="surrogatepass")
+
+    result = hashlib.sha256(_get_instrumentation_version())
+    header = "%s\0%s\0%s\0" % (filename, mode, fine_grained)
+    result.update(header.encode("utf-8", errors="surrogatepass"))
+    result.update(source)
+    return result.hexdigest()
+
+
+def _iter_code_tree(code):
+    yield code
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            yield from _iter_code_tree(const)
+
+
+def _get_node_id_base(key: str) -> int:
+    # Ids of the nodes get baked into the code, therefore nodes of different sources
+    # must not share ids, no matter whether the code was instrumented in this process or not.
+    return int(key[:10], 16) << 24
+
+
 class CustomStackFrame:
     def __init__(self, frame, event, focus=None):
         self.system_frame = frame
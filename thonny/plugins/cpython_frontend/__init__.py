@@ -12,6 +12,8 @@ def load_plugin():
     wb.set_default("run.backend_name", "LocalCPython")
     wb.set_default("LocalCPython.last_executables", [])
     wb.set_default("LocalCPython.executable", get_default_cpython_executable_for_backend())
+    # Set to False for falling back to the text format, eg. for debugging the communication
+    wb.set_default("LocalCPython.binary_messages", True)
 
     if wb.get_option("run.backend_name") in ["PrivateVenv", "SameAsFrontend", "CustomCPython"]:
         # Removed in Thonny 4.0
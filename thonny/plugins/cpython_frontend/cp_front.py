@@ -7,11 +7,13 @@ import tkinter as tk
 import traceback
 from logging import getLogger
 from tkinter import messagebox, ttk
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional
 
 import thonny
 from thonny import get_runner, get_shell, get_workbench, running, ui_utils
 from thonny.common import (
+    BINARY_MESSAGE_FORMAT,
+    TEXT_MESSAGE_FORMAT,
     InlineCommand,
     InlineResponse,
     ToplevelCommand,
@@ -61,11 +63,18 @@ class LocalCPythonProxy(SubprocessProxy):
                 {
                     "run.warn_module_shadowing": get_workbench().get_option(
                         "run.warn_module_shadowing"
-                    )
+                    ),
+                    "run.message_format": self._get_requested_message_format(),
                 }
             ),
         ]
 
+    def _get_requested_message_format(self) -> str:
+        if get_workbench().get_option("LocalCPython.binary_messages"):
+            return BINARY_MESSAGE_FORMAT
+        else:
+            return TEXT_MESSAGE_FORMAT
+
     def can_be_isolated(self) -> bool:
         # Can't run in isolated mode as it would hide user site-packages
         return False
@@ -178,6 +187,16 @@ class LocalCPythonProxy(SubprocessProxy):
     def can_debug(self) -> bool:
         return True
 
+    def can_profile(self) -> bool:
+        return True
+
+    def can_measure_coverage(self) -> bool:
+        return True
+
+    def get_sys_path_for_analysis(self) -> Optional[List[str]]:
+        # empty until the back-end has reported its environment
+        return self.get_sys_path() or None
+
     def can_run_in_terminal(self) -> bool:
         return True
 
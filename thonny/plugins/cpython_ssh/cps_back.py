@@ -183,10 +183,11 @@ class SshCPythonBackend(BaseBackend, SshMixin):
 
         import thonny.ast_utils
         import thonny.backend
+        import thonny.document
         import thonny.jedi_utils
         import thonny.plugins.cpython_backend.cp_back
 
-        # Don't want to import cp_back_launcher and cp_tracers
+        # Don't want to import cp_back_launcher, cp_tracers and cp_profiler
 
         local_context = os.path.dirname(os.path.dirname(thonny.__file__))
         for local_path in [
@@ -195,10 +196,18 @@ class SshCPythonBackend(BaseBackend, SshMixin):
             thonny.ast_utils.__file__,
             thonny.jedi_utils.__file__,
             thonny.backend.__file__,
+            thonny.document.__file__,
             thonny.plugins.cpython_backend.__file__,
             thonny.plugins.cpython_backend.cp_back.__file__,
             thonny.plugins.cpython_backend.cp_back.__file__.replace("cp_back.py", "cp_launcher.py"),
             thonny.plugins.cpython_backend.cp_back.__file__.replace("cp_back.py", "cp_tracers.py"),
+            thonny.plugins.cpython_backend.cp_back.__file__.replace("cp_back.py", "cp_heap.py"),
+            thonny.plugins.cpython_backend.cp_back.__file__.replace("cp_back.py", "cp_repr.py"),
+            thonny.plugins.cpython_backend.cp_back.__file__.replace("cp_back.py", "cp_history.py"),
+            thonny.plugins.cpython_backend.cp_back.__file__.replace("cp_back.py", "cp_profiler.py"),
+            thonny.plugins.cpython_backend.cp_back.__file__.replace(
+                "cp_back.py", "cp_code_cache.py"
+            ),
         ]:
             local_suffix = local_path[len(local_context) :]
             remote_path = launch_dir + local_suffix.replace("\\", "/")
@@ -30,6 +30,12 @@ class SshCPythonProxy(SubprocessProxy):
     def can_debug(self) -> bool:
         return True
 
+    def can_profile(self) -> bool:
+        return True
+
+    def can_measure_coverage(self) -> bool:
+        return True
+
     def _get_launcher_with_args(self):
         launcher_file = os.path.join(os.path.dirname(__file__), "cps_back.py")
         return [
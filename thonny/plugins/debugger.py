@@ -25,7 +25,7 @@ from thonny import (
     ui_utils,
 )
 from thonny.codeview import CodeView, SyntaxText, get_syntax_options_for_tag
-from thonny.common import DebuggerCommand, InlineCommand
+from thonny.common import DebuggerCommand, InlineCommand, is_same_path
 from thonny.custom_notebook import CustomNotebook
 from thonny.languages import tr
 from thonny.memory import VariablesFrame
@@ -39,14 +39,28 @@ _current_debugger = None
 
 RESUME_COMMAND_CAPTION = ""  # Init later when gettext is loaded
 
+# Steps, which can be issued again before the result of the previous one has been shown
+_REPEATABLE_COMMANDS = ["step_into", "step_over", "step_out", "step_back"]
+
+# minimum time between intermediate states of repeated steps (in seconds)
+_ANIMATION_INTERVAL = 0.1
+
 
 class Debugger:
     def __init__(self):
         self._last_progress_message = None
         self._last_brought_out_frame_id = None
         self._editor_context_menu = None
+        self._last_debugger_command = None
+        self._pending_repeat_count = 0
 
     def check_issue_command(self, command, **kwargs):
+        if self._can_repeat_running_command(command):
+            # Eg. the key is being held down. Instead of waiting in lock-step for each state,
+            # the pending steps get sent as one command after the running one completes.
+            self._pending_repeat_count += 1
+            return
+
         cmd = DebuggerCommand(command, **kwargs)
         self._last_debugger_command = cmd
 
@@ -57,15 +71,24 @@ class Debugger:
             cmd.setdefault(
                 frame_id=self._last_progress_message.stack[-1].id,
                 breakpoints=self.get_effective_breakpoints(command),
+                breakpoint_options=self.get_effective_breakpoint_options(command),
                 state=self._last_progress_message.stack[-1].event,
                 focus=self._last_progress_message.stack[-1].focus,
                 allow_stepping_into_libraries=get_workbench().get_option(
                     "debugger.allow_stepping_into_libraries"
                 ),
+                history_size_mb=get_workbench().get_option("debugger.history_size_mb"),
             )
+            if cmd.get("repeat", 1) > 1 and get_workbench().get_option(
+                "debugger.animate_repeated_steps"
+            ):
+                cmd.setdefault(animation_interval=_ANIMATION_INTERVAL)
             if command == "run_to_cursor":
                 # cursor position was added as another breakpoint
                 cmd.name = "resume"
+            elif command == "step_to_cursor":
+                cmd.name = "step_until"
+                cmd.setdefault(target_lineno=self.get_run_to_cursor_breakpoint()[1])
 
             get_runner().send_command(cmd)
             if command == "resume":
@@ -73,6 +96,20 @@ class Debugger:
         else:
             logger.debug("Bad state for sending debugger command " + str(command))
 
+    def _can_repeat_running_command(self, command):
+        return (
+            command in _REPEATABLE_COMMANDS
+            and get_runner().get_state() == "running"
+            and self._last_debugger_command is not None
+            and self._last_debugger_command.name == command
+        )
+
+    def send_pending_repeats(self):
+        if self._pending_repeat_count and get_runner().is_waiting_debugger_command():
+            repeat = self._pending_repeat_count
+            self._pending_repeat_count = 0
+            self.check_issue_command(self._last_debugger_command.name, repeat=repeat)
+
     def get_run_to_cursor_breakpoint(self):
         return None
 
@@ -88,12 +125,30 @@ class Debugger:
 
         return result
 
+    def get_effective_breakpoint_options(self, command):
+        result = editors.get_current_breakpoint_options()
+
+        if command == "run_to_cursor":
+            bp = self.get_run_to_cursor_breakpoint()
+            if bp is not None:
+                # cursor position is an unconditional breakpoint
+                filename, lineno = bp
+                result.get(filename, {}).pop(lineno, None)
+
+        return result
+
     def command_enabled(self, command):
         if not get_runner().is_waiting_debugger_command():
-            return False
+            return self._can_repeat_running_command(command)
 
         if command == "run_to_cursor":
             return self.get_run_to_cursor_breakpoint() is not None
+        elif command == "step_to_cursor":
+            # only for the line in the active frame
+            bp = self.get_run_to_cursor_breakpoint()
+            return bp is not None and is_same_path(
+                bp[0], self._last_progress_message.stack[-1].filename
+            )
         elif command == "step_back":
             return (
                 self._last_progress_message
@@ -110,6 +165,7 @@ class Debugger:
 
     def close(self) -> None:
         self._last_brought_out_frame_id = None
+        self._pending_repeat_count = 0
 
         if get_workbench().get_option("debugger.automatic_stack_view"):
             get_workbench().hide_view("StackView")
@@ -729,7 +785,9 @@ class BaseExpressionBox:
         self.text.tag_bind(
             object_tag,
             sequence,
-            lambda _: get_workbench().event_generate("ObjectSelect", object_id=value.id),
+            lambda _: get_workbench().event_generate(
+                "ObjectSelect", object_id=value.id, generation=value.generation
+            ),
         )
 
     def _load_expression(self, whole_source: str, filename, text_range):
@@ -1028,8 +1086,14 @@ class ModuleLoadDialog(DialogVisualizer):
 class StackView(ui_utils.TreeFrame):
     def __init__(self, master):
         super().__init__(
-            master, ("function", "location", "id"), displaycolumns=("function", "location")
+            master,
+            ("function", "location", "id"),
+            displaycolumns=("function", "location"),
+            show_statusbar=True,
         )
+        self.history_label = ttk.Label(self.statusbar, text="", anchor="w")
+        self.history_label.grid(row=0, column=0, sticky="w")
+        self.statusbar.columnconfigure(0, weight=1)
 
         # self.tree.configure(show="tree")
         self.tree.column("#0", width=0, anchor=tk.W, stretch=False)
@@ -1040,9 +1104,13 @@ class StackView(ui_utils.TreeFrame):
         self.tree.heading("location", text=tr("Location"), anchor=tk.W)
 
         get_workbench().bind("DebuggerResponse", self._update_stack, True)
-        get_workbench().bind("ToplevelResponse", lambda e=None: self._clear_tree(), True)
+        get_workbench().bind("ToplevelResponse", self._handle_toplevel_response, True)
         get_workbench().bind("debugger_return_response", self._handle_debugger_return, True)
 
+    def _handle_toplevel_response(self, msg):
+        self._clear_tree()
+        self.history_label.configure(text="")
+
     def _update_stack(self, msg):
         self._clear_tree()
 
@@ -1063,6 +1131,19 @@ class StackView(ui_utils.TreeFrame):
             self.tree.selection_add(node_id)
             self.tree.focus(node_id)
 
+        self._update_history_label(msg.get("history_info"))
+
+    def _update_history_label(self, info):
+        if info is None:
+            # FastTracer doesn't keep history
+            self.history_label.configure(text="")
+            return
+
+        text = tr("History") + ": %d steps, %.1f MB" % (info["count"], info["size"] / 1024 / 1024)
+        if info["first_index"] > 0:
+            text += " (" + tr("oldest %d steps dropped") % info["first_index"] + ")"
+        self.history_label.configure(text=text)
+
     def _handle_debugger_return(self, msg):
         delete = False
         for iid in self.tree.get_children():
@@ -1217,6 +1298,8 @@ def _handle_debugger_progress(msg):
     assert _current_debugger is not None
     _current_debugger.handle_debugger_progress(msg)
     _update_run_or_resume_button()
+    if not msg.get("intermediate"):
+        _current_debugger.send_pending_repeats()
 
 
 def _handle_toplevel_response(msg):
@@ -1294,6 +1377,9 @@ def load_plugin() -> None:
         "debugger.preferred_debugger", "faster" if running_on_rpi() else "nicer"
     )
     get_workbench().set_default("debugger.allow_stepping_into_libraries", False)
+    get_workbench().set_default("debugger.history_size_mb", 100)
+    get_workbench().set_default("debugger.fine_grained_stepping", "lazy")
+    get_workbench().set_default("debugger.animate_repeated_steps", False)
 
     get_workbench().add_command(
         "runresume",
@@ -1409,6 +1495,16 @@ def load_plugin() -> None:
         include_in_toolbar=False,
     )
 
+    get_workbench().add_command(
+        "step_to_cursor",
+        "run",
+        tr("Step to cursor"),
+        lambda: _issue_debugger_command("step_to_cursor"),
+        tester=lambda: _debugger_command_enabled("step_to_cursor"),
+        group=30,
+        include_in_toolbar=False,
+    )
+
     get_workbench().add_command(
         "step_back",
         "run",
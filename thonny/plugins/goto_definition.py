@@ -7,7 +7,7 @@ from typing import Set, cast
 from thonny import get_runner, get_workbench
 from thonny.codeview import CodeViewText, SyntaxText
 from thonny.common import InlineCommand
-from thonny.editor_helpers import get_relevant_source_and_cursor_position, get_text_filename
+from thonny.editor_helpers import get_analysis_args
 from thonny.languages import tr
 from thonny.misc_utils import running_on_mac_os
 from thonny.ui_utils import command_is_pressed, control_is_pressed, get_hyperlink_cursor
@@ -34,16 +34,10 @@ class GotoHandler:
         assert isinstance(event.widget, CodeViewText)
         text = event.widget
 
-        source, row, column = get_relevant_source_and_cursor_position(text)
-        filename = get_text_filename(text)
         if not get_runner() or not get_runner().get_backend_proxy():
             return
 
-        get_runner().send_command(
-            InlineCommand(
-                "get_definitions", source=source, row=row, column=column, filename=filename
-            )
-        )
+        get_runner().send_command(InlineCommand("get_definitions", **get_analysis_args(text)))
 
     def proper_modifier_is_pressed(self, event: tk.Event) -> bool:
         if running_on_mac_os():
@@ -11,10 +11,19 @@ from thonny.languages import tr
 from thonny.memory import MAX_REPR_LENGTH_IN_GRID, MemoryFrame, format_object_id, parse_object_id
 from thonny.misc_utils import shorten_repr
 
+HEAP_PAGE_SIZE = 500
+
 
 class HeapView(MemoryFrame):
     def __init__(self, master):
-        MemoryFrame.__init__(self, master, ("id", "value"))
+        MemoryFrame.__init__(self, master, ("id", "value"), show_statusbar=True)
+        self._next_offset = 0
+        self._total_count = 0
+        self._requesting_page = False
+        # more pages get requested when user scrolls to the end
+        self.tree.configure(yscrollcommand=self._on_tree_scroll)
+        self._status_label = ttk.Label(self.statusbar)
+        self._status_label.grid(row=0, column=0, sticky="w", padx=5)
 
         self.tree.column("id", width=100, anchor=tk.W, stretch=False)
         self.tree.column("value", width=150, anchor=tk.W, stretch=True)
@@ -42,15 +51,46 @@ class HeapView(MemoryFrame):
             padding=(3, 0),
         )
 
-    def _update_data(self, data):
-        self._clear_tree()
+    def _update_data(self, msg):
+        offset = msg.get("offset", 0)
+        if offset == 0:
+            self._clear_tree()
+        elif offset != self._next_offset:
+            # belongs to an outdated listing
+            return
+
+        data = msg.heap
         for value_id in sorted(data.keys()):
             node_id = self.tree.insert("", "end")
             self.tree.set(node_id, "id", format_object_id(value_id))
+            self._object_generations[value_id] = data[value_id].generation
             self.tree.set(
                 node_id, "value", shorten_repr(data[value_id].repr, MAX_REPR_LENGTH_IN_GRID)
             )
 
+        self._next_offset = offset + HEAP_PAGE_SIZE
+        self._total_count = msg.get("total_count", len(data))
+        self._update_status(msg.get("stats", None))
+
+    def _update_status(self, stats):
+        text = tr("Showing %d of %d objects") % (
+            len(self.tree.get_children()),
+            self._total_count,
+        )
+        if stats:
+            text += ", " + tr("%d evicted") % stats["eviction_count"]
+        self._status_label.configure(text=text)
+
+    def _on_tree_scroll(self, first, last):
+        self.vert_scrollbar.set(first, last)
+        if (
+            float(last) >= 1.0
+            and self._next_offset < self._total_count
+            and not self._requesting_page
+            and self.winfo_ismapped()
+        ):
+            self._request_page(self._next_offset)
+
     def before_show(self):
         self._request_heap_data(even_when_hidden=True)
 
@@ -64,13 +104,20 @@ class HeapView(MemoryFrame):
     def _request_heap_data(self, msg=None, even_when_hidden=False):
         if self.winfo_ismapped() or even_when_hidden:
             # TODO: update itself also when it becomes visible
-            if get_runner() is not None:
-                get_runner().send_command(InlineCommand("get_heap"))
+            self._request_page(0)
+
+    def _request_page(self, offset):
+        if get_runner() is not None:
+            self._requesting_page = True
+            get_runner().send_command(
+                InlineCommand("get_heap", offset=offset, limit=HEAP_PAGE_SIZE)
+            )
 
     def _handle_heap_event(self, msg):
+        self._requesting_page = False
         if self.winfo_ismapped():
             if hasattr(msg, "heap"):
-                self._update_data(msg.heap)
+                self._update_data(msg)
 
     def _on_map(self, event):
         self.info_label.grid(row=0, column=1005)
@@ -6,7 +6,7 @@ from tkinter import messagebox
 from thonny import get_runner, get_workbench
 from thonny.codeview import SyntaxText
 from thonny.common import InlineCommand
-from thonny.editor_helpers import get_text_filename
+from thonny.editor_helpers import get_analysis_args
 from thonny.languages import tr
 
 logger = getLogger(__name__)
@@ -64,19 +64,15 @@ class OccurrencesHighlighter:
 
     def _request(self):
         self._clear()
-        row, column = map(int, self.text.index("insert").split("."))
         runner = get_runner()
-        if not runner or runner.is_running():
+        if not runner or not runner.is_ready_for_editor_analysis():
             return
 
         runner.send_command(
             InlineCommand(
                 "highlight_occurrences",
-                filename=get_text_filename(self.text),
-                source=self.text.get("1.0", "end"),
-                row=row,
-                column=column,
                 text_last_operation_time=self.text.get_last_operation_time(),
+                **get_analysis_args(self.text),
             )
         )
 
@@ -121,5 +117,5 @@ def load_plugin() -> None:
     wb = get_workbench()
     wb.set_default("view.name_highlighting", True)
     wb.bind_class("EditorCodeViewText", "<<CursorMove>>", update_highlighting, True)
-    wb.bind_class("EditorCodeViewText", "<<TextChange>>", update_highlighting, True)
+    wb.bind_class("EditorCodeViewText", "<<DocumentUpdated>>", update_highlighting, True)
     wb.bind("<<UpdateAppearance>>", update_highlighting, True)
@@ -61,8 +61,10 @@ class LocalsHighlighter:
                 for child in node.children:
                     process_node(child, local_names, global_names)
 
-        source = self.text.get("1.0", "end")
-        module = parso.parse(source)
+        if hasattr(self.text, "get_document"):
+            module = self.text.get_document().get_tree()
+        else:
+            module = parso.parse(self.text.get("1.0", "end"))
         for child in module.children:
             if isinstance(child, tree.BaseNode) and parser_utils.is_scope(child):
                 process_scope(child)
@@ -121,5 +123,5 @@ def update_highlighting(event):
 def load_plugin() -> None:
     wb = get_workbench()
     wb.set_default("view.locals_highlighting", False)
-    wb.bind_class("CodeViewText", "<<TextChange>>", update_highlighting, True)
+    wb.bind_class("CodeViewText", "<<DocumentUpdated>>", update_highlighting, True)
     wb.bind("<<UpdateAppearance>>", update_highlighting, True)
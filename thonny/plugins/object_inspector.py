@@ -21,6 +21,7 @@ class ObjectInspector(ttk.Frame):
         ttk.Frame.__init__(self, master, style="ViewBody.TFrame")
 
         self.object_id = None
+        self.object_generation = None
         self.object_info = None
 
         # self._create_general_page()
@@ -169,9 +170,9 @@ class ObjectInspector(ttk.Frame):
         self._show_object_by_id(self.forward_links.pop(), True)
 
     def show_object(self, event):
-        self._show_object_by_id(event.object_id)
+        self._show_object_by_id(event.object_id, generation=event.get("generation", None))
 
-    def _show_object_by_id(self, object_id, via_navigation=False):
+    def _show_object_by_id(self, object_id, via_navigation=False, generation=None):
         assert object_id is not None
 
         if self.winfo_ismapped() and self.object_id != object_id:
@@ -183,6 +184,7 @@ class ObjectInspector(ttk.Frame):
 
             context_id = self.object_id
             self.object_id = object_id
+            self.object_generation = generation
             self.set_object_info(None)
             self._set_title("object @ " + thonny.memory.format_object_id(object_id))
             self.request_object_info(context_id=context_id)
@@ -190,6 +192,7 @@ class ObjectInspector(ttk.Frame):
     def _on_backend_restart(self, event=None):
         self.set_object_info(None)
         self.object_id = None
+        self.object_generation = None
 
     def _set_title(self, text):
         self.title_label.configure(text=text)
@@ -205,6 +208,8 @@ class ObjectInspector(ttk.Frame):
                     self.object_id = None
                     self.set_object_info(None)
                 else:
+                    # refreshes must get the same object, not a new one with the same id
+                    self.object_generation = msg.info.get("generation", self.object_generation)
                     self.set_object_info(msg.info)
 
     def _handle_progress_event(self, event):
@@ -227,10 +232,16 @@ class ObjectInspector(ttk.Frame):
             frame_width = None
             frame_height = None
 
+        items_limit = get_workbench().get_option("object_inspector.page_size")
+        if isinstance(self.current_content_inspector, ItemsInspector):
+            # refreshing shouldn't drop the rows user has scrolled to
+            items_limit = max(items_limit, self.current_content_inspector.get_loaded_count())
+
         get_runner().send_command(
             InlineCommand(
                 "get_object_info",
                 object_id=self.object_id,
+                generation=self.object_generation,
                 context_id=context_id,
                 back_links=self.back_links,
                 forward_links=self.forward_links,
@@ -238,6 +249,7 @@ class ObjectInspector(ttk.Frame):
                 all_attributes=False,
                 frame_width=frame_width,
                 frame_height=frame_height,
+                items_limit=items_limit,
             )
         )
 
@@ -522,12 +534,100 @@ class ReprInspector(TextFrame, ContentInspector):
         """
 
 
-class ElementsInspector(thonny.memory.MemoryFrame, ContentInspector):
-    def __init__(self, master):
+class ItemsInspector(thonny.memory.MemoryFrame, ContentInspector):
+    """Base class for inspectors of collections.
+
+    Items are fetched page by page, next page gets requested when user scrolls to the end.
+    """
+
+    items_key = None  # type: str
+
+    def __init__(self, master, columns):
         ContentInspector.__init__(self, master)
-        thonny.memory.MemoryFrame.__init__(
-            self, master, ("index", "id", "value"), show_statusbar=True
-        )
+        thonny.memory.MemoryFrame.__init__(self, master, columns, show_statusbar=True)
+        self.tree.configure(yscrollcommand=self._on_tree_scroll)
+
+        self.len_label = ttk.Label(self.statusbar, text="", anchor="w")
+        self.len_label.grid(row=0, column=0, sticky="w")
+        self.statusbar.columnconfigure(0, weight=1)
+
+        self.context_id = None
+        self._generation = None
+        self._loaded_count = 0
+        self._items_count = 0
+        self._requesting_page = False
+
+        get_workbench().bind("get_object_items_response", self._handle_items_response, True)
+
+    def applies_to(self, object_info):
+        return self.items_key in object_info
+
+    def get_loaded_count(self):
+        return self._loaded_count
+
+    def set_object_info(self, object_info):
+        assert self.items_key in object_info
+        self.context_id = object_info["id"]
+        self._generation = object_info.get("generation", None)
+        self._requesting_page = False
+
+        self._clear_tree()
+        self._loaded_count = 0
+        items = object_info[self.items_key]
+        # MicroPython back-ends send all items at once
+        self._items_count = object_info.get("items_count", len(items))
+        self._append_items(items)
+
+    def _insert_item(self, index, item):
+        raise NotImplementedError()
+
+    def _append_items(self, items):
+        for item in items:
+            self._insert_item(self._loaded_count, item)
+            self._loaded_count += 1
+
+        text = " len: %d" % self._items_count
+        if self._loaded_count < self._items_count:
+            text += " (" + tr("showing %d") % self._loaded_count + ")"
+        self.len_label.configure(text=text)
+
+    def _on_tree_scroll(self, first, last):
+        self.vert_scrollbar.set(first, last)
+        if (
+            float(last) >= 1.0
+            and self._loaded_count < self._items_count
+            and not self._requesting_page
+            and self.winfo_ismapped()
+        ):
+            self._requesting_page = True
+            get_runner().send_command(
+                InlineCommand(
+                    "get_object_items",
+                    object_id=self.context_id,
+                    generation=self._generation,
+                    offset=self._loaded_count,
+                    limit=get_workbench().get_option("object_inspector.page_size"),
+                )
+            )
+
+    def _handle_items_response(self, msg):
+        if msg.get("object_id") != self.context_id:
+            return
+
+        self._requesting_page = False
+        if self.items_key not in msg or msg.get("offset") != self._loaded_count:
+            # object is gone or the listing has been refreshed meanwhile
+            return
+
+        self._items_count = msg.get("items_count", self._items_count)
+        self._append_items(msg[self.items_key])
+
+
+class ElementsInspector(ItemsInspector):
+    items_key = "elements"
+
+    def __init__(self, master):
+        ItemsInspector.__init__(self, master, ("index", "id", "value"))
 
         # self.vert_scrollbar.grid_remove()
         self.tree.column("index", width=ems_to_pixels(4), anchor=tk.W, stretch=False)
@@ -538,10 +638,6 @@ class ElementsInspector(thonny.memory.MemoryFrame, ContentInspector):
         self.tree.heading("id", text=tr("Value ID"), anchor=tk.W)
         self.tree.heading("value", text=tr("Value"), anchor=tk.W)
 
-        self.len_label = ttk.Label(self.statusbar, text="", anchor="w")
-        self.len_label.grid(row=0, column=0, sticky="w")
-        self.statusbar.columnconfigure(0, weight=1)
-
         self.elements_have_indices = None
         self.update_memory_model()
 
@@ -563,9 +659,6 @@ class ElementsInspector(thonny.memory.MemoryFrame, ContentInspector):
             else:
                 self.tree.configure(displaycolumns=("value"))
 
-    def applies_to(self, object_info):
-        return "elements" in object_info
-
     def on_select(self, event):
         pass
 
@@ -573,38 +666,29 @@ class ElementsInspector(thonny.memory.MemoryFrame, ContentInspector):
         self.show_selected_object_info()
 
     def set_object_info(self, object_info):
-        assert "elements" in object_info
-
         self.elements_have_indices = object_info["type"] in (repr(tuple), repr(list))
         self._update_columns()
-        self.context_id = object_info["id"]
+        ItemsInspector.set_object_info(self, object_info)
 
-        self._clear_tree()
-        index = 0
-        # TODO: don't show too big number of elements
-        for element in object_info["elements"]:
-            node_id = self.tree.insert("", "end")
-            if self.elements_have_indices:
-                self.tree.set(node_id, "index", index)
-            else:
-                self.tree.set(node_id, "index", "")
+    def _insert_item(self, index, element):
+        node_id = self.tree.insert("", "end")
+        if self.elements_have_indices:
+            self.tree.set(node_id, "index", index)
+        else:
+            self.tree.set(node_id, "index", "")
 
-            self.tree.set(node_id, "id", thonny.memory.format_object_id(element.id))
-            self.tree.set(
-                node_id, "value", shorten_repr(element.repr, thonny.memory.MAX_REPR_LENGTH_IN_GRID)
-            )
-            index += 1
+        self.tree.set(node_id, "id", thonny.memory.format_object_id(element.id))
+        self._object_generations[element.id] = element.generation
+        self.tree.set(
+            node_id, "value", shorten_repr(element.repr, thonny.memory.MAX_REPR_LENGTH_IN_GRID)
+        )
 
-        count = len(object_info["elements"])
-        self.len_label.configure(text=" len: %d" % count)
 
+class DictInspector(ItemsInspector):
+    items_key = "entries"
 
-class DictInspector(thonny.memory.MemoryFrame, ContentInspector):
     def __init__(self, master):
-        ContentInspector.__init__(self, master)
-        thonny.memory.MemoryFrame.__init__(
-            self, master, ("key_id", "id", "key", "value"), show_statusbar=True
-        )
+        ItemsInspector.__init__(self, master, ("key_id", "id", "key", "value"))
         # self.configure(border=1)
         # self.vert_scrollbar.grid_remove()
         self.tree.column("key_id", width=ems_to_pixels(7), anchor=tk.W, stretch=False)
@@ -617,10 +701,6 @@ class DictInspector(thonny.memory.MemoryFrame, ContentInspector):
         self.tree.heading("id", text=tr("Value ID"), anchor=tk.W)
         self.tree.heading("value", text=tr("Value"), anchor=tk.W)
 
-        self.len_label = ttk.Label(self.statusbar, text="", anchor="w")
-        self.len_label.grid(row=0, column=0, sticky="w")
-        self.statusbar.columnconfigure(0, weight=1)
-
         self.update_memory_model()
 
     def update_memory_model(self, event=None):
@@ -629,9 +709,6 @@ class DictInspector(thonny.memory.MemoryFrame, ContentInspector):
         else:
             self.tree.configure(displaycolumns=("key", "value"))
 
-    def applies_to(self, object_info):
-        return "entries" in object_info
-
     def on_select(self, event):
         pass
 
@@ -640,26 +717,22 @@ class DictInspector(thonny.memory.MemoryFrame, ContentInspector):
         self.show_selected_object_info()
 
     def set_object_info(self, object_info):
-        assert "entries" in object_info
-        self.context_id = object_info["id"]
-
-        self._clear_tree()
-        # TODO: don't show too big number of elements
-        for key, value in object_info["entries"]:
-            node_id = self.tree.insert("", "end")
-            self.tree.set(node_id, "key_id", thonny.memory.format_object_id(key.id))
-            self.tree.set(
-                node_id, "key", shorten_repr(key.repr, thonny.memory.MAX_REPR_LENGTH_IN_GRID)
-            )
-            self.tree.set(node_id, "id", thonny.memory.format_object_id(value.id))
-            self.tree.set(
-                node_id, "value", shorten_repr(value.repr, thonny.memory.MAX_REPR_LENGTH_IN_GRID)
-            )
-
-        count = len(object_info["entries"])
-        self.len_label.configure(text=" len: %d" % count)
+        ItemsInspector.set_object_info(self, object_info)
         self.update_memory_model()
 
+    def _insert_item(self, index, entry):
+        key, value = entry
+        node_id = self.tree.insert("", "end")
+        self.tree.set(node_id, "key_id", thonny.memory.format_object_id(key.id))
+        self.tree.set(
+            node_id, "key", shorten_repr(key.repr, thonny.memory.MAX_REPR_LENGTH_IN_GRID)
+        )
+        self.tree.set(node_id, "id", thonny.memory.format_object_id(value.id))
+        self._object_generations[value.id] = value.generation
+        self.tree.set(
+            node_id, "value", shorten_repr(value.repr, thonny.memory.MAX_REPR_LENGTH_IN_GRID)
+        )
+
 
 class ImageInspector(ContentInspector, tk.Frame):
     def __init__(self, master):
@@ -729,4 +802,6 @@ class AttributesFrame(thonny.memory.VariablesFrame):
 
 
 def load_plugin() -> None:
+    # number of elements or entries fetched at once
+    get_workbench().set_default("object_inspector.page_size", 500)
     get_workbench().add_view(ObjectInspector, tr("Object inspector"), "se")
@@ -1,4 +1,3 @@
-import re
 import tkinter as tk
 from tkinter import ttk
 
@@ -19,8 +18,11 @@ class OutlineView(ttk.Frame):
         )
         get_workbench().bind("Save", self._update_frame_contents, True)
         get_workbench().bind("SaveAs", self._update_frame_contents, True)
-        get_workbench().bind_class("Text", "<<NewLine>>", self._update_frame_contents, True)
+        get_workbench().bind_class(
+            "CodeViewText", "<<DocumentUpdated>>", self._on_document_updated, True
+        )
 
+        self._current_outline = None
         self._update_frame_contents()
 
     def destroy(self):
@@ -60,57 +62,35 @@ class OutlineView(ttk.Frame):
         self._class_img = get_workbench().get_image("outline-class")
         self._method_img = get_workbench().get_image("outline-method")
 
+    def _on_document_updated(self, event):
+        editor = get_workbench().get_editor_notebook().get_current_editor()
+        if editor is not None and event.widget is editor.get_text_widget():
+            self._update_frame_contents()
+
     def _update_frame_contents(self, event=None):
         if not self.winfo_ismapped():
             return
 
-        self._clear_tree()
-
         editor = get_workbench().get_editor_notebook().get_current_editor()
         if editor is None:
+            outline = ()
+        else:
+            outline = _get_outline(editor.get_text_widget().get_document().get_tree())
+
+        # typing inside function bodies doesn't change the outline
+        if outline == self._current_outline:
             return
 
-        root = self._parse_source(editor.get_code_view().get_content())
-        for child in root[2]:
-            self._add_item_to_tree("", child)
-
-    def _parse_source(self, source):
-        # all nodes in format (parent, node_indent, node_children, name, type, linenumber)
-        root_node = (None, 0, [], None, None, None)  # name, type and linenumber not needed for root
-        active_node = root_node
-
-        lineno = 0
-        in_multiline_string = False
-        for line in source.split("\n"):
-            lineno += 1
-            if len(re.findall(r"\"\"\"", line)) % 2 == 1:  # an odd number of """s to toggle
-                in_multiline_string = (
-                    not in_multiline_string
-                )  # multi-line string environment on/off
-                continue
-            if in_multiline_string:
-                continue
-            m = re.match(r"[ ]*[\w]{1}", line)
-            if m:
-                indent = len(m.group(0))
-                while indent <= active_node[1]:
-                    active_node = active_node[0]
-
-                t = re.match(
-                    r"[ \t]*(async[ \t]+)?(?P<type>(def|class){1})[ ]+(?P<name>[\w]+)", line
-                )
-                if t:
-                    current = (active_node, indent, [], t.group("name"), t.group("type"), lineno)
-                    active_node[2].append(current)
-                    active_node = current
-
-        return root_node
+        self._current_outline = outline
+        self._clear_tree()
+        for item in outline:
+            self._add_item_to_tree("", item)
 
     # adds a single item to the tree, recursively calls itself to add any child nodes
     def _add_item_to_tree(self, parent, item):
         # create the text to be played for this item
-        item_type = item[4]
-        item_text = " " + item[3]
+        item_type, name, lineno, children = item
+        item_text = " " + name
 
         if item_type == "class":
             image = self._class_img
@@ -120,9 +100,9 @@ class OutlineView(ttk.Frame):
             image = None
 
         # insert the item, set lineno as a 'hidden' value
-        current = self.tree.insert(parent, "end", text=item_text, values=item[5], image=image)
+        current = self.tree.insert(parent, "end", text=item_text, values=lineno, image=image)
 
-        for child in item[2]:
+        for child in children:
             self._add_item_to_tree(current, child)
 
     # clears the tree by deleting all items
@@ -152,5 +132,36 @@ class OutlineView(ttk.Frame):
             )
 
 
+# node types, which may contain function or class definitions
+_CONTAINER_TYPES = {
+    "file_input",
+    "suite",
+    "decorated",
+    "async_stmt",
+    "async_funcdef",
+    "if_stmt",
+    "for_stmt",
+    "while_stmt",
+    "try_stmt",
+    "with_stmt",
+    "match_stmt",
+    "case_block",
+    "error_node",
+}
+
+
+def _get_outline(node):
+    """Returns nested tuples of (type, name, lineno, children) for defs and classes under node"""
+    result = []
+    for child in node.children:
+        if child.type in ("funcdef", "classdef"):
+            item_type = "def" if child.type == "funcdef" else "class"
+            result.append((item_type, child.name.value, child.start_pos[0], _get_outline(child)))
+        elif child.type in _CONTAINER_TYPES:
+            result.extend(_get_outline(child))
+
+    return tuple(result)
+
+
 def load_plugin() -> None:
     get_workbench().add_view(OutlineView, tr("Outline"), "ne")
@@ -1,12 +1,16 @@
 import io
 import time
 import token as token_module
+from collections import namedtuple
 
 from thonny import get_workbench
 from thonny.codeview import CodeViewText
 from thonny.shell import ShellText
 
 _OPENERS = {")": "(", "]": "[", "}": "{"}
+_PAREN_CHARS = {"(", ")", "[", "]", "{", "}"}
+
+_ParenToken = namedtuple("_ParenToken", ["string", "start", "end"])
 
 TOKTYPES = {
     token_module.LPAR,
@@ -137,10 +141,36 @@ class ParenMatcher:
             self.text.tag_add("unclosed_expression", open_index, end_index)
 
     def _get_paren_tokens(self, start_index, end_index):
-        import tokenize
+        # parens are taken from the parso tree of the document, which is kept up to date
+        # incrementally, so the editor text doesn't need to be tokenized on each keypress
+        document = self.text.get_document()
+        cache_key = (document.get_version(), start_index, end_index)
+        if cache_key in self._tokens_cache:
+            return self._tokens_cache[cache_key]
+
+        start = tuple(map(int, self.text.index(start_index).split(".")))
+        end = tuple(map(int, self.text.index(end_index).split(".")))
+        result = [
+            _ParenToken(leaf.value, leaf.start_pos, leaf.end_pos)
+            for leaf in document.iter_leaves(start, end)
+            if leaf.value in _PAREN_CHARS and leaf.type in ("operator", "error_leaf")
+        ]
+
+        self._tokens_cache = {cache_key: result}
+        return result
+
+
+class ShellParenMatcher(ParenMatcher):
+    def _update_highlighting_for_active_range(self):
+        # TODO: check that cursor is in this range
+        index_parts = self.text.tag_prevrange("command", "end")
+
+        if index_parts:
+            start_index, end_index = index_parts
+            self._highlight(start_index, end_index)
 
-        if (start_index, end_index) in self._tokens_cache:
-            return self._tokens_cache[(start_index, end_index)]
+    def _get_paren_tokens(self, start_index, end_index):
+        import tokenize
 
         start_row, start_col = map(int, start_index.split("."))
         source = self.text.get(start_index, end_index)
@@ -159,22 +189,9 @@ class ParenMatcher:
             # happens eg when parens are unbalanced or there is indentation error or ...
             pass
 
-        if start_index == "1.0" and end_index == "end":
-            self._tokens_cache[(start_index, end_index)] = result
-
         return result
 
 
-class ShellParenMatcher(ParenMatcher):
-    def _update_highlighting_for_active_range(self):
-        # TODO: check that cursor is in this range
-        index_parts = self.text.tag_prevrange("command", "end")
-
-        if index_parts:
-            start_index, end_index = index_parts
-            self._highlight(start_index, end_index)
-
-
 def _update_highlighting(event, text_changed, need_update, delay=None):
     text = event.widget
     if not hasattr(text, "paren_matcher"):
@@ -0,0 +1,192 @@
+import linecache
+import os.path
+import tkinter as tk
+from logging import getLogger
+from tkinter import ttk
+from typing import Dict, List, Tuple
+
+from thonny import get_runner, get_workbench, ui_utils
+from thonny.common import is_same_path
+from thonny.languages import tr
+from thonny.ui_utils import ems_to_pixels
+
+logger = getLogger(__name__)
+
+MAX_ROW_COUNT = 200
+
+# minimal shares of all samples for the heat colors of line numbers, from cool to hot
+HEAT_THRESHOLDS = [0.005, 0.02, 0.08, 0.2, 0.5]
+HEAT_COLORS = ["#FFF3C4", "#FFE08A", "#FFC266", "#FF9A52", "#FF6B4A"]
+
+
+class ProfileView(ui_utils.TreeFrame):
+    def __init__(self, master):
+        ui_utils.TreeFrame.__init__(
+            self,
+            master,
+            columns=("location", "code", "self", "total"),
+            displaycolumns=(0, 1, 2, 3),
+            show_statusbar=True,
+        )
+
+        self.tree.column("location", width=ems_to_pixels(12), anchor=tk.W, stretch=False)
+        self.tree.column("code", width=ems_to_pixels(20), anchor=tk.W, stretch=True)
+        self.tree.column("self", width=ems_to_pixels(5), anchor=tk.E, stretch=False)
+        self.tree.column("total", width=ems_to_pixels(5), anchor=tk.E, stretch=False)
+
+        self.tree.heading("location", text=tr("Location"), anchor=tk.W)
+        self.tree.heading("code", text=tr("Code"), anchor=tk.W)
+        self.tree.heading("self", text=tr("Self"), anchor=tk.E)
+        self.tree.heading("total", text=tr("Total"), anchor=tk.E)
+
+        self._mode_var = tk.StringVar(value="lines")
+        for i, (mode, label) in enumerate([("lines", tr("Lines")), ("functions", tr("Functions"))]):
+            ttk.Radiobutton(
+                self.statusbar,
+                text=label,
+                value=mode,
+                variable=self._mode_var,
+                command=self._update_tree,
+            ).grid(row=0, column=i, padx=(5, 0))
+        self._status_label = ttk.Label(self.statusbar)
+        self._status_label.grid(row=0, column=2, sticky="w", padx=10)
+
+        # location -> [self count, total count]
+        self._lines = {}  # type: Dict[Tuple[str, int], List[int]]
+        self._functions = {}  # type: Dict[Tuple[str, int, str], List[int]]
+        self._row_locations = {}  # type: Dict[str, Tuple[str, int]]
+        self._sample_count = 0
+        self._waiting_sample_count = 0
+        self._duration = None
+        self._running = False
+        self._update_status()
+
+        get_workbench().bind("CommandAccepted", self._on_command_accepted, True)
+        get_workbench().bind("ProfileProgress", self._on_progress, True)
+        get_workbench().get_editor_notebook().bind(
+            "<<NotebookTabChanged>>", self._update_heat, True
+        )
+
+    def _on_command_accepted(self, event):
+        if event.command.get("name") == "Profile":
+            self._lines = {}
+            self._functions = {}
+            self._sample_count = 0
+            self._waiting_sample_count = 0
+            self._duration = None
+            self._running = True
+            # the sources may have changed since the last run
+            linecache.checkcache()
+            self._update_tree()
+            self._update_status()
+            self._update_heat()
+
+    def _on_progress(self, msg):
+        for source, target in [(msg.lines, self._lines), (msg.functions, self._functions)]:
+            for key, (self_count, total_count) in source.items():
+                counts = target.setdefault(key, [0, 0])
+                counts[0] += self_count
+                counts[1] += total_count
+
+        self._sample_count += msg.sample_count
+        self._waiting_sample_count += msg.waiting_sample_count
+        if msg.final:
+            self._running = False
+            self._duration = msg.get("duration")
+
+        self._update_tree()
+        self._update_status()
+        self._update_heat()
+
+    def _update_tree(self):
+        self.clear()
+        self._row_locations = {}
+        if self._mode_var.get() == "lines":
+            items = self._lines
+        else:
+            items = self._functions
+
+        hottest = sorted(items.items(), key=lambda item: (-item[1][0], -item[1][1]))
+        for key, (self_count, total_count) in hottest[:MAX_ROW_COUNT]:
+            if len(key) == 2:
+                filename, lineno = key
+                code = linecache.getline(filename, lineno).strip()
+            else:
+                filename, lineno, code = key
+
+            iid = self.tree.insert(
+                "",
+                "end",
+                values=(
+                    "%s:%d" % (os.path.basename(filename), lineno),
+                    code,
+                    self._format_share(self_count),
+                    self._format_share(total_count),
+                ),
+            )
+            self._row_locations[iid] = (filename, lineno)
+
+    def _format_share(self, count):
+        return "%.1f%%" % (count * 100 / max(self._sample_count, 1))
+
+    def _update_status(self):
+        if self._running:
+            text = tr("Profiling...") + " "
+        else:
+            text = ""
+
+        text += tr("%d samples") % self._sample_count
+        if self._duration is not None:
+            text += ", %.2f s" % self._duration
+        if self._waiting_sample_count:
+            text += ", " + tr("%d while waiting for input") % self._waiting_sample_count
+        self._status_label.configure(text=text)
+
+    def _update_heat(self, event=None):
+        for editor in get_workbench().get_editor_notebook().get_all_editors():
+            filename = editor.get_filename()
+            colors_by_line = {}
+            if filename is not None and self._sample_count:
+                for (line_filename, lineno), (_, total_count) in self._lines.items():
+                    level = _get_heat_level(total_count / self._sample_count)
+                    if level and is_same_path(line_filename, filename):
+                        colors_by_line[lineno] = HEAT_COLORS[level - 1]
+            editor.get_code_view().set_gutter_shading("heat", colors_by_line)
+
+    def on_double_click(self, event):
+        location = self._row_locations.get(self.tree.focus())
+        if location is not None and os.path.isfile(location[0]):
+            get_workbench().get_editor_notebook().show_file_at_line(*location)
+
+
+def _get_heat_level(share):
+    level = 0
+    for threshold in HEAT_THRESHOLDS:
+        if share >= threshold:
+            level += 1
+    return level
+
+
+def _start_profile_enabled():
+    return (
+        get_workbench().get_editor_notebook().get_current_editor() is not None
+        and get_runner().get_backend_proxy()
+        and get_runner().get_backend_proxy().can_profile()
+    )
+
+
+def _start_profile():
+    get_workbench().show_view("ProfileView", set_focus=False)
+    get_runner().execute_current("Profile")
+
+
+def load_plugin() -> None:
+    get_workbench().add_view(ProfileView, tr("Profile"), "s")
+    get_workbench().add_command(
+        "profile_current_script",
+        "run",
+        tr("Profile current script"),
+        _start_profile,
+        tester=_start_profile_enabled,
+        group=11,
+    )
@@ -54,6 +54,13 @@ class RunDebugConfigurationPage(ConfigurationPage):
             row=30,
             columnspan=3,
         )
+        self.add_checkbox(
+            "debugger.animate_repeated_steps",
+            tr("Animate steps, which were issued faster than they could be shown"),
+            tooltip=tr("Otherwise only the state after the last of these steps gets shown."),
+            row=35,
+            columnspan=3,
+        )
 
         default_label = ttk.Label(self, text=tr("Preferred debugger"), anchor="w")
         default_label.grid(row=40, column=0, sticky="w", pady=(15, 0))
@@ -71,6 +78,32 @@ class RunDebugConfigurationPage(ConfigurationPage):
         )
         default_comment_label.grid(row=40, column=2, sticky="w", pady=(15, 0))
 
+        fine_grained_label = ttk.Label(self, text=tr("Expression stepping"), anchor="w")
+        fine_grained_label.grid(row=43, column=0, sticky="w", pady=(5, 0))
+        self.add_combobox(
+            "debugger.fine_grained_stepping",
+            ["lazy", "everywhere"],
+            width=8,
+            row=43,
+            column=1,
+            padx=5,
+            pady=(5, 0),
+        )
+        fine_grained_comment_label = ttk.Label(
+            self,
+            text=tr("(lazy: inside functions only from the next call after stepping into)"),
+            anchor="w",
+        )
+        fine_grained_comment_label.grid(row=43, column=2, sticky="w", pady=(5, 0))
+
+        history_label = ttk.Label(self, text=tr("Nicer debugger history size (MB)"), anchor="w")
+        history_label.grid(row=45, column=0, sticky="w", pady=(5, 0))
+        self.add_entry("debugger.history_size_mb", row=45, column=1, width=5, pady=(5, 0), padx=5)
+        history_comment_label = ttk.Label(
+            self, text=tr("(oldest steps can't be stepped back to)"), anchor="w"
+        )
+        history_comment_label.grid(row=45, column=2, sticky="w", pady=(5, 0))
+
         if get_workbench().get_option("run.birdseye_port", None):
             port_label = ttk.Label(self, text=tr("Birdseye port"), anchor="w")
             port_label.grid(row=50, column=0, sticky="w", pady=(5, 0))
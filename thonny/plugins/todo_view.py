@@ -22,7 +22,7 @@ class TodoView(ui_utils.TreeFrame):
         )
 
         self._current_code_view = None
-        self._current_source = None
+        self._current_version = None
 
         self.tree.bind("<<TreeviewSelect>>", self._on_click, True)
         self.tree.bind("<Map>", self._update, True)
@@ -35,7 +35,9 @@ class TodoView(ui_utils.TreeFrame):
         get_workbench().bind_class("Text", "<<NewLine>>", self._update, True)
 
         get_workbench().get_editor_notebook().bind("<<NotebookTabChanged>>", self._update, True)
-        get_workbench().bind_class("EditorCodeViewText", "<<TextChange>>", self._text_change, True)
+        get_workbench().bind_class(
+            "EditorCodeViewText", "<<DocumentUpdated>>", self._text_change, True
+        )
 
         self.tree.column("line_no", width=ems_to_pixels(4), anchor=tk.W)
         self.tree.column("todo_text", width=ems_to_pixels(100), anchor=tk.W)
@@ -87,19 +89,22 @@ class TodoView(ui_utils.TreeFrame):
 
         if editor is None:
             self._current_code_view = None
-            self._current_source = None
+            self._current_version = None
             return
 
         new_codeview = editor.get_code_view()
-        new_source = new_codeview.get_content()
+        document = new_codeview.text.get_document()
 
-        if self._current_code_view == new_codeview and self._current_source == new_source:
+        if (
+            self._current_code_view == new_codeview
+            and self._current_version == document.get_version()
+        ):
             return
 
         self.clear()
 
         self._current_code_view = new_codeview
-        self._current_source = new_source
+        self._current_version = document.get_version()
 
         # todo support of other file types and introducing comment tags
 
@@ -107,7 +112,7 @@ class TodoView(ui_utils.TreeFrame):
         r_match = re.compile(r_ex, re.IGNORECASE | re.MULTILINE)
 
         line_no = 0
-        for line in new_source.splitlines():
+        for line in document.get_lines():
             line_no += 1
             matches = r_match.finditer(line)
             if matches:
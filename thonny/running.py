@@ -8,7 +8,11 @@ shell becomes kind of title for the execution.
 
 """
 import collections
+import copy
+import io
 import os.path
+import pickle
+import queue
 import re
 import shlex
 import subprocess
@@ -19,7 +23,7 @@ import traceback
 import warnings
 from abc import ABC, abstractmethod
 from logging import getLogger
-from threading import Thread
+from threading import Condition, Thread
 from time import sleep
 from tkinter import messagebox, ttk
 from typing import Any, Callable, Dict, List, Optional, Set, Union  # @UnusedImport; @UnusedImport
@@ -28,6 +32,7 @@ import thonny
 from thonny import (
     THONNY_USER_DIR,
     common,
+    completion_index,
     get_runner,
     get_shell,
     get_version,
@@ -35,29 +40,38 @@ from thonny import (
     report_time,
 )
 from thonny.common import (
+    BINARY_MESSAGE_FORMAT,
     PROCESS_ACK,
+    TEXT_MESSAGE_FORMAT,
     BackendEvent,
     CommandToBackend,
     DebuggerCommand,
     DebuggerResponse,
     EOFCommand,
+    FrameSourceDecoder,
     InlineCommand,
     InlineResponse,
     InputSubmission,
+    MessageDecodingError,
     MessageFromBackend,
     ToplevelCommand,
     ToplevelResponse,
     UserError,
+    VariablesPatcher,
     is_same_path,
     parse_message,
+    parse_process_ack,
     path_startswith,
+    read_one_incoming_message_bytes,
     read_one_incoming_message_str,
     serialize_message,
+    serialize_message_binary,
     universal_relpath,
     update_system_path,
 )
 from thonny.editors import (
     extract_target_path,
+    get_current_breakpoint_options,
     get_current_breakpoints,
     get_saved_current_script_filename,
     get_target_dirname_from_editor_filename,
@@ -79,6 +93,34 @@ logger = getLogger(__name__)
 
 WINDOWS_EXE = "python.exe"
 OUTPUT_MERGE_THRESHOLD = 1000
+MAX_ANSI_CODE_LENGTH = 1024
+
+# UI thread handles incoming messages in batches taking at most this many seconds,
+# in order to leave room for screen updates and user actions
+MESSAGE_BATCH_TIME_BUDGET = 0.03
+# Polling intervals (ms) for the proxies, which can't wake up the UI thread themselves
+MIN_POLLING_INTERVAL = 10
+MAX_POLLING_INTERVAL = 50
+# Reader thread stops reading the backend's stdout (ie. backend blocks on full pipe)
+# when this much program output is waiting for the UI thread.
+MAX_PENDING_OUTPUT_BYTES = 1024 * 1024
+# Skipping output (instead of slowing down the program) is opt-in, because the skipped part would
+# be missing also from the Shell's output store (ie. from Find, Copy all and Save output)
+DEFAULT_OUTPUT_SKIP_THRESHOLD_MB = 0
+# Polling interval (ms) for the proxies, which announce their messages (eg. for noticing
+# the termination of the backend process)
+NOTIFIED_POLLING_INTERVAL = 500
+
+# Editor's commands, which AnalysisWorkerPool answers instead of the back-end
+ANALYSIS_COMMAND_NAMES = {
+    "editor_autocomplete",
+    "get_editor_calltip",
+    "highlight_occurrences",
+    "get_definitions",
+}
+MAX_CACHED_ANALYSIS_RESPONSES = 200
+ANALYSIS_POLLING_INTERVAL = 20
+MAX_CONSECUTIVE_ANALYSIS_WORKER_CRASHES = 3
 
 RUN_COMMAND_LABEL = ""  # init later when gettext is ready
 RUN_COMMAND_CAPTION = ""
@@ -134,14 +176,32 @@ class Runner:
         get_workbench().set_default("run.allow_running_unnamed_programs", True)
         get_workbench().set_default("run.auto_cd", True)
         get_workbench().set_default("run.warn_module_shadowing", True)
+        # When the Shell falls this far behind the program's output, the intermediate part
+        # gets skipped (0 means the program gets slowed down instead)
+        get_workbench().set_default(
+            "run.output_skip_threshold_mb", DEFAULT_OUTPUT_SKIP_THRESHOLD_MB
+        )
+        # Coverage command measures also time spent on each line (makes the program slower)
+        get_workbench().set_default("run.coverage_line_timing", False)
+        # Number of processes answering editor's completion etc. requests, so that these
+        # don't need to wait for the user program (0 means the back-end answers them)
+        get_workbench().set_default("run.analysis_workers", 2)
 
         self._init_commands()
         self._state = "starting"
         self._proxy: Optional[BackendProxy] = None
         self._publishing_events = False
         self._polling_after_id = None
+        self._polling_interval = MIN_POLLING_INTERVAL
+        self._pulling_messages = False
+        self._message_waker = None  # type: Optional[_MessageWaker]
+        self._proxy_notifies = False
+        self._message_metrics = MessageMetrics()
         self._postponed_commands = []  # type: List[CommandToBackend]
         self._last_accepted_backend_command = None
+        self._analysis_workers = None  # type: Optional[AnalysisWorkerPool]
+        get_workbench().bind("ToplevelResponse", self._start_analysis_workers, True)
+        get_workbench().bind("WorkbenchClose", self._close_analysis_workers, True)
 
     def start(self) -> None:
         global _console_allocated
@@ -152,6 +212,7 @@ class Runner:
             logger.exception("Problem allocating console")
             _console_allocated = False
 
+        self._message_waker = _create_message_waker(self._on_message_wakeup)
         self.restart_backend(False, True)
 
     def _init_commands(self) -> None:
@@ -292,12 +353,22 @@ class Runner:
         # Attach extra info
         if "debug" in cmd.name.lower():
             cmd["breakpoints"] = get_current_breakpoints()
+            cmd["breakpoint_options"] = get_current_breakpoint_options()
+            cmd["fine_grained_stepping"] = get_workbench().get_option(
+                "debugger.fine_grained_stepping", "lazy"
+            )
+        elif cmd.name == "Coverage":
+            cmd["line_timing"] = get_workbench().get_option("run.coverage_line_timing")
 
         if "id" not in cmd:
             cmd["id"] = generate_command_id()
 
         cmd["local_cwd"] = get_workbench().get_local_cwd()
 
+        analysis_workers = self._get_analysis_workers()
+        if analysis_workers is not None and analysis_workers.try_send(cmd):
+            return
+
         if self._proxy.running_inline_command and isinstance(cmd, InlineCommand):
             self._postpone_command(cmd)
             return
@@ -325,6 +396,44 @@ class Runner:
             # This may be only logical restart, which does not look like restart to the runner
             get_workbench().event_generate("BackendRestart", full=False)
 
+    def is_ready_for_editor_analysis(self) -> bool:
+        """Tells whether editor's analysis commands (eg. completions) get answered soon"""
+        return not self.is_running() or self._get_analysis_workers() is not None
+
+    def _get_analysis_workers(self) -> Optional["AnalysisWorkerPool"]:
+        size = get_workbench().get_option("run.analysis_workers")
+        sys_path = self._proxy.get_sys_path_for_analysis() if self._proxy else None
+        if not size or not sys_path:
+            self._close_analysis_workers()
+            return None
+
+        if (
+            self._analysis_workers is None
+            or self._analysis_workers.get_sys_path() != sys_path
+            or self._analysis_workers.get_size() != size
+        ):
+            self._close_analysis_workers()
+            self._analysis_workers = AnalysisWorkerPool(sys_path, size)
+
+        return self._analysis_workers
+
+    def _start_analysis_workers(self, event=None) -> None:
+        # let them load jedi before the first request
+        analysis_workers = self._get_analysis_workers()
+        if analysis_workers is not None:
+            analysis_workers.start()
+
+    def get_completion_index(self) -> Optional["completion_index.CompletionIndex"]:
+        """Index of the modules in back-end's sys.path (available with analysis workers)"""
+        if self._analysis_workers is None:
+            return None
+        return self._analysis_workers.get_completion_index()
+
+    def _close_analysis_workers(self, event=None) -> None:
+        if self._analysis_workers is not None:
+            self._analysis_workers.close()
+            self._analysis_workers = None
+
     def send_command_and_wait(self, cmd: InlineCommand, dialog_title: str) -> MessageFromBackend:
         dlg = InlineCommandDialog(get_workbench(), cmd, title=dialog_title + " ...")
         show_dialog(dlg)
@@ -332,9 +441,10 @@ class Runner:
 
     def _postpone_command(self, cmd: CommandToBackend) -> None:
         # in case of InlineCommands, discard older same type command
+        # and the analysis commands for older versions of the same editor document
         if isinstance(cmd, InlineCommand):
-            for older_cmd in self._postponed_commands:
-                if older_cmd.name == cmd.name:
+            for older_cmd in list(self._postponed_commands):
+                if older_cmd.name == cmd.name or _is_outdated_analysis_command(older_cmd, cmd):
                     self._postponed_commands.remove(older_cmd)
 
         if len(self._postponed_commands) > 10:
@@ -634,20 +744,59 @@ class Runner:
         """I chose polling instead of event_generate in listener thread,
         because event_generate across threads is not reliable
         http://www.thecodingforums.com/threads/more-on-tk-event_generate-and-threads.359615/
+
+        If possible, listener threads cut the waiting short via _MessageWaker.
         """
         self._polling_after_id = None
-        if self._pull_backend_messages() is False:
+        self._pulling_messages = True
+        try:
+            handled_count = self._pull_backend_messages()
+        finally:
+            self._pulling_messages = False
+
+        if handled_count is None or self._proxy is None:
             return
 
-        self._polling_after_id = get_workbench().after(20, self._poll_backend_messages)
+        if self._proxy.get_message_queue_length():
+            # the batch ran out of time
+            delay = 1
+            self._polling_interval = MIN_POLLING_INTERVAL
+        elif self._proxy_notifies:
+            delay = NOTIFIED_POLLING_INTERVAL
+        elif handled_count:
+            delay = self._polling_interval = MIN_POLLING_INTERVAL
+        else:
+            # back off while backend is quiet
+            delay = self._polling_interval
+            self._polling_interval = min(self._polling_interval * 2, MAX_POLLING_INTERVAL)
+
+        self._polling_after_id = get_workbench().after(delay, self._poll_backend_messages)
+
+    def _on_message_wakeup(self) -> None:
+        if self._pulling_messages or self._proxy is None:
+            # current batch or its follow-up takes care of new messages
+            return
+
+        self._message_metrics.wakeup_count += 1
+        if self._polling_after_id is not None:
+            get_workbench().after_cancel(self._polling_after_id)
+        self._poll_backend_messages()
+
+    def get_message_metrics(self) -> Dict[str, Any]:
+        return self._message_metrics.as_dict()
 
-    def _pull_backend_messages(self):
-        # Don't process too many messages in single batch, allow screen updates
+    def _pull_backend_messages(self) -> Optional[int]:
+        """Returns the number of handled messages or None if backend has terminated"""
+        # Don't spend too much time in a single batch, allow screen updates
         # and user actions between batches.
         # Mostly relevant when backend prints a lot quickly.
         msg_count = 0
-        max_msg_count = 10
-        while self._proxy is not None and msg_count < max_msg_count:
+        start_time = time.perf_counter()
+        queue_length = self._proxy.get_message_queue_length() if self._proxy else None
+        while (
+            self._proxy is not None
+            and time.perf_counter() - start_time < MESSAGE_BATCH_TIME_BUDGET
+        ):
             try:
                 msg = self._proxy.fetch_next_message()
                 if not msg:
@@ -659,13 +808,15 @@ class Runner:
                 msg_count += 1
             except BackendTerminatedError as exc:
                 self._handle_backend_termination(exc.returncode)
-                return False
+                return None
 
             # change state
             if isinstance(msg, ToplevelResponse):
                 self._set_state("waiting_toplevel_command")
             elif isinstance(msg, DebuggerResponse):
-                self._set_state("waiting_debugger_command")
+                if not msg.get("intermediate"):
+                    # intermediate states are sent while repeated steps proceed
+                    self._set_state("waiting_debugger_command")
             elif isinstance(msg, InlineResponse):
                 # next inline command won't be sent before response from the last has arrived
                 self._proxy.running_inline_command = False
@@ -688,7 +839,12 @@ class Runner:
             # https://stackoverflow.com/a/13520271/261181
             # get_workbench().update()
 
+        if msg_count:
+            self._message_metrics.record_batch(
+                msg_count, time.perf_counter() - start_time, queue_length
+            )
         self._send_postponed_commands()
+        return msg_count
 
     def _handle_backend_termination(self, returncode: int) -> None:
         err = f"Process ended with exit code {returncode}."
@@ -729,6 +885,11 @@ class Runner:
         self._set_state("running")
         self._proxy = None
         self._proxy = backend_class(clean)
+        self._proxy_notifies = (
+            self._message_waker is not None
+            and self._proxy.set_message_notifier(self._message_waker.wake)
+        )
+        self._polling_interval = MIN_POLLING_INTERVAL
 
         self._poll_backend_messages()
 
@@ -832,6 +993,83 @@ class Runner:
         )
 
 
+class MessageMetrics:
+    """Statistics about handling backend messages in the UI thread"""
+
+    def __init__(self):
+        self.batch_count = 0
+        self.message_count = 0
+        self.wakeup_count = 0
+        self.last_batch_duration = 0.0
+        self.max_batch_duration = 0.0
+        self.total_batch_duration = 0.0
+        self.last_queue_length = None  # type: Optional[int]
+        self.max_queue_length = 0
+
+    def record_batch(self, message_count: int, duration: float, queue_length: Optional[int]):
+        self.batch_count += 1
+        self.message_count += message_count
+        self.last_batch_duration = duration
+        self.max_batch_duration = max(self.max_batch_duration, duration)
+        self.total_batch_duration += duration
+        self.last_queue_length = queue_length
+        if queue_length is not None:
+            self.max_queue_length = max(self.max_queue_length, queue_length)
+
+    def as_dict(self) -> Dict[str, Any]:
+        result = dict(self.__dict__)
+        result["mean_batch_duration"] = (
+            self.total_batch_duration / self.batch_count if self.batch_count else 0.0
+        )
+        return result
+
+
+class _MessageWaker:
+    """Allows listener threads to wake up the UI thread via a self-pipe watched by Tk"""
+
+    def __init__(self, callback: Callable[[], None]):
+        self._callback = callback
+        self._pending = False
+        self._read_fd, self._write_fd = os.pipe()
+        os.set_blocking(self._read_fd, False)
+        os.set_blocking(self._write_fd, False)
+        try:
+            get_workbench().tk.createfilehandler(self._read_fd, tk.READABLE, self._on_readable)
+        except Exception:
+            os.close(self._read_fd)
+            os.close(self._write_fd)
+            raise
+
+    def wake(self) -> None:
+        """Can be called from any thread"""
+        if not self._pending:
+            self._pending = True
+            try:
+                os.write(self._write_fd, b"!")
+            except OSError:
+                # full pipe is as good as a written byte
+                pass
+
+    def _on_readable(self, fd, mask) -> None:
+        self._pending = False
+        try:
+            while os.read(self._read_fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+        self._callback()
+
+
+def _create_message_waker(callback: Callable[[], None]) -> Optional[_MessageWaker]:
+    try:
+        return _MessageWaker(callback)
+    except (AttributeError, OSError, tk.TclError):
+        # Tk can't watch file descriptors on Windows
+        logger.info("Could not create message waker, falling back to polling", exc_info=True)
+        return None
+
+
 class BackendProxy(ABC):
     """Communicates with backend process.
 
@@ -863,6 +1101,17 @@ class BackendProxy(ABC):
     def fetch_next_message(self):
         """Read next message from the queue or None if queue is empty"""
 
+    def set_message_notifier(self, notifier: Callable[[], None]) -> bool:
+        """Proxy may call the notifier (from any thread) when new messages become available.
+
+        Returns True if the proxy promises to do so. Otherwise the runner keeps polling
+        fetch_next_message at short intervals."""
+        return False
+
+    def get_message_queue_length(self) -> Optional[int]:
+        """Number of messages waiting for fetch_next_message (if known)"""
+        return None
+
     @abstractmethod
     def get_sys_path(self):
         "backend's sys.path"
@@ -936,6 +1185,17 @@ class BackendProxy(ABC):
     def can_debug(self) -> bool:
         ...
 
+    def can_profile(self) -> bool:
+        return False
+
+    def can_measure_coverage(self) -> bool:
+        return False
+
+    def get_sys_path_for_analysis(self) -> Optional[List[str]]:
+        """Returns the sys.path for analyzing the code in the front-end's processes
+        (see AnalysisWorkerPool) or None, if the back-end should analyze the code itself"""
+        return None
+
     def ready_for_remote_file_operations(self):
         return False
 
@@ -973,6 +1233,115 @@ class BackendProxy(ABC):
         raise NotImplementedError()
 
 
+class IncomingMessageQueue:
+    """Thread-safe queue between the listener threads and the UI thread.
+
+    Program output is accounted in bytes. When too much of it is pending, the appending thread
+    gets blocked, so that the backend process blocks on the full pipe. In firehose mode
+    (skip_threshold given) the appending thread never blocks because of output. Instead, the oldest
+    pending output gets dropped and later replaced by a marker telling how much was skipped.
+    """
+
+    def __init__(self, max_pending_output: int, skip_threshold: Optional[int] = None):
+        self._max_pending_output = max_pending_output
+        self._skip_threshold = skip_threshold
+        self._items = collections.deque()
+        self._condition = Condition()
+        self._pending_output = 0
+        self._skipped_output = 0
+        self._closed = False
+
+    def append(self, msg: MessageFromBackend) -> None:
+        size = _get_output_size(msg)
+        with self._condition:
+            if self._closed:
+                return
+
+            if self._skip_threshold is None:
+                while self._pending_output + size > self._max_pending_output and self._items:
+                    if self._closed:
+                        return
+                    self._condition.wait()
+
+            self._items.append(msg)
+            self._pending_output += size
+
+            if self._skip_threshold is not None and self._pending_output > self._skip_threshold:
+                self._skip_output(self._skip_threshold // 2)
+
+    def appendleft(self, msg: MessageFromBackend) -> None:
+        """For putting back the message taken by popleft"""
+        with self._condition:
+            self._items.appendleft(msg)
+            self._pending_output += _get_output_size(msg)
+
+    def popleft(self) -> MessageFromBackend:
+        with self._condition:
+            msg = self._items.popleft()
+            if msg is _SKIPPED_OUTPUT_MARKER:
+                msg = BackendEvent(
+                    "ProgramOutput",
+                    stream_name="stderr",
+                    data="\n[" + tr("%d bytes skipped") % self._skipped_output + "]\n",
+                )
+                self._skipped_output = 0
+                return msg
+
+            self._pending_output -= _get_output_size(msg)
+            self._condition.notify_all()
+            return msg
+
+    def close(self) -> None:
+        """Releases blocked threads"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def __len__(self):
+        return len(self._items)
+
+    def _skip_output(self, target_size: int) -> None:
+        # Other messages are kept in their original order.
+        # Marker (possibly one from previous skipping) goes to the place of the dropped output.
+        kept = []
+        while self._pending_output > target_size and self._items:
+            item = self._items.popleft()
+            if item is _SKIPPED_OUTPUT_MARKER:
+                continue
+
+            size = _get_output_size(item)
+            if size:
+                self._pending_output -= size
+                self._skipped_output += size
+            else:
+                kept.append(item)
+
+        self._items.appendleft(_SKIPPED_OUTPUT_MARKER)
+        self._items.extendleft(reversed(kept))
+
+
+_SKIPPED_OUTPUT_MARKER = object()
+
+
+def create_incoming_message_queue(skip_threshold_mb: float) -> IncomingMessageQueue:
+    """Creates the queue according to run.output_skip_threshold_mb"""
+    return IncomingMessageQueue(
+        MAX_PENDING_OUTPUT_BYTES,
+        int(skip_threshold_mb * 1024 * 1024) if skip_threshold_mb else None,
+    )
+
+
+def _get_output_size(msg: MessageFromBackend) -> int:
+    if msg.event_type != "ProgramOutput":
+        return 0
+
+    data = msg["data"]
+    if data.isascii():
+        return len(data)
+    else:
+        return len(data.encode("utf-8", errors="replace"))
+
+
 class SubprocessProxy(BackendProxy, ABC):
     def __init__(self, clean: bool, mgmt_executable: Optional[str] = None) -> None:
         super().__init__(clean)
@@ -989,6 +1358,9 @@ class SubprocessProxy(BackendProxy, ABC):
 
         self._proc = None
         self._response_queue = None
+        self._message_notifier = None
+        self._uses_binary_pipes = False
+        self._message_format = TEXT_MESSAGE_FORMAT
         self._sys_path = []
         self._usersitepackages = None
         self._externally_managed = None
@@ -1063,8 +1435,14 @@ class SubprocessProxy(BackendProxy, ABC):
         return env
 
     def _start_background_process(self, clean=None, extra_args=[]):
-        # deque, because in one occasion I need to put messages back
-        self._response_queue = collections.deque()
+        # supports appendleft, because in one occasion I need to put messages back
+        skip_threshold_mb = get_workbench().get_option("run.output_skip_threshold_mb")
+        if self._response_queue is not None:
+            # listener of the previous process may be blocked on it
+            self._response_queue.close()
+        self._response_queue = create_incoming_message_queue(skip_threshold_mb)
+        self._variables_patcher = VariablesPatcher()
+        self._frame_source_decoder = FrameSourceDecoder()
 
         if not os.path.exists(self._mgmt_executable):
             get_shell().print_error(
@@ -1092,30 +1470,46 @@ class SubprocessProxy(BackendProxy, ABC):
 
         logger.info("Starting the backend: %s %s", cmd_line, get_workbench().get_local_cwd())
 
+        self._uses_binary_pipes = self._get_requested_message_format() != TEXT_MESSAGE_FORMAT
+        if self._uses_binary_pipes:
+            # buffered, so that the reader can read complete frames
+            pipe_kw = dict(bufsize=-1)
+        else:
+            pipe_kw = dict(bufsize=0, universal_newlines=True, encoding="utf-8")
+
         self._proc = subprocess.Popen(
             cmd_line,
             executable=cmd_line[0],
-            bufsize=0,
             stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             cwd=self._get_launch_cwd(),
             env=self._get_environment(),
-            universal_newlines=True,
             creationflags=creationflags,
-            encoding="utf-8",
+            **pipe_kw,
         )
 
         # read success acknowledgement
         ack = self._proc.stdout.readline()
+        if self._uses_binary_pipes:
+            ack = ack.decode("utf-8", errors="replace")
+            stderr = io.TextIOWrapper(self._proc.stderr, encoding="utf-8", errors="replace")
+            stdout_listener = self._listen_binary_stdout
+        else:
+            stderr = self._proc.stderr
+            stdout_listener = self._listen_stdout
+
+        confirmed_message_format = parse_process_ack(ack)
+        self._message_format = confirmed_message_format or TEXT_MESSAGE_FORMAT
+        logger.info("Using %s messages", self._message_format)
 
         # setup asynchronous output listeners
-        Thread(target=self._listen_stdout, args=(self._proc.stdout,), daemon=True).start()
-        Thread(target=self._listen_stderr, args=(self._proc.stderr,), daemon=True).start()
+        Thread(target=stdout_listener, args=(self._proc.stdout,), daemon=True).start()
+        Thread(target=self._listen_stderr, args=(stderr,), daemon=True).start()
 
         # only attempt initial input if process started nicely,
         # otherwise can't read the error from stderr
-        if ack.strip() == PROCESS_ACK:
+        if confirmed_message_format is not None:
             self._send_initial_input()
         else:
             get_shell().print_error(
@@ -1134,6 +1528,10 @@ class SubprocessProxy(BackendProxy, ABC):
     def _get_launcher_with_args(self):
         raise NotImplementedError()
 
+    def _get_requested_message_format(self) -> str:
+        """Subclasses may propose more efficient format, if their backend supports it"""
+        return TEXT_MESSAGE_FORMAT
+
     def send_command(self, cmd: CommandToBackend) -> Optional[str]:
         """Send the command to backend. Return None, 'discard' or 'postpone'"""
         if isinstance(cmd, ToplevelCommand) and cmd.name[0].isupper():
@@ -1156,7 +1554,28 @@ class SubprocessProxy(BackendProxy, ABC):
             logger.warning("Ignoring command without active backend process")
             return
 
-        self._proc.stdin.write(serialize_message(msg) + "\n")
+        if isinstance(msg, (ToplevelCommand, DebuggerCommand, InlineCommand)):
+            # some of the variables deltas couldn't be applied
+            resync_namespaces = self._variables_patcher.pop_unknown_namespaces()
+            if resync_namespaces:
+                msg["resync_namespaces"] = resync_namespaces
+
+        if self._message_format == BINARY_MESSAGE_FORMAT:
+            try:
+                self._proc.stdin.write(serialize_message_binary(msg))
+                self._proc.stdin.flush()
+                return
+            except (pickle.PicklingError, TypeError, AttributeError):
+                # backend understands also text messages
+                logger.warning(
+                    "Could not serialize %s in binary format", type(msg).__name__, exc_info=True
+                )
+
+        data = serialize_message(msg) + "\n"
+        if self._uses_binary_pipes:
+            self._proc.stdin.write(data.encode("utf-8"))
+        else:
+            self._proc.stdin.write(data)
         self._proc.stdin.flush()
 
     def _prepare_clean_launch(self):
@@ -1186,25 +1605,34 @@ class SubprocessProxy(BackendProxy, ABC):
             self._proc.kill()
 
         self._proc = None
-        self._response_queue = None
+        if self._response_queue is not None:
+            # release the listener thread, if it's waiting for the room in the queue
+            self._response_queue.close()
+            self._response_queue = None
+
+    def set_message_notifier(self, notifier: Callable[[], None]) -> bool:
+        self._message_notifier = notifier
+        return True
+
+    def get_message_queue_length(self) -> Optional[int]:
+        return len(self._response_queue) if self._response_queue is not None else 0
+
+    def _notify_message_available(self) -> None:
+        if self._message_notifier is not None:
+            self._message_notifier()
 
     def _listen_stdout(self, stdout):
         # will be called from separate thread
 
         # allow self._response_queue to be replaced while processing
         message_queue = self._response_queue
+        variables_patcher = self._variables_patcher
+        frame_source_decoder = self._frame_source_decoder
 
         def publish_as_msg(data):
-            msg = parse_message(data)
-            if "cwd" in msg:
-                self.cwd = msg["cwd"]
-            message_queue.append(msg)
-
-            if len(message_queue) > 10:
-                # Probably backend runs an infinite/long print loop.
-                # Throttle message throughput in order to keep GUI thread responsive.
-                while len(message_queue) > 0:
-                    sleep(0.005)
+            msg = variables_patcher.decode_message(parse_message(data))
+            msg = frame_source_decoder.decode_message(msg)
+            self._queue_incoming_message(message_queue, msg)
 
         while True:
             try:
@@ -1217,6 +1645,8 @@ class SubprocessProxy(BackendProxy, ABC):
             # debug("... read some stdout data", repr(data))
             if data == "":
                 logger.info("Reader got EOF")
+                # let the runner notice termination
+                self._notify_message_available()
                 break
             else:
                 try:
@@ -1230,8 +1660,9 @@ class SubprocessProxy(BackendProxy, ABC):
                     parts = data.rsplit(common.MESSAGE_MARKER, maxsplit=1)
 
                     # print first part as it is
-                    message_queue.append(
-                        BackendEvent("ProgramOutput", data=parts[0], stream_name="stdout")
+                    self._queue_incoming_message(
+                        message_queue,
+                        BackendEvent("ProgramOutput", data=parts[0], stream_name="stdout"),
                     )
 
                     if len(parts) == 2:
@@ -1240,21 +1671,79 @@ class SubprocessProxy(BackendProxy, ABC):
                             publish_as_msg(second_part)
                         except Exception:
                             # just print ...
-                            message_queue.append(
+                            self._queue_incoming_message(
+                                message_queue,
                                 BackendEvent(
                                     "ProgramOutput", data=second_part, stream_name="stdout"
-                                )
+                                ),
                             )
 
+    def _listen_binary_stdout(self, stdout):
+        # will be called from separate thread
+        message_queue = self._response_queue
+        variables_patcher = self._variables_patcher
+        frame_source_decoder = self._frame_source_decoder
+
+        while True:
+            try:
+                text, msg = read_one_incoming_message_bytes(stdout)
+            except MessageDecodingError as e:
+                # The broken frame has been consumed, next read starts from the next line
+                logger.warning("Could not decode message from backend", exc_info=True)
+                if e.prefix:
+                    self._queue_incoming_message(
+                        message_queue,
+                        BackendEvent("ProgramOutput", data=e.prefix, stream_name="stdout"),
+                    )
+                self._queue_incoming_message(
+                    message_queue,
+                    BackendEvent(
+                        "ProgramOutput",
+                        data="[Could not decode message from back-end: %s]\n" % e,
+                        stream_name="stderr",
+                    ),
+                )
+                continue
+            except Exception:
+                # OSError or ValueError (closed file) from the stream itself. Retrying would only
+                # spin on the same error, so treat it as EOF.
+                logger.exception("Could not read from backend")
+                self._notify_message_available()
+                break
+
+            if text:
+                # from a subprocess or other code bypassing stream faking
+                self._queue_incoming_message(
+                    message_queue, BackendEvent("ProgramOutput", data=text, stream_name="stdout")
+                )
+
+            if msg is not None:
+                msg = frame_source_decoder.decode_message(variables_patcher.decode_message(msg))
+                self._queue_incoming_message(message_queue, msg)
+            elif not text:
+                logger.info("Reader got EOF")
+                self._notify_message_available()
+                break
+
+    def _queue_incoming_message(self, message_queue, msg: MessageFromBackend) -> None:
+        if "cwd" in msg:
+            self.cwd = msg["cwd"]
+        # May block if the UI thread is behind with processing program output
+        message_queue.append(msg)
+        self._notify_message_available()
+
     def _listen_stderr(self, stderr):
+        # the queue of this process (see _listen_stdout)
+        message_queue = self._response_queue
         while True:
             data = read_one_incoming_message_str(stderr.readline)
             if data == "":
                 break
             else:
-                self._response_queue.append(
+                message_queue.append(
                     BackendEvent("ProgramOutput", stream_name="stderr", data=data)
                 )
+                self._notify_message_available()
 
     def _store_state_info(self, msg):
         if "cwd" in msg:
@@ -1330,34 +1819,47 @@ class SubprocessProxy(BackendProxy, ABC):
         if msg.event_type == "ProgramOutput":
             # combine available small output messages to one single message,
             # in order to put less pressure on UI code
+            parts = [msg["data"]]
+            total_length = len(msg["data"])
+            has_newline = "\n" in msg["data"]
+            # enough for detecting incomplete escape sequences
+            tail = msg["data"][-MAX_ANSI_CODE_LENGTH:]
 
             wait_time = 0.01
             total_wait_time = 0
             while True:
                 if len(self._response_queue) == 0:
-                    if _ends_with_incomplete_ansi_code(msg["data"]) and total_wait_time < 0.1:
+                    if _ends_with_incomplete_ansi_code(tail) and total_wait_time < 0.1:
                         # Allow reader to send the remaining part
                         sleep(wait_time)
                         total_wait_time += wait_time
                         continue
                     else:
-                        return msg
+                        break
                 else:
                     next_msg = self._response_queue.popleft()
                     if (
                         next_msg.event_type == "ProgramOutput"
                         and next_msg["stream_name"] == msg["stream_name"]
                         and (
-                            len(msg["data"]) + len(next_msg["data"]) <= OUTPUT_MERGE_THRESHOLD
-                            and ("\n" not in msg["data"] or not io_animation_required)
-                            or _ends_with_incomplete_ansi_code(msg["data"])
+                            total_length + len(next_msg["data"]) <= OUTPUT_MERGE_THRESHOLD
+                            and (not has_newline or not io_animation_required)
+                            or _ends_with_incomplete_ansi_code(tail)
                         )
                     ):
-                        msg["data"] += next_msg["data"]
+                        data = next_msg["data"]
+                        parts.append(data)
+                        total_length += len(data)
+                        has_newline = has_newline or "\n" in data
+                        tail = (tail + data[-MAX_ANSI_CODE_LENGTH:])[-MAX_ANSI_CODE_LENGTH:]
                     else:
                         # not to be sent in the same block, put it back
                         self._response_queue.appendleft(next_msg)
-                        return msg
+                        break
+
+            if len(parts) > 1:
+                msg["data"] = "".join(parts)
+            return msg
 
         else:
             return msg
@@ -1567,6 +2069,303 @@ def generate_command_id():
     return "cmd_" + str(_command_id_counter)
 
 
+def _is_outdated_analysis_command(cmd: CommandToBackend, newer_cmd: CommandToBackend) -> bool:
+    # Response to the older command would be ignored anyway. It's safe to drop the older command,
+    # because the newer one carries all the changes since the version known to the back-end.
+    return (
+        "session_id" in cmd
+        and cmd["session_id"] == newer_cmd.get("session_id")
+        and cmd["document_version"] < newer_cmd["document_version"]
+    )
+
+
+class AnalysisWorkerPool:
+    """Answers editor's analysis commands with processes separate from the back-end,
+    so that completions etc. are available also while the user program is running.
+
+    The commands of an editor session always go to the same worker, which keeps its copy of the
+    document and jedi's caches warm. A worker computes one response at a time. Waiting commands
+    get replaced by newer commands of the same kind from the same session and by the commands for
+    a newer version of the document.
+    """
+
+    def __init__(self, sys_path: List[str], size: int) -> None:
+        self._sys_path = sys_path
+        self._message_queue = queue.Queue()  # populated by the reader threads of the workers
+        # first worker keeps the index up to date
+        self._completion_index_path = completion_index.get_index_path(THONNY_USER_DIR, sys_path)
+        self._workers = [
+            _AnalysisWorker(
+                sys_path, self._message_queue, self._completion_index_path if i == 0 else None
+            )
+            for i in range(size)
+        ]
+        self._completion_index = None  # type: Optional[completion_index.CompletionIndex]
+        self._completion_index_mtime = None
+        self._response_cache = collections.OrderedDict()  # type: Dict[tuple, InlineResponse]
+        # get_completion_details needs to go where the last completions were computed
+        self._details_worker = None  # type: Optional[_AnalysisWorker]
+        self._last_completions_key = None
+        self._polling_after_id = None
+
+    def get_sys_path(self) -> List[str]:
+        return self._sys_path
+
+    def get_size(self) -> int:
+        return len(self._workers)
+
+    def start(self) -> None:
+        for worker in self._workers:
+            worker.start()
+
+    def get_completion_index(self) -> Optional[completion_index.CompletionIndex]:
+        try:
+            mtime = os.stat(self._completion_index_path).st_mtime_ns
+        except OSError:
+            # not built yet
+            return None
+
+        if mtime != self._completion_index_mtime:
+            self._completion_index = completion_index.load_index(self._completion_index_path)
+            self._completion_index_mtime = mtime
+
+        return self._completion_index
+
+    def try_send(self, cmd: CommandToBackend) -> bool:
+        """Returns False if the command should be sent to the back-end instead"""
+        if not isinstance(cmd, InlineCommand):
+            return False
+
+        if cmd.name == "get_completion_details":
+            worker = self._details_worker
+            if worker is None:
+                return False
+            worker.send_command(cmd)
+            self._schedule_polling()
+            return True
+
+        if cmd.name not in ANALYSIS_COMMAND_NAMES:
+            if cmd.name == "shell_autocomplete":
+                self._details_worker = None
+                self._last_completions_key = None
+            return False
+
+        affinity_key = cmd.get("session_id", cmd.get("filename"))
+        worker = self._workers[hash(affinity_key) % len(self._workers)]
+        if not worker.is_usable():
+            return False
+
+        key = self._get_cache_key(cmd)
+        # cached completions are good only while the worker can give details for them
+        if key in self._response_cache and (
+            cmd.name != "editor_autocomplete" or key == self._last_completions_key
+        ):
+            self._response_cache.move_to_end(key)
+            self._publish_response(self._create_response_from_cache(self._response_cache[key], cmd))
+            return True
+
+        if cmd.name == "editor_autocomplete":
+            self._details_worker = worker
+            self._last_completions_key = None
+        worker.send_command(cmd)
+        self._schedule_polling()
+        return True
+
+    def _get_cache_key(self, cmd: InlineCommand) -> Optional[tuple]:
+        if "source_hash" not in cmd:
+            return None
+        return cmd.name, cmd.get("filename"), cmd.source_hash, cmd.get("row"), cmd.get("column")
+
+    def _create_response_from_cache(
+        self, cached_response: InlineResponse, cmd: InlineCommand
+    ) -> InlineResponse:
+        response = copy.copy(cached_response)
+        for name in ["session_id", "document_version", "text_last_operation_time"]:
+            if name in response:
+                response[name] = cmd[name]
+        response["command_id"] = cmd["id"]
+        # the worker doesn't necessarily have this version of the document
+        response["from_cache"] = True
+        return response
+
+    def _cache_response(self, cmd: InlineCommand, response: InlineResponse) -> None:
+        key = self._get_cache_key(cmd)
+        if (
+            key is None
+            or response.get("error")
+            # unknown document version means empty result
+            or "session_id" in response
+            and response.get("document_version") is None
+        ):
+            return
+
+        if cmd.name == "editor_autocomplete":
+            self._last_completions_key = key
+
+        self._response_cache[key] = response
+        while len(self._response_cache) > MAX_CACHED_ANALYSIS_RESPONSES:
+            self._response_cache.popitem(last=False)
+
+    def _schedule_polling(self) -> None:
+        if self._polling_after_id is None:
+            self._polling_after_id = get_workbench().after(
+                ANALYSIS_POLLING_INTERVAL, self._poll_messages
+            )
+
+    def _poll_messages(self) -> None:
+        self._polling_after_id = None
+        while not self._message_queue.empty():
+            worker, proc, msg = self._message_queue.get()
+            if msg is None:
+                worker.handle_termination(proc)
+                continue
+
+            cmd = worker.handle_message(proc, msg)
+            if cmd is not None:
+                self._cache_response(cmd, msg)
+                self._publish_response(msg)
+
+        if any(worker.is_busy() for worker in self._workers):
+            self._schedule_polling()
+
+    def _publish_response(self, msg: InlineResponse) -> None:
+        get_workbench().event_generate("InlineResponse", event=msg)
+        get_workbench().event_generate(msg.event_type, event=msg)
+
+    def close(self) -> None:
+        if self._polling_after_id is not None:
+            get_workbench().after_cancel(self._polling_after_id)
+            self._polling_after_id = None
+
+        for worker in self._workers:
+            worker.close()
+
+
+class _AnalysisWorker:
+    def __init__(
+        self,
+        sys_path: List[str],
+        message_queue: "queue.Queue",
+        completion_index_path: Optional[str],
+    ) -> None:
+        self._sys_path = sys_path
+        self._message_queue = message_queue
+        self._completion_index_path = completion_index_path
+        self._proc = None
+        self._running_command = None  # type: Optional[InlineCommand]
+        self._waiting_commands = []  # type: List[InlineCommand]
+        self._consecutive_crashes = 0
+
+    def is_usable(self) -> bool:
+        # Don't keep restarting a worker, which can't even start answering
+        return self._consecutive_crashes < MAX_CONSECUTIVE_ANALYSIS_WORKER_CRASHES
+
+    def is_busy(self) -> bool:
+        return self._running_command is not None
+
+    def send_command(self, cmd: InlineCommand) -> None:
+        if self._running_command is not None:
+            # Sessions share the worker, so a command of one editor mustn't drop
+            # the command of another
+            for older_cmd in list(self._waiting_commands):
+                if (
+                    older_cmd.name == cmd.name
+                    and older_cmd.get("session_id") == cmd.get("session_id")
+                    or _is_outdated_analysis_command(older_cmd, cmd)
+                ):
+                    self._waiting_commands.remove(older_cmd)
+            self._waiting_commands.append(cmd)
+            return
+
+        self.start()
+        self._running_command = cmd
+        try:
+            self._proc.stdin.write(serialize_message(cmd) + "\n")
+            self._proc.stdin.flush()
+        except OSError:
+            # reader thread will report the termination
+            logger.warning("Could not send command to analysis worker", exc_info=True)
+
+    def handle_message(self, proc, msg: MessageFromBackend) -> Optional[InlineCommand]:
+        """Returns the command, if the message is the response to it"""
+        if proc is not self._proc:
+            # from an abandoned process
+            return None
+
+        if not isinstance(msg, InlineResponse):
+            logger.warning("Unexpected message from analysis worker: %r", msg)
+            return None
+
+        self._consecutive_crashes = 0
+        cmd = self._running_command
+        self._running_command = None
+        self._send_next_waiting_command()
+        return cmd
+
+    def handle_termination(self, proc) -> None:
+        if proc is not self._proc:
+            return
+
+        logger.warning("Analysis worker ended with exit code %s", proc.poll())
+        self._consecutive_crashes += 1
+        self._proc = None
+        lost_command = self._running_command
+        self._running_command = None
+        if self.is_usable():
+            # retry with a fresh process
+            if lost_command is not None:
+                self._waiting_commands.insert(0, lost_command)
+            self._send_next_waiting_command()
+        else:
+            self._waiting_commands = []
+
+    def _send_next_waiting_command(self) -> None:
+        if self._waiting_commands:
+            self.send_command(self._waiting_commands.pop(0))
+
+    def start(self) -> None:
+        if self._proc is not None or not self.is_usable():
+            return
+
+        worker_file = os.path.join(os.path.dirname(__file__), "analysis_worker.py")
+        logger.info("Starting analysis worker")
+        self._proc = create_frontend_python_process(
+            ["-B", worker_file, repr(self._sys_path), repr(self._completion_index_path)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        Thread(target=self._listen_stdout, args=(self._proc,), daemon=True).start()
+        Thread(target=self._listen_stderr, args=(self._proc,), daemon=True).start()
+
+    def _listen_stdout(self, proc) -> None:
+        # will be called from separate thread
+        ack = proc.stdout.readline()
+        if parse_process_ack(ack) is None:
+            logger.error("Got %r instead of %r from analysis worker", ack, PROCESS_ACK)
+        else:
+            while True:
+                data = read_one_incoming_message_str(proc.stdout.readline)
+                if data == "":
+                    break
+                self._message_queue.put((self, proc, parse_message(data)))
+
+        proc.wait()
+        self._message_queue.put((self, proc, None))
+
+    def _listen_stderr(self, proc) -> None:
+        # will be called from separate thread
+        for line in proc.stderr:
+            logger.warning("Analysis worker: %s", line.rstrip())
+
+    def close(self) -> None:
+        if self._proc is not None and self._proc.poll() is None:
+            self._proc.kill()
+        self._proc = None
+        self._running_command = None
+        self._waiting_commands = []
+
+
 class InlineCommandDialog(WorkDialog):
     def __init__(
         self,
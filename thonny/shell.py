@@ -4,9 +4,11 @@ import os.path
 import re
 import tkinter as tk
 import traceback
+from bisect import bisect_right
+from collections import deque
 from logging import getLogger
 from tkinter import ttk
-from typing import Optional, cast
+from typing import Any, List, Optional, Tuple, cast
 
 from _tkinter import TclError
 
@@ -24,12 +26,15 @@ from thonny.common import (
 from thonny.custom_notebook import CustomNotebook
 from thonny.languages import tr
 from thonny.misc_utils import construct_cmd_line, parse_cmd_line
+from thonny.output_store import OutputStore
 from thonny.running import EDITOR_CONTENT_TOKEN
 from thonny.tktextext import TextFrame, TweakableText, index2line
 from thonny.ui_utils import (
     CommonDialog,
     EnhancedTextWithLogging,
     TextMenu,
+    ask_string,
+    asksaveasfilename,
     create_tooltip,
     ems_to_pixels,
     get_beam_cursor,
@@ -105,6 +110,7 @@ class ShellView(tk.PanedWindow):
 
         get_workbench().set_default("shell.max_lines", 1000)
         get_workbench().set_default("shell.squeeze_threshold", 1000)
+        get_workbench().set_default("shell.output_margin_lines", 500)
         get_workbench().set_default("shell.tty_mode", True)
         get_workbench().set_default("shell.auto_inspect_values", True)
         get_workbench().set_default("shell.clear_for_new_process", True)
@@ -267,6 +273,8 @@ class ShellView(tk.PanedWindow):
 
     def set_scrollbar(self, *args):
         self.vert_scrollbar.set(*args)
+        if float(args[0]) == 0.0:
+            self.text.request_stored_lines()
         self.update_plotter()
 
     def text_deleted(self, event):
@@ -303,6 +311,10 @@ class ShellMenu(TextMenu):
     def add_extra_items(self):
         self.add_separator()
         self.add_command(label=tr("Clear"), command=self.text._clear_shell)
+        self.add_command(label=tr("Find in output") + "...", command=self.text.find_in_output)
+        self.add_command(label=tr("Find next in output"), command=self.text.find_next_in_output)
+        self.add_command(label=tr("Copy all output"), command=self.text.copy_all_output)
+        self.add_command(label=tr("Save output") + "...", command=self.text.save_output)
 
         def toggle_from_menu():
             # I don't like that Tk menu toggles checbutton variable
@@ -324,6 +336,88 @@ class ShellMenu(TextMenu):
         return not self.text.selection_is_writable()
 
 
+class IoEventLog:
+    """Applied IO events of current toplevel block.
+
+    Besides the events it keeps the number of visible chars and text widget chars preceding
+    each event and the rendering state (ANSI attributes, cursor offset etc.) before each event,
+    so that the Shell can be rewound to any point in the history without re-applying everything
+    from the beginning.
+    """
+
+    def __init__(self):
+        self.events = []  # type: List[Tuple[str, str]]
+        self.visible_char_count = 0
+        self.text_length = 0
+        self._visible_starts = []  # type: List[int]
+        self._text_starts = []  # type: List[int]
+        self._states = []  # type: List[Any]
+        # (event index, text position) for events which changed the text before their start
+        self._overwrites = []  # type: List[Tuple[int, int]]
+
+    def __len__(self):
+        return len(self.events)
+
+    def append(self, event, text_length, state, overwrite_start=None):
+        if overwrite_start is not None:
+            self._overwrites.append((len(self.events), overwrite_start))
+
+        self.events.append(event)
+        self._visible_starts.append(self.visible_char_count)
+        self._text_starts.append(self.text_length)
+        if self._states and self._states[-1] == state:
+            # most events don't change the state, no need to keep a copy for each of them
+            state = self._states[-1]
+        self._states.append(state)
+        self.visible_char_count += len(event[0])
+        self.text_length += text_length
+
+    def find_rewind_point(self, target_num_visible_chars):
+        """Returns the index of the first event, which needs to be undone for reaching the target.
+
+        If the event at this index is only partly visible in the target, then it needs to be
+        undone and re-applied partly.
+        """
+        index = max(bisect_right(self._visible_starts, target_num_visible_chars) - 1, 0)
+
+        # If some event after this point has overwritten preceding text (eg. after \r),
+        # then removing the text after the start of the rewind point is not enough.
+        while True:
+            reach = self._text_starts[index]
+            for event_index, position in reversed(self._overwrites):
+                if event_index < index:
+                    break
+                reach = min(reach, position)
+
+            if reach >= self._text_starts[index] or index == 0:
+                return index
+
+            index = max(bisect_right(self._text_starts, reach) - 1, 0)
+
+    def get_text_start(self, index):
+        return self._text_starts[index]
+
+    def get_state(self, index):
+        return self._states[index]
+
+    def truncate(self, index):
+        """Forgets the events starting from the index and returns them"""
+        removed = self.events[index:]
+        if not removed:
+            return removed
+
+        self.visible_char_count = self._visible_starts[index]
+        self.text_length = self._text_starts[index]
+        del self.events[index:]
+        del self._visible_starts[index:]
+        del self._text_starts[index:]
+        del self._states[index:]
+        while self._overwrites and self._overwrites[-1][0] >= index:
+            self._overwrites.pop()
+
+        return removed
+
+
 class BaseShellText(EnhancedTextWithLogging, SyntaxText):
     """Passive version of ShellText. Used also for preview"""
 
@@ -343,10 +437,17 @@ class BaseShellText(EnhancedTextWithLogging, SyntaxText):
 
         # logs of IO events for current toplevel block
         # (enables undoing and redoing the events)
-        self._applied_io_events = []
-        self._queued_io_events = []
+        self._applied_io_events = IoEventLog()
+        self._queued_io_events = deque()
         self._images = set()
 
+        # text which has been discarded from the widget, but may be brought back
+        self._output_store = OutputStore()
+        self._stored_lines_requested = False
+        # placeholders for the stored lines, which follow the lines restored by find
+        self._stored_lines_buttons = set()
+        self._find_needle = None
+
         self._ansi_foreground = None
         self._ansi_background = None
         self._ansi_inverse = False
@@ -523,29 +624,26 @@ class BaseShellText(EnhancedTextWithLogging, SyntaxText):
 
     def _update_visible_io(self, target_num_visible_chars):
         was_scrolled_to_end = self.is_scrolled_to_end()
-        current_num_visible_chars = sum(map(lambda x: len(x[0]), self._applied_io_events))
+        if target_num_visible_chars is None:
+            self._store_overflowing_io()
+        current_num_visible_chars = self._applied_io_events.visible_char_count
 
         if (
             target_num_visible_chars is not None
             and target_num_visible_chars < current_num_visible_chars
         ):
-            # hard to undo complex renderings (squeezed texts and ANSI codes)
-            # easier to clean everything and start again
-            self._queued_io_events = self._applied_io_events + self._queued_io_events
-            self._applied_io_events = []
-            self.direct_delete("command_io_start", "output_end")
-            current_num_visible_chars = 0
-            self._reset_ansi_attributes()
+            self._undo_io_events(target_num_visible_chars)
+            current_num_visible_chars = self._applied_io_events.visible_char_count
 
         while self._queued_io_events and current_num_visible_chars != target_num_visible_chars:
-            data, stream_name = self._queued_io_events.pop(0)
+            data, stream_name = self._queued_io_events.popleft()
 
             if target_num_visible_chars is not None:
                 leftover_count = current_num_visible_chars + len(data) - target_num_visible_chars
 
                 if leftover_count > 0:
                     # add suffix to the queue
-                    self._queued_io_events.insert(0, (data[-leftover_count:], stream_name))
+                    self._queued_io_events.appendleft((data[-leftover_count:], stream_name))
                     data = data[:-leftover_count]
 
             self._apply_io_event(data, stream_name)
@@ -555,11 +653,122 @@ class BaseShellText(EnhancedTextWithLogging, SyntaxText):
         if was_scrolled_to_end:
             self.see("end")
 
+    def _store_overflowing_io(self):
+        """Sends the beginning of a big output burst directly to the output store.
+
+        The lines, which would be discarded right after inserting them, don't need to be
+        inserted to the widget at all.
+        """
+        if (
+            not self._queued_io_events
+            or self._io_cursor_offset != 0
+            or "value" in self.active_extra_tags
+            or not self._is_plain_io(self._queued_io_events[0][0])
+        ):
+            return
+
+        max_lines = max(get_workbench().get_option("shell.max_lines"), 0)
+        newline_count = 0
+        boundary = len(self._queued_io_events)
+        for data, _ in reversed(self._queued_io_events):
+            boundary -= 1
+            newline_count += data.count("\n")
+            if newline_count > max_lines:
+                break
+        else:
+            return
+
+        # Everything before the queued events precedes the stored output
+        self._store_content("output_insert")
+        self._clear_content("output_insert")
+
+        log = self._applied_io_events
+        for i in range(boundary + 1):
+            data, stream_name = self._queued_io_events[0]
+            if i == boundary:
+                # only the excess lines of the boundary event can be stored
+                if not self._is_plain_io(data):
+                    break
+                split_pos = -1
+                for _ in range(newline_count - max_lines):
+                    split_pos = data.index("\n", split_pos + 1)
+                if split_pos + 1 == len(data):
+                    self._queued_io_events.popleft()
+                else:
+                    self._queued_io_events[0] = (data[split_pos + 1 :], stream_name)
+                    data = data[: split_pos + 1]
+            elif self._is_plain_io(data):
+                self._queued_io_events.popleft()
+            elif self.tty_mode and data.startswith("\x1b[") and data.endswith("m"):
+                # color codes only change the state
+                self._queued_io_events.popleft()
+                self._apply_io_event(data, stream_name)
+                continue
+            else:
+                break
+
+            self._output_store.append(data)
+            log.append((data, stream_name), 0, self._get_io_state())
+
+    def _is_plain_io(self, data):
+        return not (
+            (self.tty_mode and TERMINAL_CONTROL_REGEX.match(data))
+            or OBJECT_INFO_START_REGEX.match(data)
+            or OBJECT_INFO_END_REGEX.match(data)
+        )
+
+    def _undo_io_events(self, target_num_visible_chars):
+        log = self._applied_io_events
+        index = log.find_rewind_point(target_num_visible_chars)
+        removed_text_length = log.text_length - log.get_text_start(index)
+        self._set_io_state(log.get_state(index))
+
+        if removed_text_length > 0:
+            start = self.index("output_insert -%d chars" % removed_text_length)
+            if self.compare(start, "<", "command_io_start"):
+                # old content has been discarded meanwhile
+                start = "command_io_start"
+            self.direct_delete(start, "output_insert")
+
+        self._queued_io_events.extendleft(reversed(log.truncate(index)))
+
+    def _get_io_state(self):
+        return (
+            self._ansi_foreground,
+            self._ansi_background,
+            self._ansi_inverse,
+            self._ansi_intensity,
+            self._ansi_italic,
+            self._ansi_underline,
+            self._ansi_conceal,
+            self._ansi_strikethrough,
+            self._io_cursor_offset,
+            tuple(self.active_extra_tags),
+        )
+
+    def _set_io_state(self, state):
+        (
+            self._ansi_foreground,
+            self._ansi_background,
+            self._ansi_inverse,
+            self._ansi_intensity,
+            self._ansi_italic,
+            self._ansi_underline,
+            self._ansi_conceal,
+            self._ansi_strikethrough,
+            self._io_cursor_offset,
+            active_extra_tags,
+        ) = state
+        self.active_extra_tags = list(active_extra_tags)
+
     def _apply_io_event(self, data, stream_name):
         if not data:
             return
 
         original_data = data
+        state = self._get_io_state()
+        start_index = self.index("output_insert")
+        overwrite_start = None
 
         if self.tty_mode and re.match(TERMINAL_CONTROL_REGEX, data):
             if data == "\a":
@@ -658,6 +867,7 @@ class BaseShellText(EnhancedTextWithLogging, SyntaxText):
                     overwrite_len = data.find("\n")
 
                 overwrite_data = data[:overwrite_len]
+                overwrite_start = self._applied_io_events.text_length + self._io_cursor_offset
                 self.direct_insert(
                     "output_insert -%d chars" % -self._io_cursor_offset, overwrite_data, tuple(tags)
                 )
@@ -687,7 +897,21 @@ class BaseShellText(EnhancedTextWithLogging, SyntaxText):
                 # if any data is still left, then this should be output normally
                 self._insert_text_directly(data, tuple(tags))
 
-        self._applied_io_events.append((original_data, stream_name))
+        self._applied_io_events.append(
+            (original_data, stream_name),
+            self._count_chars(start_index, "output_insert"),
+            state,
+            overwrite_start,
+        )
+
+    def _count_chars(self, index1, index2):
+        if self.compare(index1, ">=", index2):
+            return 0
+
+        result = self.count(index1, index2, "chars")
+        if isinstance(result, tuple):
+            result = result[0]
+        return result or 0
 
     def _show_squeezed_text(self, button):
         dlg = SqueezedTextDialog(self, button)
@@ -939,6 +1163,7 @@ class BaseShellText(EnhancedTextWithLogging, SyntaxText):
             and not was_running
         ):
             self._clear_content("end")
+            self._output_store.clear()
         else:
             if (
                 "restart_line" in self.tag_names("output_insert -2 chars")
@@ -1256,7 +1481,7 @@ class BaseShellText(EnhancedTextWithLogging, SyntaxText):
                     command_name = argv[0]
                     cmd_args = argv[1:]
 
-                    if command_name.lower() in ["run", "debug", "fastdebug"]:
+                    if command_name.lower() in ["run", "debug", "fastdebug", "profile", "coverage"]:
                         if len(cmd_args) >= 2 and cmd_args[0] == "-c":
                             # move source argument to source attribute
                             source = cmd_args[1]
@@ -1314,8 +1539,8 @@ class BaseShellText(EnhancedTextWithLogging, SyntaxText):
                 self.mark_set("command_io_start", "output_insert")
                 self.mark_gravity("command_io_start", "left")
                 # discard old io events
-                self._applied_io_events = []
-                self._queued_io_events = []
+                self._applied_io_events = IoEventLog()
+                self._queued_io_events = deque()
             except Exception:
                 get_workbench().report_exception()
                 self._insert_prompt()
@@ -1326,7 +1551,9 @@ class BaseShellText(EnhancedTextWithLogging, SyntaxText):
             assert get_runner().is_running()
             get_runner().send_program_input(text_to_be_submitted)
             get_workbench().event_generate("ShellInput", input_text=text_to_be_submitted)
-            self._applied_io_events.append((text_to_be_submitted, "stdin"))
+            self._applied_io_events.append(
+                (text_to_be_submitted, "stdin"), len(text_to_be_submitted), self._get_io_state()
+            )
 
     def _arrow_up(self, event):
         if not get_runner().is_waiting_toplevel_command():
@@ -1416,6 +1643,151 @@ class BaseShellText(EnhancedTextWithLogging, SyntaxText):
     def _clear_shell(self):
         end_index = self.index("output_end")
         self._clear_content(end_index)
+        self._output_store.clear()
+
+    def request_stored_lines(self):
+        if self._output_store and not self._stored_lines_requested:
+            self._stored_lines_requested = True
+            self.after_idle(self._restore_stored_lines)
+
+    def _restore_stored_lines(self, count=None):
+        """Brings last lines of the output store back to the widget"""
+        self._stored_lines_requested = False
+        if count is None:
+            if self.yview()[0] > 0.0:
+                # user has scrolled away meanwhile
+                return
+            count = get_workbench().get_option("shell.output_margin_lines")
+
+        text = self._output_store.pop_lines(count)
+        if not text:
+            return
+
+        top = self.index("@0,0")
+        self.direct_insert("1.0", text, ("io",))
+        self.yview("%s +%d lines" % (top, text.count("\n")))
+
+    def get_full_text(self):
+        return self._output_store.get_text() + self._get_text_with_squeezed("1.0", "end-1c")
+
+    def find_in_output(self):
+        needle = ask_string(tr("Find"), tr("Find in Shell output"), master=self.winfo_toplevel())
+        if not needle:
+            return
+
+        self._find_needle = needle
+        stored_line = self._output_store.find_line(needle)
+        if stored_line is not None:
+            self._restore_stored_window(self._output_store, stored_line, "1.0")
+
+        self._select_next_occurrence(needle, "1.0")
+
+    def find_next_in_output(self):
+        if not self._find_needle:
+            self.find_in_output()
+            return
+
+        self._select_next_occurrence(self._find_needle, "insert")
+
+    def _select_next_occurrence(self, needle, start):
+        while True:
+            match = self.search(needle, start, stopindex="end")
+            btn = self._find_stored_lines_button(start, match or "end")
+            if btn is None:
+                break
+
+            # stored lines precede the match in the widget
+            stored_line = btn.output_store.find_line(needle)
+            start = self.index(btn)
+            if stored_line is not None:
+                self._restore_stored_window(btn.output_store, stored_line, start + " +1 chars")
+                if not btn.output_store:
+                    self._remove_stored_lines_button(btn)
+            else:
+                start += " +1 chars"
+
+        if not match:
+            get_workbench().bell()
+            return
+
+        end = "%s +%d chars" % (match, len(needle))
+        self.tag_remove("sel", "1.0", "end")
+        self.tag_add("sel", match, end)
+        self.mark_set("insert", end)
+        self.see(match)
+
+    def _restore_stored_window(self, store, line, index):
+        """Brings margin lines around given line of the store back to the widget.
+
+        The lines after the window are left to a new store, which is represented by a button.
+        """
+        margin = get_workbench().get_option("shell.output_margin_lines")
+        window_start = max(line - margin, 0)
+        following = store.split_off(line + margin + 1)
+        text = store.pop_lines(store.get_line_count() - window_start)
+
+        if following:
+            self._create_stored_lines_button(index, following)
+        self.direct_insert(index, text, ("io",))
+
+    def _create_stored_lines_button(self, index, store):
+        btn = tk.Label(self, cursor="arrow", borderwidth=2, relief="raised", font="IOFont")
+        btn.output_store = store
+        btn.bind("<1>", lambda e: self._restore_button_lines(btn), True)
+        self._update_stored_lines_button(btn)
+        create_tooltip(btn, tr("Click to show these lines"))
+        self._stored_lines_buttons.add(btn)
+        self.window_create(index, window=btn)
+        self.tag_add("io", btn)
+
+    def _update_stored_lines_button(self, btn):
+        btn.configure(text=tr("%d lines hidden") % btn.output_store.get_line_count() + " …")
+
+    def _restore_button_lines(self, btn):
+        """Brings back the last lines of the button's store (like scrolling to the top does)"""
+        text = btn.output_store.pop_lines(get_workbench().get_option("shell.output_margin_lines"))
+        self.direct_insert(self.index(btn) + " +1 chars", text, ("io",))
+        if btn.output_store:
+            self._update_stored_lines_button(btn)
+        else:
+            self._remove_stored_lines_button(btn)
+
+    def _remove_stored_lines_button(self, btn):
+        index = self.index(btn)
+        self._stored_lines_buttons.remove(btn)
+        btn.output_store.close()
+        self.direct_delete(index, index + " +1 chars")
+        btn.destroy()
+
+    def _find_stored_lines_button(self, index1, index2):
+        if not self._stored_lines_buttons:
+            return None
+
+        buttons = {str(btn): btn for btn in self._stored_lines_buttons}
+        for key, value, _ in self.dump(index1, index2, window=True):
+            if key == "window" and value in buttons:
+                return buttons[value]
+
+        return None
+
+    def copy_all_output(self):
+        self.clipboard_clear()
+        self.clipboard_append(self.get_full_text())
+
+    def save_output(self):
+        filename = asksaveasfilename(
+            filetypes=[(tr("Text files"), ".txt"), (tr("all files"), ".*")],
+            defaultextension=".txt",
+            initialdir=get_workbench().get_local_cwd(),
+            parent=get_workbench(),
+        )
+        if filename in ["", (), None]:
+            return
+
+        with open(filename, "w", encoding="utf-8") as fp:
+            for chunk in self._output_store.iter_chunks():
+                fp.write(chunk)
+            fp.write(self._get_text_with_squeezed("1.0", "end-1c"))
 
     def _on_backend_terminated(self, event=None):
         logger.info("BaseShellText._on_backend_terminated")
@@ -1520,8 +1892,25 @@ class BaseShellText(EnhancedTextWithLogging, SyntaxText):
         if not next_prompt:
             pass  # TODO: disable stepping back
 
+        self._store_content(proposed_cut)
         self._clear_content(proposed_cut)
 
+    def _store_content(self, cut_idx):
+        self._output_store.append(self._get_text_with_squeezed("1.0", cut_idx))
+
+    def _get_text_with_squeezed(self, index1, index2):
+        buttons = {str(btn): btn for btn in self._squeeze_buttons}
+        stored_lines_buttons = {str(btn): btn for btn in self._stored_lines_buttons}
+        parts = []
+        for key, value, _ in self.dump(index1, index2, text=True, window=True):
+            if key == "text":
+                parts.append(value)
+            elif key == "window" and value in buttons:
+                parts.append(buttons[value].contained_text or "")
+            elif key == "window" and value in stored_lines_buttons:
+                parts.append(stored_lines_buttons[value].output_store.get_text())
+        return "".join(parts)
+
     def _clear_content(self, cut_idx):
         proposed_cut_float = float(self.index(cut_idx))
         for btn in list(self._squeeze_buttons):
@@ -1538,6 +1927,16 @@ class BaseShellText(EnhancedTextWithLogging, SyntaxText):
                 if btn in self._squeeze_buttons:
                     self._squeeze_buttons.remove(btn)
 
+        for btn in list(self._stored_lines_buttons):
+            try:
+                idx = self.index(btn)
+            except TclError:
+                idx = None
+            if not idx or float(idx) < proposed_cut_float:
+                self._stored_lines_buttons.remove(btn)
+                btn.output_store.close()
+                btn.destroy()
+
         self.direct_delete("0.1", cut_idx)
 
     def _on_mouse_move(self, event=None):
@@ -0,0 +1,56 @@
+import random
+
+from thonny.plugins.coloring import LineStates, lex_line
+
+TEST_LINES = [
+    "def foo():",
+    '    """Docstring with \'quotes\'',
+    "    and # no comment",
+    '    """',
+    '    s = "# \'\'\'"  # """',
+    "    return r'''raw",
+    "\\'''  '''",
+    "",
+]
+
+
+def test_lex_line():
+    assert lex_line('    """Docstring', None) == ([(4, None)], '"""')
+    assert lex_line('    """', '"""') == ([(0, 7)], None)
+    assert lex_line("# '''", None) == ([], None)
+    assert lex_line("'\"\"\"' + b'''x''' + f'''", None) == ([(8, 16), (19, None)], "'''")
+    assert lex_line("esc \\''' still", "'''") == ([(0, None)], "'''")
+
+
+def _lex_from_scratch(lines):
+    line_states = LineStates()
+    line_states.reset(len(lines))
+    line_states.relex(lines)
+    return [line_states.get_state(i) for i in range(1, len(lines) + 2)]
+
+
+def test_incremental_relex_matches_full_relex():
+    lines = list(TEST_LINES)
+    line_states = LineStates()
+    line_states.reset(len(lines))
+    line_states.relex(lines)
+    assert _lex_from_scratch(lines)[:-1] == [None, None, '"""', '"""', None, None, "'''", None]
+
+    rnd = random.Random(0)
+    for _ in range(500):
+        lineno = rnd.randint(1, len(lines))
+        line = lines[lineno - 1]
+        col = rnd.randint(0, len(line))
+        if rnd.random() < 0.5:
+            chars = rnd.choice(['"""', "'''", '"', "#", "\\", "\n", "x\ny"])
+            lines[lineno - 1 : lineno] = (line[:col] + chars + line[col:]).split("\n")
+        elif lineno < len(lines):
+            # join with next line
+            lines[lineno - 1 : lineno + 1] = [line[:col] + lines[lineno]]
+        else:
+            lines[lineno - 1] = line[:col]
+
+        line_states.adjust_line_count(lineno, len(lines))
+        line_states.relex(lines)
+        expected = _lex_from_scratch(lines)
+        assert [line_states.get_state(i) for i in range(1, len(lines) + 2)] == expected
@@ -1,6 +1,31 @@
+import io
 import os
+import pickle
 
-from thonny.common import path_startswith
+import pytest
+
+from thonny.common import (
+    DebuggerResponse,
+    FrameInfo,
+    FrameSourceDecoder,
+    FrameSourceEncoder,
+    InlineCommand,
+    MessageDecodingError,
+    TextRange,
+    ToplevelResponse,
+    ValueInfo,
+    VariablesDelta,
+    VariablesDiffer,
+    VariablesPatcher,
+    decode_line_set,
+    encode_line_set,
+    parse_message,
+    parse_message_binary,
+    path_startswith,
+    read_one_incoming_message_bytes,
+    serialize_message,
+    serialize_message_binary,
+)
 
 
 def test_path_startswith():
@@ -31,3 +56,191 @@ def test_path_startswith():
         assert path_startswith("c:\\foo\\bar.txt/kala\\pala", "C:\\")
 
         assert not path_startswith("C:\\kalapala\\pala", "C:\\kala")
+
+
+def test_line_set_encoding():
+    assert encode_line_set([]) == []
+    assert encode_line_set({7, 1, 2, 3, 5}) == [1, 3, 5, 1, 7, 1]
+    for lines in [[], [4], [1, 2, 3, 5, 7, 8, 100]]:
+        assert decode_line_set(encode_line_set(lines)) == lines
+
+
+def test_binary_message_round_trip():
+    msg = ToplevelResponse(
+        globals={"x": ValueInfo(123, "'õun'")},
+        focus=TextRange(1, 2, 3, 4),
+        content_bytes=b"\x00\n\x02",
+        ids={1, 2},
+    )
+    cmd = InlineCommand("get_heap")
+    stream = io.BufferedReader(
+        io.BytesIO(
+            b"partial output"
+            + serialize_message_binary(msg)
+            + b"line\r\n"
+            + (serialize_message(cmd) + "\n").encode("utf-8")
+        )
+    )
+
+    assert read_one_incoming_message_bytes(stream) == ("partial output", msg)
+    assert read_one_incoming_message_bytes(stream) == ("line\n", None)
+    assert read_one_incoming_message_bytes(stream) == ("", cmd)
+    assert read_one_incoming_message_bytes(stream) == ("", None)
+
+
+def test_binary_message_rejects_unknown_classes():
+    with pytest.raises(pickle.UnpicklingError):
+        parse_message_binary(1, pickle.dumps(os.system))
+    # helper classes of the module are not message classes either
+    with pytest.raises(pickle.UnpicklingError):
+        parse_message_binary(1, pickle.dumps(VariablesPatcher))
+
+
+def test_reading_resyncs_after_broken_binary_message():
+    msg = InlineCommand("get_heap")
+    good = serialize_message_binary(msg)
+    header, payload = good.split(b"\n", 1)
+    marker_and_version, length = header.split(b" ")
+    stream = io.BufferedReader(
+        io.BytesIO(
+            # malformed header
+            b"a" + marker_and_version + b" x\n"
+            # length which doesn't reach the end of the payload
+            + b"b" + marker_and_version + b" %d\n" % (int(length) - 1) + payload
+            # payload which is not a pickle
+            + b"c" + marker_and_version + b" 3\nxyz\n"
+            + good
+        )
+    )
+
+    for expected_prefix in ["a", "b", "c"]:
+        with pytest.raises(MessageDecodingError) as exc_info:
+            read_one_incoming_message_bytes(stream)
+        assert exc_info.value.prefix == expected_prefix
+
+    assert read_one_incoming_message_bytes(stream) == ("", msg)
+    assert read_one_incoming_message_bytes(stream) == ("", None)
+
+
+def _create_frame(frame_id, locals_, globals_):
+    return FrameInfo(
+        id=frame_id,
+        filename="prog.py",
+        module_name="__main__",
+        code_name="f",
+        source="",
+        source_id=None,
+        source_hash=None,
+        lineno=1,
+        firstlineno=1,
+        in_library=False,
+        locals=locals_,
+        globals=globals_,
+        freevars=(),
+        event="line",
+        focus=None,
+        node_tags=None,
+        current_statement=None,
+        current_root_expression=None,
+        current_evaluations=None,
+    )
+
+
+def test_variables_deltas():
+    differ = VariablesDiffer()
+    patcher = VariablesPatcher()
+
+    def transfer(msg):
+        encoded = differ.encode_message(msg)
+        return patcher.decode_message(parse_message(serialize_message(encoded))), encoded
+
+    globals1 = {"a": ValueInfo(1, "1"), "b": ValueInfo(2, "[]")}
+    received, encoded = transfer(ToplevelResponse(globals=globals1))
+    assert received["globals"] == globals1
+    assert encoded["globals"].base_version is None
+
+    # same list object with new content, new variable, removed variable
+    globals2 = {"b": ValueInfo(2, "[1]"), "c": ValueInfo(3, "'c'")}
+    original = ToplevelResponse(globals=globals2)
+    received, encoded = transfer(original)
+    assert received["globals"] == globals2
+    assert encoded["globals"] == VariablesDelta("globals:__main__", 1, 2, globals2, ["a"])
+    # message itself must stay intact, as it may be sent again
+    assert original["globals"] is globals2
+
+    # new object with a reused id and same repr
+    globals3 = {"b": ValueInfo(2, "[1]", 7), "c": ValueInfo(3, "'c'")}
+    received, encoded = transfer(ToplevelResponse(globals=globals3))
+    assert received["globals"] == globals3
+    assert encoded["globals"].changed == {"b": ValueInfo(2, "[1]", 7)}
+
+    locals1 = {"x": ValueInfo(4, "4")}
+    stack = [_create_frame(100, locals1, globals3)]
+    received, encoded = transfer(DebuggerResponse(stack=stack))
+    assert received["stack"] == stack
+    assert encoded["stack"][0].globals.changed == {}
+
+    # locals of finished frames get forgotten on both sides
+    received, encoded = transfer(DebuggerResponse(stack=[_create_frame(200, {}, globals3)]))
+    assert received["stack"][0].locals == {}
+    received, encoded = transfer(DebuggerResponse(stack=[_create_frame(100, locals1, globals3)]))
+    assert received["stack"][0].locals == locals1
+    assert encoded["stack"][0].locals.base_version is None
+
+
+def test_mismatched_delta_causes_resync():
+    differ = VariablesDiffer()
+    patcher = VariablesPatcher()
+
+    def transfer(msg):
+        return patcher.decode_message(parse_message(serialize_message(differ.encode_message(msg))))
+
+    globals1 = {"a": ValueInfo(1, "1"), "b": ValueInfo(2, "2")}
+    transfer(ToplevelResponse(globals=globals1))
+    assert patcher.pop_unknown_namespaces() == []
+
+    # frontend has missed a message
+    differ.encode_message(ToplevelResponse(globals={"a": ValueInfo(1, "1")}))
+    globals3 = {"a": ValueInfo(1, "1"), "c": ValueInfo(3, "3")}
+    assert transfer(ToplevelResponse(globals=globals3))["globals"] == {}
+    assert patcher.pop_unknown_namespaces() == ["globals:__main__"]
+
+    # namespace is requested already
+    assert transfer(ToplevelResponse(globals=globals3))["globals"] == {}
+    assert patcher.pop_unknown_namespaces() == []
+
+    differ.forget(["globals:__main__"])
+    assert transfer(ToplevelResponse(globals=globals3))["globals"] == globals3
+    globals4 = {"c": ValueInfo(3, "3")}
+    assert transfer(ToplevelResponse(globals=globals4))["globals"] == globals4
+    assert patcher.pop_unknown_namespaces() == []
+
+
+def test_frame_sources_are_sent_once():
+    encoder = FrameSourceEncoder()
+    decoder = FrameSourceDecoder()
+
+    def transfer(msg):
+        encoded = encoder.encode_message(msg)
+        return decoder.decode_message(parse_message(serialize_message(encoded))), encoded
+
+    frame = _create_frame(100, None, {})._replace(
+        source="x = 1\n", source_id="prog.py:1", source_hash="1"
+    )
+    received, encoded = transfer(DebuggerResponse(stack=[frame]))
+    assert encoded["stack"][0].source == "x = 1\n"
+
+    original = DebuggerResponse(stack=[frame])
+    received, encoded = transfer(original)
+    assert encoded["stack"][0].source is None
+    assert received["stack"] == [frame]
+    # message itself must stay intact, as it may be sent again
+    assert original["stack"][0].source == "x = 1\n"
+
+    # file has changed
+    new_frame = frame._replace(source="x = 2\n", source_hash="2")
+    received, encoded = transfer(ToplevelResponse(user_exception={"stack": [new_frame]}))
+    assert encoded["user_exception"]["stack"][0].source == "x = 2\n"
+    received, encoded = transfer(ToplevelResponse(user_exception={"stack": [new_frame]}))
+    assert encoded["user_exception"]["stack"][0].source is None
+    assert received["user_exception"]["stack"] == [new_frame]
@@ -0,0 +1,110 @@
+import os.path
+
+from thonny.completion_index import get_index_path, iter_update, load_index
+
+PKG_INIT = '''"""Demo package"""
+from .core import *
+from .helpers import helper as renamed_helper
+from . import extra
+
+__version__ = "1.0"
+'''
+
+PKG_CORE = '''
+__all__ = ["array", "Matrix"]
+
+def array(obj, *, copy=True):
+    """Create an array.
+
+    Longer description.
+    """
+
+class Matrix:
+    def __init__(self, rows, cols):
+        pass
+
+def not_exported():
+    pass
+'''
+
+PKG_HELPERS = '''
+def helper():
+    pass
+'''
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as fp:
+        fp.write(content)
+
+
+def _update(index_path, sys_path):
+    for _ in iter_update(index_path, sys_path):
+        pass
+
+
+def _create_site_packages(tmp_path):
+    site_dir = str(tmp_path / "site-packages")
+    _write(os.path.join(site_dir, "demo", "__init__.py"), PKG_INIT)
+    _write(os.path.join(site_dir, "demo", "core.py"), PKG_CORE)
+    _write(os.path.join(site_dir, "demo", "helpers.py"), PKG_HELPERS)
+    _write(os.path.join(site_dir, "demo", "extra.py"), "")
+    _write(
+        os.path.join(site_dir, "demo-1.0.dist-info", "RECORD"),
+        "demo/__init__.py,sha256=a,10\ndemo/core.py,sha256=b,10\ndemo-1.0.dist-info/RECORD,,\n",
+    )
+    _write(os.path.join(site_dir, "loose.py"), "def top(): pass\n_private = 1\n")
+    return site_dir
+
+
+def test_completions(tmp_path):
+    site_dir = _create_site_packages(tmp_path)
+    index_path = get_index_path(str(tmp_path / "user_dir"), [site_dir])
+    _update(index_path, [site_dir])
+    index = load_index(index_path)
+
+    def get_names(source):
+        lines = source.split("\n")
+        return [c.name for c in index.get_completions(lines, len(lines), len(lines[-1]))]
+
+    assert get_names("import os, de") == ["demo"]
+    assert get_names("from lo") == ["loose"]
+    assert get_names("import demo.") == ["core", "extra", "helpers"]
+    assert get_names("from demo import ") == [
+        "array",
+        "core",
+        "extra",
+        "helpers",
+        "Matrix",
+        "renamed_helper",
+    ]
+    assert get_names("import demo as d\nx = d.ar") == ["array"]
+    assert get_names("import loose\nloose.") == ["top"]
+    assert get_names("x = unknown.") == []
+
+    lines = ["import demo", "demo.arr"]
+    [completion] = index.get_completions(lines, 2, 8)
+    assert completion.full_name == "demo.array"
+    assert completion.name_with_symbols == "array("
+    assert completion.prefix_length == 3
+    assert completion.docstring == "Create an array."
+
+
+def test_unchanged_distributions_are_not_reindexed(tmp_path):
+    site_dir = _create_site_packages(tmp_path)
+    index_path = get_index_path(str(tmp_path / "user_dir"), [site_dir])
+    _update(index_path, [site_dir])
+    mtime = os.stat(index_path).st_mtime_ns
+
+    # change which is not reflected in RECORD
+    _write(os.path.join(site_dir, "demo", "core.py"), "def other(): pass\n")
+    _update(index_path, [site_dir])
+    assert os.stat(index_path).st_mtime_ns == mtime
+
+    # reinstalling changes RECORD
+    _write(os.path.join(site_dir, "demo-1.0.dist-info", "RECORD"), "demo/__init__.py,sha256=c,10\n")
+    _update(index_path, [site_dir])
+    lines = ["from demo import "]
+    names = [c.name for c in load_index(index_path).get_completions(lines, 1, len(lines[0]))]
+    assert "other" in names and "array" not in names
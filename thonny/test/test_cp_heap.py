@@ -0,0 +1,119 @@
+import gc
+
+import pytest
+
+from thonny.plugins.cpython_backend.cp_heap import ObjectHeap, StaleObjectError
+
+
+class Weakrefable:
+    pass
+
+
+def test_lru_eviction():
+    heap = ObjectHeap(max_strong_refs=2)
+    a, b, c = [1], [2], [3]
+    heap.store(a)
+    heap.store(b)
+    # refreshing makes a the most recently used
+    heap.store(a)
+    heap.store(c)
+
+    assert heap.get(id(a)) is a
+    assert heap.get(id(c)) is c
+    # lists can't be weakly referenced, so b is gone
+    with pytest.raises(StaleObjectError):
+        heap.get(id(b))
+    assert id(b) not in heap
+    assert len(heap) == 2
+
+
+def test_weakly_referenced_objects_stay_available():
+    heap = ObjectHeap(max_strong_refs=1)
+    obj = Weakrefable()
+    heap.store(obj)
+    heap.store([1])
+
+    # dropped out of strong tier, but still alive
+    assert heap.get(id(obj)) is obj
+    assert heap.get_stats()["strong_count"] == 1
+
+
+def test_weakref_removal():
+    heap = ObjectHeap(max_strong_refs=1)
+    obj = Weakrefable()
+    obj_id = id(obj)
+    heap.store(obj)
+    heap.store([1])
+
+    del obj
+    gc.collect()
+    assert obj_id not in heap
+    assert heap.get_generation(obj_id) is None
+    assert heap.get_stats()["collection_count"] == 1
+
+
+def test_generations():
+    heap = ObjectHeap()
+    a = Weakrefable()
+    b = Weakrefable()
+    generation_a = heap.store(a)
+    generation_b = heap.store(b)
+    assert generation_b > generation_a
+    # storing the same object again keeps the generation
+    assert heap.store(a) == generation_a
+    assert heap.get_generation(id(a)) == generation_a
+
+    assert heap.get(id(a), generation_a) is a
+    with pytest.raises(StaleObjectError):
+        heap.get(id(a), generation_b)
+
+
+def test_reused_id_gets_new_generation():
+    heap = ObjectHeap(max_strong_refs=1)
+    old = Weakrefable()
+    old_id = id(old)
+    old_generation = heap.store(old)
+    heap.store([1])
+    del old
+    gc.collect()
+
+    # CPython usually reuses the freed memory for an object of the same size
+    candidates = []
+    for _ in range(1000):
+        candidates.append(Weakrefable())
+        if id(candidates[-1]) == old_id:
+            break
+    else:
+        pytest.skip("id was not reused")
+
+    new = candidates[-1]
+    new_generation = heap.store(new)
+    assert new_generation > old_generation
+    assert heap.get(old_id) is new
+    with pytest.raises(StaleObjectError):
+        heap.get(old_id, old_generation)
+
+
+def test_stats():
+    heap = ObjectHeap(max_strong_refs=2)
+    objects = [Weakrefable(), Weakrefable(), [1], [2]]
+    for obj in objects:
+        heap.store(obj)
+
+    assert heap.get_stats() == {
+        "size": 4,
+        "strong_count": 2,
+        "weak_count": 2,
+        "max_strong_refs": 2,
+        "eviction_count": 0,
+        "collection_count": 0,
+    }
+
+    heap.store([3])
+    stats = heap.get_stats()
+    assert stats["eviction_count"] == 1
+    assert stats["size"] == 4
+
+    page = heap.get_page(0, 2)
+    assert len(page) == 2
+    assert [object_id for object_id, _ in page] == sorted(object_id for object_id, _ in page)
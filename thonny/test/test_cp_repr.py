@@ -0,0 +1,125 @@
+import time
+from collections import Counter, OrderedDict, defaultdict, deque, namedtuple
+
+from thonny.plugins.cpython_backend.cp_repr import ELLIPSIS, MAX_DEPTH, REPR_ERROR, ReprEngine
+
+Point = namedtuple("Point", "x y")
+
+
+class ListSubclass(list):
+    pass
+
+
+class SetSubclass(set):
+    pass
+
+
+class Faulty:
+    def __repr__(self):
+        raise RuntimeError("no repr")
+
+
+class Slow:
+    def __init__(self, items):
+        self.items = items
+
+    def __len__(self):
+        return len(self.items)
+
+    def __repr__(self):
+        time.sleep(0.02)
+        return "Slow(%d)" % len(self.items)
+
+
+def test_same_as_shortened_repr():
+    engine = ReprEngine()
+    values = [
+        [1, "two", b"three", (4,), {5: {6}}, frozenset(), 7.0, None],
+        "it's \"quoted\"" * 3,
+        OrderedDict(a=1, b=[2]),
+        defaultdict(list, {1: 2}),
+        Counter("abracadabra"),
+        deque([1, 2], maxlen=5),
+        Point(1, y="y"),
+        ListSubclass([1, 2]),
+        SetSubclass(),
+    ]
+    for value in values:
+        full = repr(value)
+        assert engine.repr(value, len(full)) == full
+        for length in range(len(full)):
+            assert engine.repr(value, length) == full[:length] + ELLIPSIS
+
+
+def test_stops_at_budget():
+    class Counting:
+        count = 0
+
+        def __repr__(self):
+            Counting.count += 1
+            return "c"
+
+    engine = ReprEngine()
+    assert engine.repr([Counting() for _ in range(100000)], 10) == "[c, c, c, " + ELLIPSIS
+    assert Counting.count == 4
+
+
+def test_recursion_markers():
+    engine = ReprEngine()
+    lst = [1]
+    lst.append(lst)
+    assert engine.repr(lst, 100) == "[1, [...]]"
+
+    tup = ([],)
+    tup[0].append(tup)
+    assert engine.repr(tup, 100) == "([(...)],)"
+
+    dct = {}
+    dct["self"] = dct
+    assert engine.repr(dct, 100) == "{'self': {...}}"
+
+    dq = deque()
+    dq.append(dq)
+    assert engine.repr(dq, 100) == "deque([[...]])"
+
+    # repeated but not recursive
+    shared = [1]
+    assert engine.repr([shared, shared], 100) == "[[1], [1]]"
+
+
+def test_depth_limit():
+    engine = ReprEngine()
+    value = []
+    for _ in range(MAX_DEPTH + 50):
+        value = [value]
+
+    assert engine.repr(value, 1000) == "[" * MAX_DEPTH + ELLIPSIS + "]" * MAX_DEPTH
+
+
+def test_cache_hits():
+    engine = ReprEngine()
+    value = "x" * 1000
+    first = engine.repr(value, 100)
+    assert engine.repr(value, 100) is first
+    assert engine.repr(value, 50) is not first
+
+
+def test_repr_error():
+    engine = ReprEngine()
+    assert engine.repr(Faulty(), 100) == REPR_ERROR
+    assert engine.repr([1, Faulty()], 100) == REPR_ERROR
+
+
+def test_slow_repr_is_not_repeated():
+    engine = ReprEngine(time_budget=0.01)
+    slow = Slow([1, 2, 3])
+    assert engine.repr(slow, 100) == "Slow(3)"
+    assert engine.repr(slow, 100) == object.__repr__(slow)
+    assert engine.repr(slow, 100, allow_slow=True) == "Slow(3)"
+
+    # longer values of the same type are not tried
+    longer = Slow([1, 2, 3, 4])
+    assert engine.repr(longer, 100) == object.__repr__(longer)
+
+    # shorter are
+    assert engine.repr(Slow([1]), 100) == "Slow(1)"
@@ -0,0 +1,246 @@
+import sys
+from collections import namedtuple
+from types import SimpleNamespace
+
+import pytest
+
+from thonny.common import DebuggerCommand, DebuggerResponse, ToplevelCommand
+from thonny.plugins.cpython_backend.cp_tracers import (
+    BreakpointCondition,
+    FastTracer,
+    MonitoringFastTracer,
+)
+
+PROGRAM = """def add(a, b):
+    c = a + b
+    return c
+
+def fail():
+    raise ValueError("oops")
+
+x = add(1, 2)
+y = add(x, 3)
+try:
+    fail()
+except ValueError:
+    pass
+z = x + y
+"""
+
+_ExportedFrame = namedtuple("_ExportedFrame", ["id", "code_name", "lineno"])
+
+# Both engines must make the same stops for the same commands
+ENGINES = [
+    FastTracer,
+    pytest.param(
+        MonitoringFastTracer,
+        marks=pytest.mark.skipif(not hasattr(sys, "monitoring"), reason="needs Python 3.12+"),
+    ),
+]
+
+
+class _FakeBackend:
+    """Plays the UI: answers each stop with the next command and records the stops"""
+
+    def __init__(self, commands, breakpoints):
+        self._commands = list(commands)
+        self._breakpoints = breakpoints
+        self._last_stack = None
+        self.stops = []
+
+    def is_doing_io(self):
+        return False
+
+    def send_message(self, msg):
+        if isinstance(msg, DebuggerResponse):
+            exception_info = msg.exception_info
+            self._last_stack = msg.stack
+            self.stops.append(
+                (
+                    msg.stack[-1].code_name,
+                    msg.stack[-1].lineno,
+                    exception_info["type_name"] if exception_info["is_fresh"] else None,
+                )
+            )
+
+    def _export_stack(self, newest_frame, relevance_checker=None):
+        result = []
+        frame = newest_frame
+        while frame is not None:
+            if relevance_checker(frame):
+                result.insert(
+                    0, _ExportedFrame(id(frame), frame.f_code.co_name, frame.f_lineno)
+                )
+            frame = frame.f_back
+        return result
+
+    def _fetch_next_incoming_message(self):
+        if self._commands:
+            name = self._commands.pop(0)
+            breakpoints = self._breakpoints
+        else:
+            # let the program finish
+            name = "resume"
+            breakpoints = {}
+
+        return DebuggerCommand(
+            name,
+            state="line",
+            focus=None,
+            frame_id=self._last_stack[-1].id,
+            exception=None,
+            breakpoints=breakpoints,
+            breakpoint_options={},
+        )
+
+
+def _run(tracer_class, tmp_path, commands, breakpoint_lines=()):
+    path = tmp_path / "prog.py"
+    path.write_text(PROGRAM)
+    filename = str(path)
+    breakpoints = {filename: set(breakpoint_lines)} if breakpoint_lines else {}
+
+    backend = _FakeBackend(commands, breakpoints)
+    tracer = tracer_class(backend, ToplevelCommand("Debug", breakpoints=breakpoints))
+    tracer._main_module_path = filename
+    code = compile(PROGRAM, filename, "exec")
+    tracer._install_tracing()
+    try:
+        exec(code, {"__name__": "__main__"})
+    finally:
+        tracer._uninstall_tracing()
+
+    return backend.stops
+
+
+@pytest.mark.parametrize("tracer_class", ENGINES)
+def test_stepping(tmp_path, tracer_class):
+    commands = ["step_over", "step_into", "step_into", "step_out", "step_over", "resume"]
+    assert _run(tracer_class, tmp_path, commands) == [
+        ("<module>", 1, None),
+        ("<module>", 5, None),
+        ("<module>", 8, None),
+        ("add", 2, None),
+        ("<module>", 9, None),
+        ("<module>", 10, None),
+    ]
+
+
+@pytest.mark.parametrize("tracer_class", ENGINES)
+def test_breakpoints(tmp_path, tracer_class):
+    commands = ["resume", "resume"]
+    assert _run(tracer_class, tmp_path, commands, breakpoint_lines=[2, 14]) == [
+        ("add", 2, None),
+        ("add", 2, None),
+        ("<module>", 14, None),
+    ]
+
+
+@pytest.mark.parametrize("tracer_class", ENGINES)
+def test_exception_when_stepping_over_the_call(tmp_path, tracer_class):
+    commands = ["step_over", "step_into", "step_into", "step_over"]
+    assert _run(tracer_class, tmp_path, commands, breakpoint_lines=[11]) == [
+        ("<module>", 11, None),
+        ("<module>", 11, "ValueError"),
+        ("<module>", 12, None),
+        ("<module>", 13, None),
+        ("<module>", 14, None),
+    ]
+
+
+@pytest.mark.parametrize("tracer_class", ENGINES)
+def test_exception_when_stepping_into_the_call(tmp_path, tracer_class):
+    # gets reported in the raising frame and again in the caller
+    commands = ["step_into", "step_into", "step_into", "step_into"]
+    assert _run(tracer_class, tmp_path, commands, breakpoint_lines=[11]) == [
+        ("<module>", 11, None),
+        ("fail", 6, None),
+        ("fail", 6, "ValueError"),
+        ("<module>", 11, "ValueError"),
+        ("<module>", 12, None),
+    ]
+
+
+def test_step_out_after_breakpoint_in_settrace_engine(tmp_path):
+    # The frame of the caller was skipped during resume, so the return to it is not noticed
+    # and the program runs to the next breakpoint hit
+    commands = ["step_out"]
+    assert _run(FastTracer, tmp_path, commands, breakpoint_lines=[2]) == [
+        ("add", 2, None),
+        ("add", 2, None),
+    ]
+
+
+@pytest.mark.skipif(not hasattr(sys, "monitoring"), reason="needs Python 3.12+")
+def test_step_out_after_breakpoint_in_monitoring_engine(tmp_path):
+    # Frames in the stack are watched, so step_out stops in the caller like after a step
+    commands = ["step_out"]
+    assert _run(MonitoringFastTracer, tmp_path, commands, breakpoint_lines=[2]) == [
+        ("add", 2, None),
+        ("<module>", 9, None),
+    ]
+
+
+def _get_frame(**locals_):
+    return SimpleNamespace(f_globals={}, f_locals=locals_)
+
+
+def test_condition_error_stops_and_gets_reported(capsys):
+    frame = _get_frame(x=0)
+    condition = BreakpointCondition({"condition": "1 / x > 1"}, "prog.py:3")
+    assert condition.should_stop(frame)
+    assert "prog.py:3: ZeroDivisionError" in capsys.readouterr().err
+
+    condition = BreakpointCondition({"condition": "x >"}, "prog.py:4")
+    assert condition.should_stop(frame)
+    assert "prog.py:4: SyntaxError" in capsys.readouterr().err
+
+
+def test_condition_decides_about_stopping():
+    condition = BreakpointCondition({"condition": "x > 1"}, "prog.py:3")
+    assert not condition.should_stop(_get_frame(x=1))
+    assert condition.should_stop(_get_frame(x=2))
+
+
+def test_hit_count_stops_on_nth_hit_and_after_it():
+    frame = _get_frame(x=1)
+    condition = BreakpointCondition({"hit_count": 3}, "prog.py:3")
+    assert [condition.should_stop(frame) for _ in range(5)] == [False, False, True, True, True]
+    assert condition.hit_count == 5
+
+
+def test_hit_count_counts_only_hits_satisfying_the_condition():
+    condition = BreakpointCondition({"condition": "x % 2 == 0", "hit_count": 2}, "prog.py:3")
+    assert [condition.should_stop(_get_frame(x=x)) for x in range(6)] == [
+        False,
+        False,
+        True,
+        False,
+        True,
+        False,
+    ]
+
+
+def test_log_message_gets_printed_instead_of_stopping(capsys):
+    condition = BreakpointCondition({"log_message": "x is {x * 2!r}, {{x}}"}, "prog.py:3")
+    assert not condition.should_stop(_get_frame(x=21))
+    assert capsys.readouterr().out == "x is 42, {x}\n"
+
+
+def test_log_message_with_quotes_and_backslashes(capsys):
+    frame = _get_frame(d={"a": 1, "b": 2})
+    for message, expected_output in [
+        ("{d['a']} \"quoted\"", '1 "quoted"'),
+        ("{d[\"a\"]} 'quoted'", "1 'quoted'"),
+        ("{d['a']} and {d[\"b\"]}", "1 and 2"),
+        ("{d['a']}\n{d[\"b\"]} in C:\\temp\\", "1\n2 in C:\\temp\\"),
+    ]:
+        condition = BreakpointCondition({"log_message": message}, "prog.py:3")
+        assert not condition.should_stop(frame)
+        assert capsys.readouterr() == (expected_output + "\n", "")
+
+
+def test_log_message_error_gets_printed(capsys):
+    condition = BreakpointCondition({"log_message": "{y}"}, "prog.py:3")
+    assert not condition.should_stop(_get_frame(x=1))
+    assert capsys.readouterr().out == "{y} (NameError: name 'y' is not defined)\n"
@@ -0,0 +1,94 @@
+import random
+
+from thonny.document import Document
+
+SOURCE = """import os
+
+def foo(x):
+    return (x + 1) * [2, 3]
+
+class Bar:
+    def baz(self):
+        print({"a": foo(1)})
+"""
+
+
+def _to_offset(source, lineno, col):
+    lines = source.split("\n")
+    if lineno > len(lines):
+        return len(source)
+    col = min(col, len(lines[lineno - 1]))
+    return sum(len(line) + 1 for line in lines[: lineno - 1]) + col
+
+
+def test_insert_and_delete():
+    doc = Document(SOURCE)
+    expected = SOURCE
+    rnd = random.Random(0)
+    for _ in range(300):
+        line_count = doc.get_line_count()
+        lineno, col = rnd.randint(1, line_count + 1), rnd.randint(0, 20)
+        if rnd.random() < 0.5:
+            chars = rnd.choice(["x", "\n", "(", "):\n    ", "'", "  # c\n"])
+            offset = _to_offset(expected, lineno, col)
+            expected = expected[:offset] + chars + expected[offset:]
+            doc.insert(lineno, col, chars)
+        else:
+            lineno2, col2 = lineno + rnd.randint(0, 2), rnd.randint(0, 20)
+            offset1 = _to_offset(expected, lineno, col)
+            offset2 = _to_offset(expected, lineno2, col2)
+            if offset2 > offset1:
+                expected = expected[:offset1] + expected[offset2:]
+            doc.delete(lineno, col, lineno2, col2)
+
+        assert doc.get_source() == expected
+        assert doc.get_lines() == expected.split("\n")
+
+    doc.close()
+
+
+def test_tree_follows_edits():
+    doc = Document(SOURCE)
+    assert doc.get_tree().get_code() == SOURCE
+
+    version = doc.get_version()
+    doc.insert(4, 4, "y = 1\n    ")
+    doc.delete(1, 0, 2, 0)
+    assert doc.get_version() > version
+    assert doc.get_tree().get_code() == doc.get_source()
+    assert doc.get_tree().children[0].type == "funcdef"
+    doc.close()
+
+
+def test_iter_leaves():
+    doc = Document(SOURCE)
+    parens = [
+        (leaf.value, leaf.start_pos)
+        for leaf in doc.iter_leaves((4, 0), (5, 0))
+        if leaf.value in {"(", ")", "[", "]"}
+    ]
+    assert parens == [("(", (4, 11)), (")", (4, 17)), ("[", (4, 21)), ("]", (4, 26))]
+    assert list(doc.iter_leaves((100, 0), (101, 0))) == []
+    doc.close()
+
+
+def test_changes_bring_copy_up_to_date():
+    doc = Document(SOURCE)
+    copy = Document(doc.get_source(), doc.get_version())
+    base_version = doc.get_version()
+
+    doc.insert(3, 0, "@decorator\n")
+    doc.delete(1, 0, 2, 0)
+    changes = doc.get_changes_since(base_version)
+    assert len(changes) == 2
+
+    assert copy.apply_changes(changes)
+    # already applied changes are skipped
+    assert copy.apply_changes(changes)
+    assert copy.get_source() == doc.get_source()
+    assert copy.get_version() == doc.get_version()
+
+    assert doc.get_changes_since(doc.get_version()) == []
+    doc.set_source("x = 1")
+    assert doc.get_changes_since(base_version) is None
+    assert not copy.apply_changes([(copy.get_version() + 2, 1, 0, 1, 0, "y")])
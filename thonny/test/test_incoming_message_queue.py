@@ -0,0 +1,123 @@
+import threading
+
+from thonny.common import BackendEvent, ToplevelResponse
+from thonny.running import (
+    DEFAULT_OUTPUT_SKIP_THRESHOLD_MB,
+    MAX_PENDING_OUTPUT_BYTES,
+    IncomingMessageQueue,
+    create_incoming_message_queue,
+)
+
+
+def _output(data, stream_name="stdout"):
+    return BackendEvent("ProgramOutput", stream_name=stream_name, data=data)
+
+
+def _start_appending(queue, msg):
+    thread = threading.Thread(target=queue.append, args=[msg], daemon=True)
+    thread.start()
+    return thread
+
+
+def test_append_blocks_at_byte_cap_until_popleft():
+    queue = IncomingMessageQueue(10)
+    queue.append(_output("12345678"))
+
+    thread = _start_appending(queue, _output("abcd"))
+    thread.join(0.2)
+    assert thread.is_alive()
+    assert len(queue) == 1
+
+    assert queue.popleft()["data"] == "12345678"
+    thread.join(5)
+    assert not thread.is_alive()
+    assert queue.popleft()["data"] == "abcd"
+
+
+def test_default_configuration_blocks_appender():
+    queue = create_incoming_message_queue(DEFAULT_OUTPUT_SKIP_THRESHOLD_MB)
+    queue.append(_output("x" * MAX_PENDING_OUTPUT_BYTES))
+
+    thread = _start_appending(queue, _output("y"))
+    thread.join(0.2)
+    assert thread.is_alive()
+
+    assert queue.popleft()["data"] == "x" * MAX_PENDING_OUTPUT_BYTES
+    thread.join(5)
+    assert not thread.is_alive()
+    assert queue.popleft()["data"] == "y"
+
+
+def test_size_is_counted_in_bytes():
+    queue = IncomingMessageQueue(10)
+    queue.append(_output("õõõõ"))  # 8 bytes
+
+    thread = _start_appending(queue, _output("abc"))
+    thread.join(0.2)
+    assert thread.is_alive()
+    queue.close()
+    thread.join(5)
+
+
+def test_close_releases_blocked_append():
+    queue = IncomingMessageQueue(10)
+    queue.append(_output("12345678"))
+
+    thread = _start_appending(queue, _output("abcd"))
+    thread.join(0.2)
+    assert thread.is_alive()
+
+    queue.close()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert len(queue) == 1
+
+    # appending to a closed queue doesn't block
+    queue.append(_output("x" * 100))
+    assert len(queue) == 1
+
+
+def test_non_output_messages_dont_block():
+    queue = IncomingMessageQueue(10)
+    queue.append(_output("1234567890"))
+    queue.append(ToplevelResponse())
+    assert len(queue) == 2
+
+
+def test_firehose_inserts_single_skip_marker():
+    queue = IncomingMessageQueue(10, skip_threshold=100)
+    for i in range(50):
+        queue.append(_output("%09d\n" % i))
+        if i % 10 == 0:
+            queue.append(ToplevelResponse(number=i))
+
+    messages = []
+    while len(queue):
+        messages.append(queue.popleft())
+
+    markers = [
+        msg
+        for msg in messages
+        if msg.event_type == "ProgramOutput" and "bytes skipped" in msg["data"]
+    ]
+    assert len(markers) == 1
+    assert markers[0]["stream_name"] == "stderr"
+
+    outputs = [
+        msg["data"]
+        for msg in messages
+        if msg.event_type == "ProgramOutput" and msg is not markers[0]
+    ]
+    # the latest output is kept
+    assert outputs[-1] == "%09d\n" % 49
+    skipped_count = 50 - len(outputs)
+    assert "%d bytes skipped" % (skipped_count * 10) in markers[0]["data"]
+
+    # all non-output messages are kept in their order
+    assert [msg["number"] for msg in messages if isinstance(msg, ToplevelResponse)] == [
+        0,
+        10,
+        20,
+        30,
+        40,
+    ]
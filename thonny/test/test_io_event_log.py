@@ -0,0 +1,177 @@
+import pytest
+
+from thonny.shell import IoEventLog
+
+
+class _FakeOutput:
+    """Text and cursor offset of the Shell's IO area, logged like BaseShellText._apply_io_event"""
+
+    def __init__(self):
+        self.text = ""
+        self.cursor_offset = 0
+        self.log = IoEventLog()
+
+    def apply(self, data):
+        state = ("attributes", self.cursor_offset)
+        start_length = len(self.text)
+        overwrite_start = None
+        line_length = len(self.text) - self.text.rfind("\n") - 1
+
+        if data == "\r":
+            self.cursor_offset = -line_length
+        elif data == "\b":
+            self.cursor_offset = max(self.cursor_offset - 1, -line_length)
+        elif data.startswith("\x1b[") and data.endswith("D"):
+            self.cursor_offset = max(self.cursor_offset - int(data[2:-1]), -line_length)
+        elif self.cursor_offset < 0:
+            overwrite_len = min(len(data), -self.cursor_offset)
+            if 0 <= data.find("\n") < overwrite_len:
+                overwrite_len = data.find("\n")
+            overwrite_start = len(self.text) + self.cursor_offset
+            self.text = (
+                self.text[:overwrite_start]
+                + data[:overwrite_len]
+                + self.text[overwrite_start + overwrite_len :]
+            )
+            rest = data[overwrite_len:]
+            if "\n" in rest:
+                self.cursor_offset = 0
+            else:
+                self.cursor_offset += overwrite_len
+            self.text += rest
+        else:
+            self.text += data
+
+        self.log.append((data, "stdout"), len(self.text) - start_length, state, overwrite_start)
+
+    def rewind(self, target_num_visible_chars):
+        """Does what BaseShellText._undo_io_events does, returns the removed events"""
+        index = self.log.find_rewind_point(target_num_visible_chars)
+        removed_text_length = self.log.text_length - self.log.get_text_start(index)
+        self.text = self.text[: len(self.text) - removed_text_length]
+        self.cursor_offset = self.log.get_state(index)[1]
+        return [data for data, _ in self.log.truncate(index)]
+
+    def apply_prefix(self, events, num_visible_chars):
+        """Applies the events until the target number of visible chars is reached"""
+        for data in events:
+            remaining = num_visible_chars - self.log.visible_char_count
+            if remaining <= 0:
+                break
+            self.apply(data[:remaining])
+
+
+def _create_output(events):
+    output = _FakeOutput()
+    for data in events:
+        output.apply(data)
+    return output
+
+
+def test_rewinding_plain_output():
+    output = _create_output(["abc", "def\n", "ghi"])
+
+    assert output.log.find_rewind_point(5) == 1
+    assert output.rewind(5) == ["def\n", "ghi"]
+    assert output.text == "abc"
+    assert len(output.log) == 1
+    assert output.log.visible_char_count == output.log.text_length == 3
+
+
+def test_rewinding_into_overwritten_region():
+    # "12345" becomes "xy345"
+    output = _create_output(["abc\n", "12345", "\r", "xy"])
+    assert output.text == "abc\nxy345"
+
+    # the whole "12345" needs to be removed, not only the part after the target
+    index = output.log.find_rewind_point(6)
+    assert index == 1
+    assert output.log.text_length - output.log.get_text_start(index) == 5
+
+
+def test_rewinding_across_overwritten_region():
+    # "abcdef" becomes "XYZdef", overwrites reach back over the start of "def"
+    output = _create_output(["abc", "def", "\r", "XY", "Z"])
+    assert output.text == "XYZdef"
+
+    index = output.log.find_rewind_point(4)
+    assert index == 0
+    assert output.log.text_length - output.log.get_text_start(index) == 6
+
+
+def test_rewinding_after_backspace_and_cursor_movement():
+    # "ab" + "cd" becomes "abcX", then "XY" becomes "aYcX" ...
+    output = _create_output(["ab", "cd", "\b", "X", "\x1b[3D", "Y"])
+    assert output.text == "aYcX"
+
+    # ... so rewinding into "cd" must remove also "ab"
+    index = output.log.find_rewind_point(3)
+    assert index == 0
+    assert output.log.text_length - output.log.get_text_start(index) == 4
+
+    # overwriting "d" with "X" doesn't reach back further than "cd"
+    output.log.truncate(4)
+    assert output.log.find_rewind_point(3) == 1
+
+
+def test_cursor_movement_is_capped_at_line_start():
+    output = _create_output(["ab\n", "cd", "\x1b[10D", "X"])
+    assert output.text == "ab\nXd"
+    assert output.log.find_rewind_point(4) == 1
+
+
+@pytest.mark.parametrize(
+    "events",
+    [
+        ["abc\n", "12345", "\r", "xy", "z\n", "end"],
+        ["abc", "def", "\r", "XY", "Z", "\b", "\b", "!", "\n"],
+        ["ab", "cd", "\b", "X", "\x1b[3D", "Y", "\r", "1234567"],
+        ["0\n", "progress 10%", "\r", "progress 50%", "\r", "progress 100%\n", "done"],
+    ],
+)
+def test_rewind_and_reapply_gives_same_text_as_partial_output(events):
+    total = sum(map(len, events))
+    for target in range(total + 1):
+        expected = _FakeOutput()
+        expected.apply_prefix(events, target)
+
+        output = _create_output(events)
+        removed = output.rewind(target)
+        assert output.log.visible_char_count <= target
+        output.apply_prefix(removed, target)
+
+        assert output.text == expected.text, target
+        assert output.cursor_offset == expected.cursor_offset, target
+
+
+def test_truncate_forgets_overwrites_of_removed_events():
+    output = _create_output(["abc", "def", "\r", "XY"])
+    assert output.log.find_rewind_point(4) == 0
+
+    assert output.log.truncate(3) == [("XY", "stdout")]
+    assert len(output.log) == 3
+    assert output.log.visible_char_count == 7
+    assert output.log.text_length == 6
+    # appending after truncation continues from the truncation point
+    output.log.append(("gh", "stdout"), 2, ("attributes", 0))
+    assert output.log.find_rewind_point(4) == 1
+    assert output.log.get_text_start(3) == 6
+
+    assert output.log.truncate(10) == []
+    assert len(output.log) == 4
+
+
+def _create_state(color):
+    # a new tuple on each call
+    return (color, 0)
+
+
+def test_equal_states_are_stored_once():
+    log = IoEventLog()
+    log.append(("a", "stdout"), 1, _create_state("red"))
+    log.append(("b", "stdout"), 1, _create_state("red"))
+    log.append(("\x1b[0m", "stdout"), 0, _create_state("red"))
+    log.append(("c", "stdout"), 1, _create_state(None))
+
+    assert log.get_state(0) is log.get_state(1) is log.get_state(2)
+    assert log.get_state(3) == (None, 0)
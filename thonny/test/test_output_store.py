@@ -0,0 +1,98 @@
+from thonny.output_store import READ_CHUNK_SIZE, OutputStore
+
+TEXT = "first line\nsecond – line ünicode\n\nfourth line with € sign\nincomplete"
+
+
+def _create_stores():
+    # one stays in memory, the other moves to a file right away
+    return [OutputStore(), OutputStore(memory_limit=10)]
+
+
+def test_append_and_line_count():
+    for store in _create_stores():
+        assert len(store) == 0
+        assert store.get_line_count() == 0
+
+        store.append("")
+        assert store.get_line_count() == 0
+
+        store.append(TEXT)
+        assert len(store) == len(TEXT.encode("utf-8"))
+        assert store.get_line_count() == 5
+        assert store.get_text() == TEXT
+
+        store.append("\n")
+        assert store.get_line_count() == 5
+        store.append("one more")
+        assert store.get_line_count() == 6
+
+        store.clear()
+        assert store.get_line_count() == 0
+        assert store.get_text() == ""
+
+
+def test_find_line():
+    for store in _create_stores():
+        store.append(TEXT)
+        assert store.find_line("line") == 0
+        assert store.find_line("line", 1) == 1
+        assert store.find_line("line", 2) == 3
+        assert store.find_line("€") == 3
+        assert store.find_line("incomplete") == 4
+        assert store.find_line("missing") is None
+        assert store.find_line("first", 1) is None
+        assert store.find_line("line", 10) is None
+
+
+def test_pop_lines_round_trip():
+    for store in _create_stores():
+        store.append(TEXT)
+        assert store.pop_lines(1) == "incomplete"
+        assert store.pop_lines(2) == "\nfourth line with € sign\n"
+        assert store.get_line_count() == 2
+        assert store.get_text() == "first line\nsecond – line ünicode\n"
+
+        store.append("\nfourth line with € sign\nincomplete")
+        assert store.get_text() == TEXT
+
+        assert store.pop_lines(100) == TEXT
+        assert len(store) == 0
+        assert store.pop_lines(1) == ""
+
+
+def test_split_off():
+    for store in _create_stores():
+        store.append(TEXT)
+        following = store.split_off(3)
+        assert store.get_text() == "first line\nsecond – line ünicode\n\n"
+        assert store.get_line_count() == 3
+        assert following.get_text() == "fourth line with € sign\nincomplete"
+        assert following.get_line_count() == 2
+
+        assert not store.split_off(3)
+        assert store.split_off(0).get_text() == "first line\nsecond – line ünicode\n\n"
+        assert len(store) == 0
+
+
+def test_bigger_than_chunk():
+    lines = ["line %d ĉ€ %s\n" % (i, "-" * 20) for i in range(50000)]
+    store = OutputStore(memory_limit=100000)
+    for line in lines:
+        store.append(line)
+
+    text = "".join(lines)
+    assert len(store) > READ_CHUNK_SIZE
+    assert store.get_line_count() == len(lines)
+    assert store.get_text() == text
+    # chunks don't break multi-byte chars
+    assert "".join(store.iter_chunks(chunk_size=1001)) == text
+    assert store.find_line("line 49999 ") == 49999
+    assert store.find_line("line 4", 40000) == 40000
+    assert store.find_line("line 3", 40000) is None
+
+    following = store.split_off(40000)
+    assert following.get_text() == "".join(lines[40000:])
+    assert store.pop_lines(39000) == "".join(lines[1000:40000])
+    # getting small enough brings the data back to memory
+    assert store._file is None
+    assert store.get_text() == "".join(lines[:1000])
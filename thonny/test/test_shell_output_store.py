@@ -0,0 +1,146 @@
+from collections import deque
+
+import thonny.shell
+from thonny.output_store import OutputStore
+from thonny.shell import BaseShellText, IoEventLog
+
+MAX_LINES = 10
+MARGIN_LINES = 3
+
+
+class _FakeWorkbench:
+    def get_option(self, name):
+        return {"shell.max_lines": MAX_LINES, "shell.output_margin_lines": MARGIN_LINES}[name]
+
+
+class _FakeShellText:
+    """Has the state used by the tested methods, text is kept in a string"""
+
+    _store_overflowing_io = BaseShellText._store_overflowing_io
+    _restore_stored_lines = BaseShellText._restore_stored_lines
+    _is_plain_io = BaseShellText._is_plain_io
+
+    def __init__(self):
+        self.tty_mode = True
+        self.active_extra_tags = []
+        self._io_cursor_offset = 0
+        self._queued_io_events = deque()
+        self._applied_io_events = IoEventLog()
+        self._output_store = OutputStore()
+        self._stored_lines_requested = False
+        self.content = ""
+        self.applied_events = []
+        self.scroll_fraction = 0.0
+
+    def _get_io_state(self):
+        return None
+
+    def _apply_io_event(self, data, stream_name):
+        self.applied_events.append((data, stream_name))
+
+    def _store_content(self, cut_idx):
+        assert cut_idx == "output_insert"
+        self._output_store.append(self.content)
+
+    def _clear_content(self, cut_idx):
+        self.content = ""
+
+    def yview(self, *args):
+        if not args:
+            return (self.scroll_fraction, 1.0)
+
+    def index(self, index):
+        return "1.0"
+
+    def direct_insert(self, index, text, tags):
+        assert index == "1.0"
+        self.content = text + self.content
+
+
+def _lines(start, end):
+    return "".join("line %d\n" % i for i in range(start, end))
+
+
+def test_store_overflowing_io(monkeypatch):
+    monkeypatch.setattr(thonny.shell, "get_workbench", _FakeWorkbench)
+    text = _FakeShellText()
+    text.content = "previous\n"
+    text._queued_io_events.extend(
+        [
+            (_lines(0, 5), "stdout"),
+            ("\x1b[31m", "stdout"),
+            (_lines(5, 20), "stdout"),
+            (_lines(20, 25), "stderr"),
+        ]
+    )
+
+    text._store_overflowing_io()
+
+    assert text._output_store.get_text() == "previous\n" + _lines(0, 15)
+    assert text.content == ""
+    # color code was applied, so that the rest of the output gets the right color
+    assert text.applied_events == [("\x1b[31m", "stdout")]
+    # only max_lines remain to be inserted
+    assert list(text._queued_io_events) == [
+        (_lines(15, 20), "stdout"),
+        (_lines(20, 25), "stderr"),
+    ]
+    # stored events are logged without text in the widget
+    assert text._applied_io_events.visible_char_count == len(_lines(0, 15))
+    assert text._applied_io_events.text_length == 0
+
+
+def test_store_overflowing_io_keeps_small_output(monkeypatch):
+    monkeypatch.setattr(thonny.shell, "get_workbench", _FakeWorkbench)
+    text = _FakeShellText()
+    text.content = "previous\n"
+    text._queued_io_events.extend([(_lines(0, 5), "stdout"), (_lines(5, 10), "stdout")])
+
+    text._store_overflowing_io()
+
+    assert len(text._output_store) == 0
+    assert text.content == "previous\n"
+    assert len(text._queued_io_events) == 2
+
+
+def test_store_overflowing_io_stops_at_non_plain_io(monkeypatch):
+    monkeypatch.setattr(thonny.shell, "get_workbench", _FakeWorkbench)
+    text = _FakeShellText()
+    text._queued_io_events.extend(
+        [
+            (_lines(0, 5), "stdout"),
+            ("\x1b[2J", "stdout"),
+            (_lines(5, 30), "stdout"),
+        ]
+    )
+
+    text._store_overflowing_io()
+
+    assert text._output_store.get_text() == _lines(0, 5)
+    assert text._queued_io_events[0] == ("\x1b[2J", "stdout")
+
+
+def test_restore_stored_lines(monkeypatch):
+    monkeypatch.setattr(thonny.shell, "get_workbench", _FakeWorkbench)
+    text = _FakeShellText()
+    text._output_store.append("ünicode\n" + _lines(0, 10))
+    text.content = _lines(10, 12)
+
+    text._restore_stored_lines()
+    assert text.content == _lines(7, 12)
+    assert text._output_store.get_line_count() == 8
+
+    text._restore_stored_lines(count=100)
+    assert text.content == "ünicode\n" + _lines(0, 12)
+    assert len(text._output_store) == 0
+
+
+def test_restore_stored_lines_after_scrolling_away(monkeypatch):
+    monkeypatch.setattr(thonny.shell, "get_workbench", _FakeWorkbench)
+    text = _FakeShellText()
+    text._output_store.append(_lines(0, 10))
+    text.scroll_fraction = 0.5
+
+    text._restore_stored_lines()
+    assert text.content == ""
+    assert text._output_store.get_line_count() == 10
@@ -8,7 +8,7 @@ from logging import getLogger
 from tkinter import TclError
 from tkinter import font as tkfont
 from tkinter import ttk
-from typing import Optional
+from typing import Dict, Optional
 
 logger = getLogger(__name__)
 
@@ -958,6 +958,10 @@ class EnhancedTextFrame(TextFrame):
         # need tags for justifying and rmargin
         self._gutter.tag_configure("content", justify="right", rmargin=3)
 
+        # kind of shading (eg. "coverage") -> line number -> background color
+        self._gutter_shadings = {}  # type: Dict[str, Dict[int, str]]
+        self._gutter_shading_tags = set()
+
         # gutter will be gridded later
         assert first_line_number is not None
         self._first_line_number = first_line_number
@@ -1014,7 +1018,43 @@ class EnhancedTextFrame(TextFrame):
             pass
 
     def _text_changed(self, event):
-        self.update_gutter()
+        if not self._clear_gutter_shadings():
+            self.update_gutter()
+
+    def set_gutter_shading(self, kind: str, colors_by_line: Dict[int, str]) -> None:
+        """Sets the background colors of line numbers.
+
+        Shadings of different kinds are kept separately. All shadings get cleared when the text
+        changes, because their line numbers may not be valid anymore.
+        """
+        if self._gutter_shadings.get(kind, {}) == colors_by_line:
+            return
+
+        if colors_by_line:
+            self._gutter_shadings[kind] = colors_by_line
+        else:
+            del self._gutter_shadings[kind]
+        self.update_gutter(clean=True)
+
+    def _clear_gutter_shadings(self) -> bool:
+        if not self._gutter_shadings:
+            return False
+
+        self._gutter_shadings = {}
+        self.update_gutter(clean=True)
+        return True
+
+    def _get_gutter_shading_tags(self, lineno):
+        tags = ()
+        for colors_by_line in self._gutter_shadings.values():
+            color = colors_by_line.get(lineno)
+            if color is not None:
+                tag = "shading_" + color
+                if tag not in self._gutter_shading_tags:
+                    self._gutter.tag_configure(tag, background=color, foreground="black")
+                    self._gutter_shading_tags.add(tag)
+                tags += (tag,)
+        return tags
 
     def _cursor_moved(self, event):
         self._update_gutter_active_line()
@@ -1078,7 +1118,7 @@ class EnhancedTextFrame(TextFrame):
         self._gutter.tag_add("active", insert + " linestart", insert + " lineend")
 
     def compute_gutter_line(self, lineno, plain=False):
-        yield str(lineno), ()
+        yield str(lineno), self._get_gutter_shading_tags(lineno)
 
     def update_margin_line(self):
         if self._recommended_line_length == 0: